@@ -0,0 +1,81 @@
+"""Shared setup for the benchmark scripts
+
+The scripts are run from the repository root, e.g.::
+
+    python benchmarks/bench_logging.py
+
+They use the project settings (``namevote.settings``) with a throw-away test
+database, so they never touch ``db.sqlite3``.
+"""
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'namevote.settings')
+
+
+def setup(debug=False, **overrides):
+    """Configure Django (applying `overrides` to settings) and create the test databases"""
+    import django
+    from django.conf import settings
+    from django.test.utils import setup_databases, setup_test_environment
+
+    for key, value in overrides.items():
+        setattr(settings, key, value)
+
+    django.setup()
+    setup_test_environment(debug=debug)
+    return setup_databases(verbosity=0, interactive=False)
+
+
+def teardown(old_config):
+    from django.test.utils import teardown_databases, teardown_test_environment
+
+    teardown_databases(old_config, verbosity=0)
+    teardown_test_environment()
+
+
+def create_question(choices=10, **kwargs):
+    """Create a question that is open for voting with `choices` approved choices"""
+    from django.utils import timezone
+    from open_choice_polls.models import Choice, Question
+
+    now = timezone.now()
+    defaults = {
+        'text': 'Benchmark Question',
+        'collection_start_date': now - timedelta(days=2),
+        'collection_end_date': now - timedelta(days=1),
+        'voting_start_date': now - timedelta(hours=1),
+        'voting_end_date': now + timedelta(days=1),
+    }
+    defaults.update(kwargs)
+    question = Question.objects.create(**defaults)
+    for i in range(choices):
+        question.choice_set.create(choice_text='Choice {}'.format(i), review_status=Choice.APPROVED)
+    return question
+
+
+def timed(func, repeat):
+    """Call `func` `repeat` times and return the per-call durations in seconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(name, samples):
+    samples = sorted(samples)
+
+    def pct(p):
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+    print('{:<32} n={:<6} mean={:7.3f}ms  p50={:7.3f}ms  p95={:7.3f}ms  p99={:7.3f}ms'.format(
+        name, len(samples), statistics.mean(samples) * 1000, pct(0.50), pct(0.95), pct(0.99)))
@@ -0,0 +1,60 @@
+"""Choice queries of the results and suggestion pages with 100k choices
+
+Times the queries behind ``Question.compute_results()`` (approved choices by
+votes), the choice lists of the question page (by status, ordered by
+``Lower('choice_text')``) and the duplicate check of ``ChoiceForm`` - with the
+indexes from migration 0009 and again after dropping them.
+"""
+import random
+
+import _common
+
+QUESTIONS = 10
+CHOICES_PER_QUESTION = 10000
+REPEAT = 50
+
+INDEXES = ('choice_status_votes_idx', 'choice_text_idx', 'choice_status_lower_text_idx')
+
+
+def main():
+    old_config = _common.setup()
+
+    from django.db import connection
+    from django.db.models.functions import Lower
+    from open_choice_polls.models import Choice
+
+    rnd = random.Random(0)
+    statuses = (Choice.APPROVED, Choice.OPEN, Choice.REJECTED)
+    questions = [_common.create_question(choices=0, text='Benchmark Question {}'.format(i))
+                 for i in range(QUESTIONS)]
+    for question in questions:
+        Choice.objects.bulk_create([
+            Choice(question=question, choice_text='Choice {}'.format(rnd.random()),
+                   review_status=rnd.choice(statuses), votes=rnd.randint(0, 1000))
+            for _ in range(CHOICES_PER_QUESTION)], batch_size=100)
+    question = questions[QUESTIONS // 2]
+
+    queries = (
+        ('results', lambda: list(Choice.approved.filter(question=question.id).order_by('-votes').
+                                 values_list('id', 'choice_text', 'votes'))),
+        ('approved by text', lambda: list(Choice.approved.filter(question=question.id).
+                                          order_by(Lower('choice_text')))),
+        ('duplicate check', lambda: Choice.objects.filter(question=question.id, choice_text='Choice 0.5').
+            order_by().exists()),
+    )
+
+    for name, func in queries:
+        _common.report('{} (indexed)'.format(name), _common.timed(func, REPEAT))
+
+    with connection.cursor() as cursor:
+        for index in INDEXES:
+            cursor.execute('DROP INDEX {}'.format(index))
+
+    for name, func in queries:
+        _common.report('{} (no indexes)'.format(name), _common.timed(func, REPEAT))
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Throughput and peak memory of the bulk choice import
+
+Streams a generated JSON Lines file (every tenth line a duplicate) through
+``import_choices()`` and reports choices per second and the peak of the
+memory allocated by Python (``tracemalloc``), which should not grow with the
+number of lines.
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import _common
+
+
+def main():
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    old_config = _common.setup()
+
+    from open_choice_polls.choice_import import import_choices, read_choice_texts
+
+    question = _common.create_question(choices=0)
+
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as f:
+        for i in range(lines):
+            f.write('"Candidate {}"\n'.format(i - 1 if i % 10 == 9 else i))
+        f.seek(0)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = import_choices(question, read_choice_texts(f, 'jsonl'))
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print('{} lines: {} in {:.1f}s ({:.0f} lines/s), peak memory {:.1f} MiB'.format(
+        lines, result, elapsed, lines / elapsed, peak / 2 ** 20))
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Request latency of the results page with DEBUG logging on
+
+Compares writing log records synchronously from the request thread (a plain
+``RotatingFileHandler``, the former setup) with the queue based handler from
+``namevote.log``. ``DEBUG = True`` makes Django log every SQL query at DEBUG
+level, so each request produces several log records.
+
+Besides the request latency the script reports the time a single
+``logger.debug()`` call blocks the calling thread, which is what the queue
+removes from the request path. The difference grows with slower disks
+(network file systems, fsync-heavy setups); the tight ``logger.debug()`` loop
+also overruns the queue on purpose, so the number of dropped records is shown.
+"""
+import logging
+import logging.config
+import os
+import tempfile
+
+import _common
+
+LEVEL = 'DEBUG'
+REQUESTS = 1000
+RECORDS = 20000
+
+
+def logging_config(mode, directory):
+    target = {
+        'class': 'logging.handlers.RotatingFileHandler',
+        'filename': os.path.join(directory, '{}.log'.format(mode)),
+        'maxBytes': 1024 * 1024,  # small files - rotation happens during the run
+        'backupCount': 2,
+    }
+    if mode == 'queue':
+        handler = {'class': 'namevote.log.QueueHandler', 'target': target}
+    else:
+        handler = dict(target)
+    handler.update({'level': LEVEL, 'formatter': 'standard'})
+
+    return {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'formatters': {
+            'standard': {'format': '%(asctime)s [%(levelname)s] %(name)s:%(lineno)d: %(message)s'},
+        },
+        'handlers': {'default': handler},
+        'root': {'handlers': ['default'], 'level': LEVEL},
+    }
+
+
+def main():
+    old_config = _common.setup(debug=True)
+
+    from django.test import Client
+    from django.urls import reverse
+
+    question = _common.create_question(choices=20)
+    url = reverse('open_choice_polls:results', kwargs={'slug': question.slug, 'id': question.id})
+    client = Client()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ('sync', 'queue'):
+            logging.config.dictConfig(logging_config(mode, directory))
+            _common.timed(lambda: client.get(url), 100)  # warm up
+            samples = _common.timed(lambda: client.get(url), REQUESTS)
+            _common.report('results view ({})'.format(mode), samples)
+
+            logger = logging.getLogger('benchmark')
+            samples = _common.timed(lambda: logger.debug('record %s from %s', 42, mode), RECORDS)
+            _common.report('logger.debug() ({})'.format(mode), samples)
+
+            handler = logging.getLogger().handlers[0]
+            handler.flush()
+            if mode == 'queue':
+                print('{:<32} dropped={}'.format('', handler.dropped))
+            handler.close()
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Bulk moderation of 100k open choices
+
+Creates a question with 1k approved and 100k open choices and times a dry
+run and a real run of the moderation engine with a rule of every kind.
+"""
+import random
+import time
+
+import _common
+
+APPROVED = 1000
+OPEN = 100000
+
+
+def main():
+    old_config = _common.setup()
+
+    from open_choice_polls.models import Choice, ModerationRule
+    from open_choice_polls.moderation import ModerationEngine
+
+    rnd = random.Random(0)
+    question = _common.create_question(choices=0, choice_validation_regex=r'^[A-Za-z]')
+    Choice.objects.bulk_create([Choice(question=question, choice_text='Name {}'.format(i),
+                                       review_status=Choice.APPROVED) for i in range(APPROVED)])
+    Choice.objects.bulk_create([Choice(question=question, choice_text='{} {}'.format(
+        rnd.choice(('Name', 'name', 'spam', '1st', 'X')), rnd.randint(0, APPROVED * 10))) for _ in range(OPEN)])
+
+    ModerationRule.objects.create(position=1, kind=ModerationRule.MIN_LENGTH, value='4')
+    ModerationRule.objects.create(position=2, kind=ModerationRule.MAX_LENGTH, value='100')
+    ModerationRule.objects.create(position=3, kind=ModerationRule.BANNED_WORDS, value='spam\nscam')
+    ModerationRule.objects.create(position=4, kind=ModerationRule.DUPLICATE_OF_APPROVED)
+    ModerationRule.objects.create(position=5, kind=ModerationRule.REGEX, value='^Name', action=Choice.APPROVED)
+    engine = ModerationEngine.for_question(question)
+
+    for dry_run in (True, False):
+        start = time.perf_counter()
+        counts = engine.run(question.choice_set.all(), dry_run=dry_run)
+        elapsed = time.perf_counter() - start
+        print('{:<10} {:.2f}s  {}'.format('dry run' if dry_run else 'run', elapsed,
+                                          ', '.join(str(count) for _, count in counts)))
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
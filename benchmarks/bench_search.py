@@ -0,0 +1,59 @@
+"""Typeahead search over 1M suggestions
+
+Inserts 10 questions with 100k choices each (texts like the synthetic data
+set: adjective, noun and maybe a number) and times the query of the
+typeahead view - with the FTS5 index and with the ``icontains`` fallback.
+"""
+import random
+import uuid
+from unittest import mock
+
+import _common
+
+QUESTIONS = 10
+CHOICES_PER_QUESTION = 100000
+REPEAT = 50
+
+SEARCHES = ('bl', 'blu', 'silver', 'blue fa', 'silver phoenix 1')
+
+
+def main():
+    old_config = _common.setup()
+
+    from django.db import transaction
+    from django.utils import timezone
+    from open_choice_polls import bulk, search, synthetic
+    from open_choice_polls.models import Choice
+
+    rnd = random.Random(0)
+    statuses = (Choice.APPROVED, Choice.OPEN, Choice.REJECTED)
+    questions = [_common.create_question(choices=0, text='Benchmark Question {}'.format(i))
+                 for i in range(QUESTIONS)]
+    now = bulk.db_value(Choice, 'created', timezone.now())
+    with transaction.atomic():
+        for question in questions:
+            question_id = bulk.db_value(Choice, 'question', question.pk)
+            bulk.insert_rows(Choice, ('id', 'question', 'created', 'modified', 'choice_text', 'choice_slug',
+                                      'votes', 'review_status', 'review_remark'), (
+                (uuid.uuid4().hex, question_id, now, now, '{} {} {}'.format(
+                    rnd.choice(synthetic.ADJECTIVES), rnd.choice(synthetic.NOUNS), rnd.randint(1, 99999)),
+                 '', 0, rnd.choice(statuses), '')
+                for _ in range(CHOICES_PER_QUESTION)))
+    question = questions[QUESTIONS // 2]
+
+    def typeahead(text):
+        # as QuestionChoicesSearchView
+        return lambda: list(search.search_choices(Choice.objects.all(), text, question.pk, statuses, 10).
+                            values_list('pk', 'review_status', 'choice_text'))
+
+    for text in SEARCHES:
+        _common.report('"{}" (FTS5)'.format(text), _common.timed(typeahead(text), REPEAT))
+    with mock.patch.object(search, 'fts_available', return_value=False):
+        for text in SEARCHES:
+            _common.report('"{}" (icontains)'.format(text), _common.timed(typeahead(text), REPEAT // 10))
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
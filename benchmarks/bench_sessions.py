@@ -0,0 +1,75 @@
+"""Database writes per vote cycle for different session/message storages
+
+A vote cycle is: sign in, open the vote page, cast a vote, follow the redirect
+to the results page. The script counts the INSERT/UPDATE/DELETE statements
+per table for the former configuration (database sessions, session fallback
+for messages) and the signed cookie configuration from ``settings.py``.
+"""
+import collections
+import re
+
+import _common
+
+CYCLES = 20
+
+CONFIGURATIONS = (
+    ('database sessions', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    }),
+    ('signed cookie sessions', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    }),
+)
+
+WRITE_RE = re.compile(r'^(INSERT INTO|UPDATE|DELETE FROM) "(\w+)"')
+
+
+def vote_cycle(client, username, question, choice):
+    from django.urls import reverse
+
+    kwargs = {'slug': question.slug, 'id': question.id}
+    client.post(reverse('open_choice_polls:voter-sign-in'), {'username': username, 'password': 'secret'})
+    client.get(reverse('open_choice_polls:vote', kwargs=kwargs))
+    client.post(reverse('open_choice_polls:vote', kwargs=kwargs), {'choice': choice.id}, follow=True)
+
+
+def main():
+    old_config = _common.setup()
+
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext, override_settings
+    from open_choice_polls.models import Voter
+
+    question = _common.create_question(choices=5, votes_per_session=CYCLES)
+    choice = question.choice_set.first()
+
+    for name, overrides in CONFIGURATIONS:
+        user = Voter.create_voter(1, question_id=question.id)[0]
+        user.voter.is_enrolled = True
+        user.set_password('secret')
+        user.save()
+
+        writes = collections.Counter()
+        with override_settings(**overrides):
+            client = Client()
+            for _ in range(CYCLES):
+                with CaptureQueriesContext(connection) as queries:
+                    vote_cycle(client, user.username, question, choice)
+                for query in queries:
+                    match = WRITE_RE.match(query['sql'])
+                    if match:
+                        writes[match.group(2)] += 1
+
+        total = sum(writes.values()) / CYCLES
+        print('{:<24} {:5.1f} writes per vote cycle'.format(name, total))
+        for table, count in sorted(writes.items()):
+            print('    {:<36} {:5.1f}'.format(table, count / CYCLES))
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Vote throughput with 50 concurrent voters on a file based SQLite database
+
+Compares Django's stock SQLite configuration (rollback journal, deferred
+transactions, a new connection per request) with the profile from
+``settings.py``. Every voter runs in its own thread with its own database
+connection and casts its votes through the vote view; after each request
+the connection is handled like the WSGI handler does (closed unless
+``CONN_MAX_AGE`` allows reuse). Between the votes each voter also loads the
+results page, so reads and writes overlap.
+
+Each configuration runs in a fresh interpreter, as the database settings can
+not be changed once Django is set up.
+"""
+import collections
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import _common
+
+VOTERS = 50
+VOTES_PER_VOTER = 10
+
+STOCK = {
+    'ENGINE': 'django.db.backends.sqlite3',
+}
+
+
+def run(profile, directory):
+    from django.conf import settings
+
+    database = dict(settings.DATABASES['default'])
+    if profile == 'stock':
+        database = dict(STOCK, NAME=database['NAME'])
+    database['TEST'] = {'NAME': os.path.join(directory, '{}.sqlite3'.format(profile))}
+
+    old_config = _common.setup(DATABASES={'default': database},
+                               PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+    from django.db import close_old_connections, connection
+    from django.test import Client
+    from django.urls import reverse
+    from open_choice_polls.models import Voter
+
+    question = _common.create_question(choices=5, votes_per_session=VOTES_PER_VOTER)
+    choices = list(question.choice_set.all())
+    users = Voter.create_voter(VOTERS, question_id=question.id)
+    kwargs = {'slug': question.slug, 'id': question.id}
+    vote_url = reverse('open_choice_polls:vote', kwargs=kwargs)
+    results_url = reverse('open_choice_polls:results', kwargs=kwargs)
+    connection.close()
+
+    samples = []
+    errors = []
+    start_barrier = threading.Barrier(VOTERS)
+
+    def voter(user):
+        client = Client()
+        client.force_login(user)
+        close_old_connections()
+        start_barrier.wait()
+        for i in range(VOTES_PER_VOTER):
+            start = time.perf_counter()
+            try:
+                client.post(vote_url, {'choice': choices[i % len(choices)].id})
+                samples.append(time.perf_counter() - start)
+                client.get(results_url)
+            except Exception as err:  # "database is locked" surfaces as OperationalError
+                errors.append(err)
+            finally:
+                close_old_connections()
+        connection.close()
+
+    threads = [threading.Thread(target=voter, args=(user,)) for user in users]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    question.refresh_from_db()
+    _common.report('vote ({})'.format(profile), samples)
+    print('{:<32} votes counted={} errors={} throughput={:.0f} votes/s'.format(
+        '', question.total_votes, len(errors), len(samples) / elapsed))
+    for error, count in collections.Counter(str(err) for err in errors).items():
+        print('{:<32} {} x {}'.format('', count, error))
+
+    _common.teardown(old_config)
+
+
+def main():
+    if len(sys.argv) == 3:
+        run(sys.argv[1], sys.argv[2])
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in ('stock', 'profile'):
+            subprocess.run([sys.executable, __file__, profile, directory], check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""Ranked ballot tally: 1M ballots over 500 choices
+
+Builds the ballot buffer directly (choices ranked with Zipf-like weights, 1
+to 5 ranks per ballot) and times the instant-runoff and Borda tallies - with
+NumPy if it is installed, otherwise with the pure Python fallback (then pass
+a smaller number of ballots, e.g. ``python benchmarks/bench_tally.py 50000``).
+"""
+import random
+import sys
+import time
+
+import _common  # noqa: F401 (sys.path)
+
+from open_choice_polls import tally
+
+BALLOTS = 1000000
+CHOICES = 500
+WIDTH = 5
+
+
+def main():
+    ballots = int(sys.argv[1]) if len(sys.argv) > 1 else BALLOTS
+
+    rnd = random.Random(0)
+    weights = [1.0 / (rank + 1) for rank in range(CHOICES)]
+    population = list(range(CHOICES))
+    data = bytearray()
+    for _ in range(ballots):
+        ranking = []
+        for index in rnd.choices(population, weights, k=rnd.randint(1, WIDTH)):
+            if index not in ranking:
+                ranking.append(index)
+        data += tally.encode_ballot(ranking, WIDTH)
+    data = bytes(data)
+
+    print('{} ballots, {} choices, {}'.format(ballots, CHOICES, 'NumPy' if tally.np is not None else 'pure Python'))
+    for name, func in (('instant-runoff', tally.instant_runoff), ('borda', tally.borda)):
+        start = time.perf_counter()
+        result = func(data, WIDTH, range(CHOICES))
+        elapsed = time.perf_counter() - start
+        print('{:<16} {:.2f}s  {}'.format(name, elapsed, '{} rounds'.format(len(result))
+                                          if isinstance(result, list) else '{} choices'.format(len(result))))
+
+
+if __name__ == '__main__':
+    main()
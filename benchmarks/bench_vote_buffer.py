@@ -0,0 +1,57 @@
+"""Write-behind vote buffer: appends with a growing log
+
+Appends 20k votes of 200 voters to the buffer without a flush in between and
+times the appends (the vote limit check) and ``pending()`` (the vote page)
+at the start and at the end - they should not depend on the length of the
+log - then the flush of all of them. Appends are timed with and without
+fsync.
+"""
+import shutil
+import tempfile
+
+import _common
+
+VOTERS = 200
+VOTES = 20000
+REPEAT = 1000
+
+
+def main():
+    old_config = _common.setup(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+    from open_choice_polls.models import Participation, Voter
+    from open_choice_polls.vote_buffer import VoteBuffer
+
+    question = _common.create_question(choices=10, votes_per_session=VOTES)
+    choices = list(question.choice_set.all())
+    Voter.create_voter(VOTERS, question_id=question.id)
+    participations = list(Participation.objects.filter(question=question))
+
+    for fsync in (False, True):
+        directory = tempfile.mkdtemp()
+        vote_buffer = VoteBuffer(directory, fsync=fsync)
+        votes = iter(range(VOTES))
+
+        def append():
+            i = next(votes)
+            vote_buffer.append(participations[i % len(participations)], choices[i % len(choices)], VOTES)
+
+        def pending():
+            vote_buffer.pending(participations[0].pk)
+
+        label = 'fsync' if fsync else 'no fsync'
+        _common.report('append, empty log ({})'.format(label), _common.timed(append, REPEAT))
+        _common.report('pending, empty log ({})'.format(label), _common.timed(pending, REPEAT))
+        if not fsync:
+            for _ in range(VOTES - 2 * REPEAT):
+                append()
+            _common.report('append, full log ({})'.format(label), _common.timed(append, REPEAT))
+            _common.report('pending, full log ({})'.format(label), _common.timed(pending, REPEAT))
+        _common.report('flush ({})'.format(label), _common.timed(vote_buffer.flush, 1))
+        shutil.rmtree(directory)
+
+    _common.teardown(old_config)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""Non-blocking logging for the request path.
+
+Request threads only hand records to a bounded in-memory queue; a single
+background thread per process takes them off the queue, formats them and
+writes them to the real (file) handler. This keeps file writes, rotation
+checks and formatting out of the request/response cycle.
+
+Drop policy: the queue holds at most ``maxsize`` records. When it is full,
+records below ``block_level`` (default ``ERROR``) are dropped immediately -
+the newest record is the one discarded - and counted in ``dropped``. Records
+at or above ``block_level`` wait up to ``block_timeout`` seconds for space
+before they are dropped as well. Whenever records were dropped the listener
+writes a single WARNING line with the number of lost records once the queue
+has drained, so gaps in the log are always visible.
+"""
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+            'message': record.getMessage(),
+        }
+
+        status_code = getattr(record, 'status_code', None)
+        if status_code is not None:
+            data['status_code'] = status_code
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data['exc_info'] = record.exc_text
+        if record.stack_info:
+            data['stack_info'] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, default=str)
+
+
+def configured_formatter(format=None):
+    """The formatter chosen by ``settings.LOG_FORMAT`` ('standard' or 'json')
+
+    Called when Django configures logging, after all settings modules were
+    imported - so LOG_FORMAT can be set in a derived settings module.
+    ``format`` is the format string of the standard formatter.
+    """
+    if getattr(settings, 'LOG_FORMAT', 'standard') == 'json':
+        return JsonFormatter()
+    return logging.Formatter(format)
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def __init__(self, queue_, handler):
+        super().__init__(queue_, handler.target)
+        self.queue_handler = handler
+        self.reported = 0
+
+    def handle(self, record):
+        try:
+            super().handle(record)
+        except Exception:
+            # keep the listener alive - a dead listener would block flush()
+            self.queue_handler.handleError(record)
+
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported and self.queue.empty():
+            lost = dropped - self.reported
+            self.reported = dropped
+            super().handle(logging.makeLogRecord({
+                'name': __name__,
+                'levelno': logging.WARNING,
+                'levelname': logging.getLevelName(logging.WARNING),
+                'msg': '%d log record(s) dropped - logging queue was full',
+                'args': (lost,),
+            }))
+
+    def enqueue_sentinel(self):
+        # the queue is bounded - wait for the listener to make room
+        self.queue.put(self._sentinel)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """Queue records for a background thread that formats and writes them
+
+    ``target`` is the configuration (``class`` plus keyword arguments) of the
+    handler that does the actual writing, e.g. a ``RotatingFileHandler``.
+    A formatter configured for this handler is applied by the target in the
+    background thread.
+    """
+
+    def __init__(self, target, maxsize=10000, block_level=logging.ERROR, block_timeout=0.5):
+        target = dict(target)
+        target_class = import_string(target.pop('class'))
+        self.target = target_class(**target)
+
+        self.maxsize = maxsize
+        if isinstance(block_level, str):
+            block_level = logging.getLevelName(block_level)
+        self.block_level = block_level
+        self.block_timeout = block_timeout
+        self.dropped = 0
+
+        super().__init__(queue.Queue(maxsize))
+        self._start_listener()
+
+    def _start_listener(self):
+        self._pid = os.getpid()
+        self.listener = _QueueListener(self.queue, self)
+        self.listener.start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # merge message and arguments now (arguments may change or be freed
+        # after the request is done) but leave the formatting to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        # request objects must not be touched from another thread
+        record.__dict__.pop('request', None)
+        return record
+
+    def enqueue(self, record):
+        try:
+            if record.levelno >= self.block_level:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            # the handler lock (reentrant) - several request threads may drop records at the same time
+            with self.lock:
+                self.dropped += 1
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            # forked worker process - the listener thread was not inherited
+            self.queue = queue.Queue(self.maxsize)
+            self.dropped = 0
+            self._start_listener()
+        super().emit(record)
+
+    def flush(self):
+        """Wait until all queued records have been written"""
+        if self._pid == os.getpid() and self.listener._thread is not None:
+            self.queue.join()
+        self.target.flush()
+
+    def close(self):
+        try:
+            if self._pid == os.getpid() and self.listener._thread is not None:
+                self.listener.stop()
+            self.target.close()
+        finally:
+            super().close()
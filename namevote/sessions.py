@@ -0,0 +1,40 @@
+"""Cache based session engine that only writes sessions that changed
+
+Alternative to the signed cookie sessions configured in ``settings.py`` for
+installations that do not want to send session data to the client::
+
+    SESSION_ENGINE = 'namevote.sessions'
+
+It needs a cache shared by all worker processes (e.g. memcached) configured
+as ``CACHES['default']``.
+"""
+import hashlib
+import pickle
+
+from django.contrib.sessions.backends import cache
+
+
+class SessionStore(cache.SessionStore):
+    """Skip the cache write when the session data is the same as loaded
+
+    Django saves a session whenever it was marked as modified, which also
+    happens when a value is re-assigned unchanged.
+    """
+
+    _loaded_digest = None
+
+    @staticmethod
+    def _digest(data):
+        return hashlib.sha1(pickle.dumps(data, pickle.HIGHEST_PROTOCOL)).digest()
+
+    def load(self):
+        data = super().load()
+        self._loaded_digest = self._digest(data)
+        return data
+
+    def save(self, must_create=False):
+        if not must_create and self.session_key is not None:
+            if self._digest(self._get_session()) == self._loaded_digest:
+                return
+        super().save(must_create=must_create)
+        self._loaded_digest = self._digest(self._get_session(no_load=must_create))
@@ -43,30 +43,51 @@ INSTALLED_APPS = [
 ]
 
 # Django logging setup
+# Records are queued by the request threads and written by a background thread
+# (see namevote/log.py for the drop policy). Set LOG_FORMAT to 'json' for
+# structured (one JSON object per line) output - also in a settings module that
+# imports this one, the formatter is chosen when logging is configured.
+LOG_FORMAT = 'standard'
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
     'formatters': {
+        'configured': {
+            '()': 'namevote.log.configured_formatter',
+            'format': '%(asctime)s [%(levelname)s] %(name)s:%(lineno)d: %(message)s'
+        },
         'standard': {
             'format': '%(asctime)s [%(levelname)s] %(name)s:%(lineno)d: %(message)s'
         },
+        'json': {
+            '()': 'namevote.log.JsonFormatter',
+        },
     },
     'handlers': {
         'default': {
             'level': 'DEBUG',
-            'class': 'logging.handlers.RotatingFileHandler',
-            'filename': os.path.join(BASE_DIR, "..", "logs", "namevote.log"),
-            'maxBytes': 1024 * 1024 * 5,  # 5 MB
-            'backupCount': 5,
-            'formatter': 'standard',
+            'class': 'namevote.log.QueueHandler',
+            'target': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': os.path.join(BASE_DIR, "..", "logs", "namevote.log"),
+                'maxBytes': 1024 * 1024 * 5,  # 5 MB
+                'backupCount': 5,
+            },
+            'maxsize': 10000,  # records held in memory before dropping
+            'formatter': 'configured',
         },
         'request_handler': {
             'level': 'DEBUG',
-            'class': 'logging.handlers.RotatingFileHandler',
-            'filename': os.path.join(BASE_DIR, "..", "logs", "django_request.log"),
-            'maxBytes': 1024 * 1024 * 5,  # 5 MB
-            'backupCount': 5,
-            'formatter': 'standard',
+            'class': 'namevote.log.QueueHandler',
+            'target': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': os.path.join(BASE_DIR, "..", "logs", "django_request.log"),
+                'maxBytes': 1024 * 1024 * 5,  # 5 MB
+                'backupCount': 5,
+            },
+            'maxsize': 10000,  # records held in memory before dropping
+            'formatter': 'configured',
         },
         'mail_admins': {
             'level': 'ERROR',
@@ -88,6 +109,7 @@ LOGGING = {
 }
 
 MIDDLEWARE = [
+    'open_choice_polls.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -122,13 +144,34 @@ WSGI_APPLICATION = 'namevote.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# SQLite tuned for concurrent voting (see namevote/sqlite3/base.py): WAL journal
+# (readers do not block the writer), a busy timeout instead of immediate
+# "database is locked" errors, write transactions that take the lock up front
+# and connections that are reused across requests. For Django's stock setup
+# use 'django.db.backends.sqlite3' without CONN_MAX_AGE and OPTIONS.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'namevote.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'timeout': 10,  # seconds to wait for the write lock
+            'transaction_mode': 'IMMEDIATE',
+            'pragmas': {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',  # durable on application crash, fsync at checkpoints only
+                'busy_timeout': 10000,  # ms, same as timeout above
+                'mmap_size': 256 * 1024 * 1024,
+                'cache_size': -32000,  # negative: KiB
+            },
+        },
     }
 }
 
+# Reads of the read-mostly views go to OPEN_CHOICE_POLLS_DB_REPLICA if set
+# (see settings_replica.py), everything else to 'default'
+DATABASE_ROUTERS = ['open_choice_polls.routers.PrimaryReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -177,6 +220,12 @@ LOCALE_PATHS = [
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, '..', 'static')
 
+# Sessions and flash messages are kept in signed cookies - a vote cycle (sign
+# in, vote, redirect) does not write to the database besides the vote itself.
+# See README.md before changing this on a running installation.
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
 LOGIN_URL = '/voter/enroll/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
@@ -0,0 +1,10 @@
+from .settings import *
+
+# Primary/replica setup for local testing: two SQLite files. Nothing copies
+# data between them - create both with "migrate" and "migrate --database replica"
+# and copy db.sqlite3 to db_replica.sqlite3 to "replicate". The test databases
+# are separate as well, so tests see which database a view reads from.
+DATABASES['replica'] = dict(DATABASES['default'],
+                            NAME=os.path.join(BASE_DIR, 'db_replica.sqlite3'))
+
+OPEN_CHOICE_POLLS_DB_REPLICA = 'replica'
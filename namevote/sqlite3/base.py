@@ -0,0 +1,49 @@
+"""SQLite database backend tuned for concurrent voting
+
+Django's SQLite backend with two extra ``OPTIONS``:
+
+``pragmas``
+    ``PRAGMA`` statements executed on every new connection, e.g.
+    ``{'journal_mode': 'WAL', 'busy_timeout': 5000}``.
+
+``transaction_mode``
+    ``DEFERRED`` (SQLite's default), ``IMMEDIATE`` or ``EXCLUSIVE``. With
+    ``IMMEDIATE`` every ``transaction.atomic()`` block takes the write lock
+    when it starts. A deferred transaction that reads first and writes later
+    has to upgrade its lock, and two such transactions fail with "database is
+    locked" instead of waiting for each other (the busy timeout does not apply
+    to lock upgrades).
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, settings_dict, *args, **kwargs):
+        super().__init__(settings_dict, *args, **kwargs)
+        options = self.settings_dict['OPTIONS']
+
+        self.pragmas = dict(options.get('pragmas', {}))
+
+        self.transaction_mode = options.get('transaction_mode', 'DEFERRED').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured("settings.DATABASES OPTIONS 'transaction_mode' must be one of: {}".format(
+                ", ".join(TRANSACTION_MODES)))
+
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop('pragmas', None)
+        kwargs.pop('transaction_mode', None)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute('PRAGMA {} = {}'.format(name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN {}'.format(self.transaction_mode))
@@ -1,13 +1,23 @@
+import io
+
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseRedirect
+from django.shortcuts import get_object_or_404
 from django.template.response import TemplateResponse
-from django.urls import reverse
+from django.urls import path, reverse
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
-from .forms import ChoiceReviewForm
-from .models import Choice, Question, Voter, Participation
+from .choice_import import guess_format, import_choices, read_choice_texts
+from .cloning import clone_question
+from .forms import AssignVotersForm, ChoiceImportForm, ChoiceReviewForm, CloneQuestionForm
+from .models import Choice, ModerationRule, Question, Voter, Participation, ResultsSnapshot
+from .moderation import ModerationEngine
+from .search import search_choices
 
 
 class ChoiceInline(admin.TabularInline):
@@ -37,6 +47,7 @@ class ChoiceAdmin(admin.ModelAdmin):
 
     list_display = ('choice_text', 'choice_slug', 'question_text', 'review_status', 'votes')
     list_filter = ('question__text', 'question__number', 'review_status',)
+    search_fields = ('choice_text',)
 
     def question_text(self, obj):
         redirect_url = reverse('admin:open_choice_polls_question_change', args=(obj.question.id,))
@@ -46,8 +57,36 @@ class ChoiceAdmin(admin.ModelAdmin):
 
     actions = ["approve", "reject", "reset_review_status", "reset_votes"]
 
+    @staticmethod
+    def questions_changed(question_ids):
+        # queryset.update() sends no signals - recount the counters of the questions
+        Question.objects.filter(pk__in=question_ids).update_counters()
+        # changes to votes or to approved choices make a final results snapshot stale
+        ResultsSnapshot.objects.filter(question__in=question_ids).delete()
+
+    def get_search_results(self, request, queryset, search_term):
+        # full-text index instead of LIKE on every search field (see search.py)
+        if not search_term.strip():
+            return queryset, False
+        return search_choices(queryset, search_term), False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.question.invalidate_results()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.question.invalidate_results()
+
+    def delete_queryset(self, request, queryset):
+        question_ids = set(queryset.values_list('question', flat=True))
+        super().delete_queryset(request, queryset)
+        self.questions_changed(question_ids)
+
     def approve(self, request, queryset):
-        rows_updated = queryset.update(review_status=Choice.APPROVED)
+        question_ids = set(queryset.values_list('question', flat=True))
+        rows_updated = queryset.update(review_status=Choice.APPROVED, modified=timezone.now())
+        self.questions_changed(question_ids)
         if rows_updated == 1:
             message_bit = "1 choice was"
         else:
@@ -57,7 +96,9 @@ class ChoiceAdmin(admin.ModelAdmin):
     approve.short_description = _("Review Status: Approve")
 
     def reject(self, request, queryset):
-        rows_updated = queryset.update(review_status=Choice.REJECTED)
+        question_ids = set(queryset.values_list('question', flat=True))
+        rows_updated = queryset.update(review_status=Choice.REJECTED, modified=timezone.now())
+        self.questions_changed(question_ids)
         if rows_updated == 1:
             message_bit = "1 choice was"
         else:
@@ -67,7 +108,9 @@ class ChoiceAdmin(admin.ModelAdmin):
     reject.short_description = _("Review Status: Reject")
 
     def reset_review_status(self, request, queryset):
-        rows_updated = queryset.update(review_status=Choice.OPEN)
+        question_ids = set(queryset.values_list('question', flat=True))
+        rows_updated = queryset.update(review_status=Choice.OPEN, modified=timezone.now())
+        self.questions_changed(question_ids)
         if rows_updated == 1:
             message_bit = "Review status of 1 choice was"
         else:
@@ -77,7 +120,17 @@ class ChoiceAdmin(admin.ModelAdmin):
     reset_review_status.short_description = _("Review Status: Reset")
 
     def reset_votes(self, request, queryset):
+        # the results of ranked questions are tallied from their ballots, not from Choice.votes
+        ranked = queryset.exclude(question__counting_method=Question.PLURALITY).values_list(
+            'question__text', flat=True).distinct()
+        if ranked:
+            self.message_user(request, "Votes of ranked questions can not be reset: {}".format(
+                ', '.join(ranked)), level=messages.ERROR)
+            return
+
+        question_ids = set(queryset.values_list('question', flat=True))
         rows_updated = queryset.update(votes=0)
+        self.questions_changed(question_ids)
         if rows_updated == 1:
             message_bit = "Votes of 1 choice was"
         else:
@@ -100,6 +153,10 @@ class QuestionAdmin(admin.ModelAdmin):
         ('Main Settings', {'fields': ['is_visible',
                                       'description',
                                       'votes_per_session',
+                                      'counting_method',
+                                      'ranked_choices',
+                                      'suggestion_rate_limit',
+                                      'vote_rate_limit',
                                       'show_choices_approved',
                                       'show_choices_open',
                                       'show_choices_rejected',
@@ -136,7 +193,8 @@ class QuestionAdmin(admin.ModelAdmin):
                        'total_votes',
                        'allowed_voters')
 
-    actions = ['generate_1_voter', 'generate_3_voter', 'generate_25_voter']
+    actions = ['generate_1_voter', 'generate_3_voter', 'generate_25_voter', 'finalize_results',
+               'moderate_open_choices', 'moderate_open_choices_dry_run']
 
     inlines = (ChoiceInline,)
 
@@ -153,6 +211,101 @@ class QuestionAdmin(admin.ModelAdmin):
                                      obj.text))
         super(QuestionAdmin, self).save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            # dates or (inline) choices may have changed
+            form.instance.invalidate_results()
+
+    def get_urls(self):
+        urls = [
+            path('<path:object_id>/import-choices/', self.admin_site.admin_view(self.import_choices_view),
+                 name='open_choice_polls_question_import_choices'),
+            path('<path:object_id>/clone/', self.admin_site.admin_view(self.clone_view),
+                 name='open_choice_polls_question_clone'),
+        ]
+        return urls + super().get_urls()
+
+    def import_choices_view(self, request, object_id):
+        question = get_object_or_404(Question, pk=object_id)
+        if not self.has_change_permission(request, question) or \
+                not request.user.has_perm('open_choice_polls.add_choice'):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            form = ChoiceImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                upload = form.cleaned_data['file']
+                fmt = form.cleaned_data['format'] or guess_format(upload.name)
+                lines = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+                result = import_choices(question, read_choice_texts(lines, fmt),
+                                        review_status=form.cleaned_data['review_status'])
+                self.message_user(request, "Imported choices of {}: {}".format(question, result))
+                return HttpResponseRedirect(reverse('admin:open_choice_polls_question_change', args=(question.pk,)))
+        else:
+            form = ChoiceImportForm()
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            original=question,
+            title=_("Import choices"),
+            form=form,
+        )
+        return TemplateResponse(request, 'admin/open_choice_polls/question/import_choices.html', context)
+
+    def clone_view(self, request, object_id):
+        question = get_object_or_404(Question, pk=object_id)
+        if not self.has_add_permission(request) or not request.user.has_perm('open_choice_polls.add_choice'):
+            raise PermissionDenied
+
+        if request.method == 'POST':
+            form = CloneQuestionForm(request.POST)
+            if form.is_valid():
+                result = clone_question(question, text=form.cleaned_data['text'],
+                                        collection_start_date=form.cleaned_data['collection_start_date'],
+                                        review_statuses=form.cleaned_data['review_statuses'],
+                                        participations=form.cleaned_data['participations'])
+                self.message_user(request, "Cloned {}: {}".format(question, result))
+                return HttpResponseRedirect(reverse('admin:open_choice_polls_question_change',
+                                                    args=(result.question.pk,)))
+        else:
+            form = CloneQuestionForm(initial={'text': question.text, 'collection_start_date': timezone.now()})
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            original=question,
+            title=_("Clone question"),
+            form=form,
+        )
+        return TemplateResponse(request, 'admin/open_choice_polls/question/clone.html', context)
+
+    def finalize_results(self, request, queryset):
+        finalized = [q for q in queryset if q.finalize_results()]
+        self.message_user(request, "Results of {} question(s) finalized: {}".format(
+            len(finalized), ", ".join(str(q) for q in finalized)))
+
+    finalize_results.short_description = _("Finalize results of selected Questions (if voting has ended)")
+
+    def moderate_n_open_choices(self, request, queryset, dry_run=False):
+        for q in queryset:
+            counts = ModerationEngine.for_question(q).run(q.choice_set.all(), dry_run=dry_run)
+            details = "; ".join("{}: {}".format(rule, count) for rule, count in counts if count)
+            self.message_user(request, "{}{}: {} choice(s) moderated{}".format(
+                "Dry run - " if dry_run else "", q, sum(count for _, count in counts),
+                " ({})".format(details) if details else ""))
+
+    def moderate_open_choices(self, request, queryset):
+        self.moderate_n_open_choices(request, queryset)
+
+    moderate_open_choices.short_description = _("Moderate open choices of selected Questions")
+
+    def moderate_open_choices_dry_run(self, request, queryset):
+        self.moderate_n_open_choices(request, queryset, dry_run=True)
+
+    moderate_open_choices_dry_run.short_description = _("Moderate open choices of selected Questions (dry run)")
+
     def generate_n_voter(self, request, queryset, n=1, days=30):
         user_objs = Voter.create_voter(n, days)
         if user_objs:
@@ -164,11 +317,10 @@ class QuestionAdmin(admin.ModelAdmin):
                                                                                         ",".join(usernames)))
             else:
                 self.message_user(request, "successfully generated {} user(s)".format(n))
-            for idx, user_obj in enumerate(user_objs):
-                for q in queryset.all():
-                    Participation.objects.create(voter=user_obj.voter, question=q, is_allowed=True)
-                    if idx == len(user_objs) - 1:
-                        self.message_user(request, "added new user(s) to: {}".format(q))
+            voters = Voter.objects.filter(user__in=user_objs)
+            for q in queryset.all():
+                Participation.objects.grant(q, voters)
+                self.message_user(request, "added new user(s) to: {}".format(q))
 
     def generate_1_voter(self, request, queryset):
         self.generate_n_voter(request, queryset)
@@ -186,6 +338,12 @@ class QuestionAdmin(admin.ModelAdmin):
     generate_25_voter.short_description = _("Create 25 Voters and assign to selected Questions")
 
 
+class ModerationRuleAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'position', 'question', 'kind', 'action', 'is_active')
+    list_editable = ('position', 'is_active')
+    list_filter = ('is_active', 'kind', 'action', 'question__text')
+
+
 class UserAdmin(BaseUserAdmin):
     inlines = (VoterInline,)
 
@@ -206,7 +364,7 @@ class VoterAdmin(admin.ModelAdmin):
                            'enrollment_code_valid_until']}),
     ]
 
-    actions = ["export_codes_for_print", "export_codes_for_email"]
+    actions = ["assign_to_question", "export_codes_for_print", "export_codes_for_email"]
 
     # def get_actions(self, request):
     #     actions = super().get_actions(request)
@@ -217,6 +375,35 @@ class VoterAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         return super().get_queryset(request).filter(is_voter=True)
 
+    def assign_to_question(self, request, queryset):
+        if 'apply' in request.POST:
+            form = AssignVotersForm(request.POST)
+            if form.is_valid():
+                question = form.cleaned_data['question']
+                if form.cleaned_data['operation'] == AssignVotersForm.GRANT:
+                    count = Participation.objects.grant(question, queryset)
+                    self.message_user(request, "{} voter(s) newly allowed to vote on: {}".format(count, question))
+                else:
+                    count = Participation.objects.revoke(question, queryset)
+                    self.message_user(request, "{} voter(s) no longer allowed to vote on: {}".format(count, question))
+                return None
+        else:
+            form = AssignVotersForm()
+
+        context = dict(
+            self.admin_site.each_context(request),
+            opts=self.model._meta,
+            title=_("Assign voters to a question"),
+            form=form,
+            queryset=queryset,
+            count=queryset.count(),
+            action_checkbox_name=admin.helpers.ACTION_CHECKBOX_NAME,
+            select_across=request.POST.get('select_across', '0'),
+        )
+        return TemplateResponse(request, 'admin/open_choice_polls/voter/assign_to_question.html', context)
+
+    assign_to_question.short_description = _("Allow/disallow selected Voters to vote on a Question")
+
     def export_codes_for_print(self, request, queryset):
         _ = queryset.update(enrollment_code_is_distributed=True)
         response = TemplateResponse(request, 'open_choice_polls/admin_voter_export_print.html', {'entries': queryset})
@@ -242,3 +429,4 @@ admin.site.register(User, UserAdmin)
 admin.site.register(Voter, VoterAdmin)
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Choice, ChoiceAdmin)
+admin.site.register(ModerationRule, ModerationRuleAdmin)
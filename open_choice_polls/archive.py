@@ -0,0 +1,237 @@
+"""Archival of closed questions
+
+``archive_question()`` moves a question whose voting has ended out of the
+hot tables: its choices, vote buckets, participations and ballots, its
+results snapshot and the voters (with their users) that were allowed on no
+other question are written to an archive file in
+``OPEN_CHOICE_POLLS_ARCHIVE_DIR`` (see ``archive_file.py``), read from the
+database in chunks so memory use does not depend on the size of the question.
+Staff users and users with groups or permissions are never archived.
+
+Once the file is complete, a ``QuestionArchive`` stub is saved and the rows
+written to the file (by their ids, read back from it) are deleted in chunks
+of set-based ``DELETE`` statements, each chunk in its own transaction (like
+``purge.py``, without loading model instances or sending signals). Rows added
+while the file was written are kept. From then on the results page reads the final results
+from the start of the archive file (cached per process). If the deletion is
+interrupted, archiving the question again deletes the rest.
+
+``restore_question()`` inserts the archived rows again with their ids and
+dates, deletes the stub and (unless kept) the file. Users and voters whose id
+or name has been taken in the meantime are skipped, as are the
+participations and ballots of the voters that are missing.
+"""
+import itertools
+import logging
+import os
+import uuid
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import archive_file, settings
+from .bulk import insert_rows, raw_delete
+from .models import Ballot, Choice, ModerationTask, Participation, Question, QuestionArchive, ResultsSnapshot, \
+    VoteBucket, Voter
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+class RestoreResult:
+
+    def __init__(self):
+        self.choices = 0
+        self.voters = 0
+        self.participations = 0
+        self.ballots = 0
+        self.skipped = 0
+
+    def __str__(self):
+        return "{} choice(s), {} voter(s), {} participation(s), {} ballot(s) restored, {} row(s) skipped".format(
+            self.choices, self.voters, self.participations, self.ballots, self.skipped)
+
+
+def field_names(model):
+    return [field.name for field in model._meta.concrete_fields]
+
+
+def records(model, queryset, batch_size=BATCH_SIZE):
+    """archive records of the rows of `queryset` - read in chunks of `batch_size`"""
+    names = field_names(model)
+    for row in queryset.order_by('pk').values_list(*names).iterator(chunk_size=batch_size):
+        yield {'type': model._meta.model_name, 'fields': dict(zip(names, row))}
+
+
+def archived_voters(question):
+    """voters that are only allowed on (or took part in) `question` - archived and deleted with it"""
+    return Voter.objects.filter(participation__question=question, user__is_staff=False, user__is_superuser=False,
+                                user__groups__isnull=True, user__user_permissions__isnull=True). \
+        exclude(pk__in=Participation.objects.exclude(question=question).values('voter'))
+
+
+def write_archive(question, path, batch_size=BATCH_SIZE):
+    """write the archive file of `question` - returns the number of rows per model name"""
+    snapshot = question.finalize_results()
+    if snapshot is None:
+        raise ValueError("voting on {} has not ended".format(question))
+    totals = VoteBucket.objects.filter(question=question).order_by('start', 'seconds'). \
+        values_list('start', 'seconds').annotate(total=Sum('votes'))
+    voters = archived_voters(question)
+
+    counts = {}
+    with archive_file.ArchiveWriter(path) as writer:
+        writer.write({'type': 'archive', 'version': archive_file.VERSION, 'question': question.pk,
+                      'created': timezone.now()})
+        writer.write(next(records(Question, Question.objects.filter(pk=question.pk))))
+        writer.write({'type': 'resultssnapshot',
+                      'fields': {name: getattr(snapshot, name) for name in field_names(ResultsSnapshot)
+                                 if name not in ('id', 'question')},
+                      'vote_totals': list(totals)})
+
+        for model, queryset in ((VoteBucket, VoteBucket.objects.filter(question=question)),
+                                (Choice, Choice.objects.filter(question=question)),
+                                (User, User.objects.filter(voter__in=voters.values('pk'))),
+                                (Voter, Voter.objects.filter(pk__in=voters.values('pk'))),
+                                (Participation, Participation.objects.filter(question=question)),
+                                (Ballot, Ballot.objects.filter(question=question))):
+            before = writer.records
+            for record in records(model, queryset, batch_size):
+                writer.write(record)
+            counts[model._meta.model_name] = writer.records - before
+    return counts
+
+
+def archived_ids(path, kind, batch_size):
+    """the ids of the `kind` records of the archive file `path` - in lists of up to `batch_size`"""
+    ids = (fields['id'] for fields in archive_file.read_fields(path, kind))
+    while True:
+        batch = list(itertools.islice(ids, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def delete_rows(question, path, batch_size=BATCH_SIZE):
+    """delete the rows of `question` archived in `path` in chunks (see the module docstring)
+
+    Only the rows written to the file are deleted - rows added since are kept.
+    """
+    for model, kind in ((Ballot, 'ballot'), (Participation, 'participation')):
+        for batch in archived_ids(path, kind, batch_size):
+            with transaction.atomic():
+                raw_delete(model.objects.filter(pk__in=batch))
+
+    for batch in archived_ids(path, 'voter', batch_size):
+        with transaction.atomic():
+            # not if allowed on a question again since
+            voters = list(Voter.objects.filter(pk__in=batch, participation__isnull=True).values_list('pk', 'user'))
+            raw_delete(Voter.objects.filter(pk__in=[voter_id for voter_id, _ in voters]))
+            raw_delete(User.objects.filter(pk__in=[user_id for _, user_id in voters]))
+
+    for model, kind in ((VoteBucket, 'votebucket'), (Choice, 'choice')):
+        for batch in archived_ids(path, kind, batch_size):
+            with transaction.atomic():
+                if model is Choice:
+                    raw_delete(ModerationTask.objects.filter(choice__in=batch))
+                raw_delete(model.objects.filter(pk__in=batch))
+
+    ResultsSnapshot.objects.filter(question=question).delete()
+    if any(model.objects.filter(question=question).exists() for model in (Choice, Participation, Ballot)):
+        logger.warning("Kept the rows of %s added after it was archived", question)
+
+
+def archive_question(question, batch_size=BATCH_SIZE):
+    """archive `question` (or finish an interrupted archival) - returns the QuestionArchive"""
+    directory = settings.OPEN_CHOICE_POLLS_ARCHIVE_DIR
+    if not directory:
+        raise ValueError("OPEN_CHOICE_POLLS_ARCHIVE_DIR is not set")
+
+    stub = QuestionArchive.objects.filter(question=question).first()
+    if stub is None:
+        os.makedirs(directory, exist_ok=True)
+        file_name = 'question-{}-{}{}'.format(question.number, uuid.uuid4().hex[:12], archive_file.SUFFIX)
+        path = os.path.join(directory, file_name)
+        counts = write_archive(question, path, batch_size)
+        stub = QuestionArchive.objects.create(question=question, file_name=file_name, size=os.path.getsize(path),
+                                              choices=counts['choice'], participations=counts['participation'],
+                                              voters=counts['voter'], ballots=counts['ballot'])
+        logger.info("Archived %s to %s (%s bytes)", question, file_name, stub.size)
+
+    delete_rows(question, stub.path, batch_size)
+    return stub
+
+
+def insert_records(model, batch):
+    """INSERT the archived rows `batch` (fields of records) with their ids and dates - no pre_save(), no signals"""
+    connection = connections[router.db_for_write(model)]
+    names = field_names(model)
+    fields = [model._meta.get_field(name) for name in names]
+    insert_rows(model, names, [tuple(field.get_db_prep_save(field.to_python(row[name]), connection)
+                                     for name, field in zip(names, fields)) for row in batch])
+
+
+def restore_question(question, keep_file=False, batch_size=BATCH_SIZE):
+    """insert the archived rows of `question` again and delete its stub - returns a RestoreResult"""
+    stub = QuestionArchive.objects.get(question=question)
+    result = RestoreResult()
+    models = {model._meta.model_name: model for model in (VoteBucket, Choice, User, Voter, Participation, Ballot)}
+    users, voters, participations = set(), set(), set()
+
+    def restorable(kind, batch):
+        """the rows of `batch` that can be restored (one or two queries)"""
+        ids = [row['id'] for row in batch]
+        if kind == 'user':
+            taken = set(User.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            names = set(User.objects.filter(username__in=[row['username'] for row in batch]).
+                        values_list('username', flat=True))
+            batch = [row for row in batch if row['id'] not in taken and row['username'] not in names]
+            users.update(row['id'] for row in batch)
+        elif kind == 'voter':
+            taken = set(Voter.objects.filter(pk__in=ids).values_list('pk', flat=True))
+            batch = [row for row in batch if row['user'] in users and row['id'] not in taken]
+            voters.update(row['id'] for row in batch)
+            result.voters += len(batch)
+        elif kind == 'participation':
+            # the voters that were allowed on other questions as well were not archived
+            existing = set(Voter.objects.filter(pk__in=[row['voter'] for row in batch if row['voter'] not in voters]).
+                           values_list('pk', flat=True))
+            batch = [row for row in batch if row['voter'] in voters or row['voter'] in existing]
+            participations.update(row['id'] for row in batch)
+            result.participations += len(batch)
+        elif kind == 'ballot':
+            batch = [row for row in batch if row['participation'] in participations]
+            result.ballots += len(batch)
+        elif kind == 'choice':
+            result.choices += len(batch)
+        result.skipped += len(ids) - len(batch)
+        return batch
+
+    with transaction.atomic():
+        for kind, group in itertools.groupby(archive_file.read_records(stub.path), key=lambda record: record['type']):
+            if kind == 'resultssnapshot':
+                fields = next(group)['fields']
+                if not ResultsSnapshot.objects.filter(question=question).exists():
+                    ResultsSnapshot.objects.bulk_create([ResultsSnapshot(question=question, **{
+                        field.name: field.to_python(fields[field.name])
+                        for field in ResultsSnapshot._meta.concrete_fields if field.name not in ('id', 'question')})])
+            elif kind in models:
+                while True:
+                    batch = [record['fields'] for record in itertools.islice(group, batch_size)]
+                    if not batch:
+                        break
+                    batch = restorable(kind, batch)
+                    if batch:
+                        insert_records(models[kind], batch)
+
+        # the counters are recounted in case rows were skipped
+        Question.objects.filter(pk=question.pk).update_counters()
+        stub.delete()
+
+    if not keep_file:
+        os.remove(stub.path)
+    logger.info("Restored %s from %s: %s", question, stub.file_name, result)
+    return result
@@ -0,0 +1,113 @@
+"""Archive files of questions (see ``archive.py``)
+
+An archive is a gzip compressed JSON Lines file, written as a stream. Every
+line is a record ``{"type": ..., "fields": {...}}`` with the values of the
+fields of one row (by field name; dates in ISO 8601, binary data in base64).
+The first records are the ones the results page needs, so it only reads the
+start of the file:
+
+1. ``archive``: the format ``version``, the ``question`` id and the date
+   the archive was ``created``
+2. ``question``: the question as it was archived
+3. ``resultssnapshot``: the final results, with the ``vote_totals`` (start,
+   seconds, votes) of the vote buckets
+
+followed by the ``votebucket``, ``choice``, ``user``, ``voter``,
+``participation`` and ``ballot`` records.
+
+A file is written next to its final name and renamed (after an fsync) when it
+is complete, so a crash never leaves a truncated archive behind.
+"""
+import base64
+import datetime
+import functools
+import gzip
+import json
+import os
+import uuid
+
+VERSION = 1
+SUFFIX = '.jsonl.gz'
+
+# archives whose results are kept in memory (per process)
+CACHE_SIZE = 64
+
+
+def encode(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, (bytes, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    raise TypeError("{!r} is not JSON serializable".format(value))
+
+
+class ArchiveWriter:
+
+    def __init__(self, path, compresslevel=6):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.file = gzip.open(self.tmp_path, 'wt', encoding='utf-8', compresslevel=compresslevel)
+        self.records = 0
+
+    def write(self, record):
+        self.file.write(json.dumps(record, default=encode, separators=(',', ':')))
+        self.file.write('\n')
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+        with open(self.tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_records(path):
+    """the records of an archive file"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for number, line in enumerate(f):
+            record = json.loads(line)
+            if number == 0 and (record.get('type') != 'archive' or record.get('version') != VERSION):
+                raise ValueError("{} is not an archive of version {}".format(path, VERSION))
+            yield record
+
+
+def read_fields(path, kind):
+    """the fields of the `kind` records of an archive file - the other records are not decoded"""
+    prefix = '{{"type":"{}",'.format(kind)
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith(prefix):
+                yield json.loads(line)['fields']
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def read_results(path):
+    """the question and results records at the start of an archive file - cached
+
+    Archive files are never changed (a new archive of the question gets a new
+    name), so the cache needs no invalidation. The records are shared - do not
+    change them.
+    """
+    records = read_records(path)
+    try:
+        _, question, results = next(records), next(records), next(records)
+    except StopIteration:
+        raise ValueError("{} is incomplete".format(path))
+    finally:
+        records.close()
+    return question, results
@@ -0,0 +1,30 @@
+"""Set-based writes that bypass the ORM
+
+Used where building model instances for every row (and sending their
+signals) would take most of the time: the purge of expired voters, the
+synthetic data set and the archival of questions. All of them go to the
+database the router picks for writes and send no signals, so the callers
+recount the counters that depend on the rows.
+"""
+from django.db import connections, router
+
+
+def raw_delete(queryset):
+    """DELETE the rows of `queryset` with one statement - no instances are loaded, nothing cascades"""
+    return queryset._raw_delete(using=router.db_for_write(queryset.model))
+
+
+def insert_rows(model, names, rows):
+    """INSERT `rows` (tuples of database values of the fields `names`) with one executemany()"""
+    connection = connections[router.db_for_write(model)]
+    columns = [model._meta.get_field(name).column for name in names]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns), ', '.join(['%s'] * len(columns)))
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def db_value(model, name, value):
+    """database value of `value` for the field `name` of `model`"""
+    return model._meta.get_field(name).get_db_prep_save(value, connections[router.db_for_write(model)])
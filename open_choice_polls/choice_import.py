@@ -0,0 +1,119 @@
+"""Bulk import of choices from CSV or JSON Lines files
+
+The file is read as a stream and written in batches, so memory use depends on
+the batch size only. Duplicates within the file are found by checking every
+batch against the choices already in the database (which include the batches
+imported before).
+
+CSV: one choice per row, the text in the first column (or in a column named
+``choice_text`` if the first row has one). JSON Lines: one string or object
+with a ``choice_text`` key per line.
+"""
+import csv
+import itertools
+import json
+import re
+
+from django.db import transaction
+
+from .forms import ChoiceForm
+from .models import Choice, Question
+
+FORMATS = ('csv', 'jsonl')
+BATCH_SIZE = 500
+
+
+class ImportResult:
+
+    def __init__(self):
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+
+    def __str__(self):
+        return "{} created, {} duplicate(s), {} invalid".format(self.created, self.duplicates, self.invalid)
+
+
+def guess_format(filename):
+    """file format from the file name (extension)"""
+    for fmt in FORMATS:
+        if filename.lower().endswith('.' + fmt):
+            return fmt
+    return 'csv'
+
+
+def read_csv(lines):
+    reader = csv.reader(lines)
+    column = 0
+    for idx, row in enumerate(reader):
+        if idx == 0 and 'choice_text' in row:
+            column = row.index('choice_text')
+            continue
+        if len(row) > column:
+            yield row[column]
+
+
+def read_jsonl(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            yield ''  # counted as invalid
+            continue
+        if isinstance(entry, dict):
+            entry = entry.get('choice_text', '')
+        yield entry if isinstance(entry, str) else ''
+
+
+def read_choice_texts(lines, fmt):
+    """choice texts (not yet normalized) from an iterable of text lines"""
+    if fmt == 'jsonl':
+        return read_jsonl(lines)
+    return read_csv(lines)
+
+
+def import_choices(question, texts, review_status=Choice.OPEN, batch_size=BATCH_SIZE):
+    """create choices for `question` from an iterable of texts - returns an ImportResult
+
+    Texts are normalized like in ``ChoiceForm`` and checked against the
+    question's ``choice_validation_regex``. Each batch is committed on its own.
+    """
+    result = ImportResult()
+    regex = re.compile(question.choice_validation_regex) if question.choice_validation_regex else None
+    # as suggested in the form - the model allows longer texts
+    max_length = ChoiceForm.base_fields['choice_text'].max_length
+
+    texts = iter(texts)
+    while True:
+        batch = list(itertools.islice(texts, batch_size))
+        if not batch:
+            break
+
+        valid = {}  # ordered and without the duplicates within the batch
+        for text in batch:
+            text = Choice.normalize_text(text)
+            if not text or len(text) > max_length or (regex and not regex.search(text)):
+                result.invalid += 1
+            elif text in valid:
+                result.duplicates += 1
+            else:
+                valid[text] = None
+
+        with transaction.atomic():
+            existing = set(question.choice_set.filter(choice_text__in=list(valid)).
+                           values_list('choice_text', flat=True))
+            new = [Choice(question=question, choice_text=text, review_status=review_status)
+                   for text in valid if text not in existing]
+            Choice.objects.bulk_create(new)
+            # bulk_create() sends no post_save signals
+            Question.objects.filter(pk=question.pk).add_to_counters(
+                total_choices=len(new), total_approved_choices=len(new) if review_status == Choice.APPROVED else 0)
+
+        result.duplicates += len(existing)
+        result.created += len(new)
+
+    if result.created and review_status == Choice.APPROVED:
+        question.invalidate_results()
+    return result
@@ -0,0 +1,79 @@
+"""Cloning of questions for the next round
+
+The clone gets the settings of the question, a new number and its dates
+moved so the collection phase starts at the given date (the durations of the
+phases stay the same). The choices with the given review statuses are copied
+with their votes reset, the question specific moderation rules are copied as
+well and - optionally - the voters allowed to vote on the question are
+allowed to vote on the clone.
+
+Choices are read as plain values and written with ``bulk_create()`` in
+batches, participations are granted with ``Participation.objects.grant()``.
+Both send no signals, so the counters of the clone are recounted at the end.
+"""
+import itertools
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Choice, ModerationRule, Participation, Question, Voter
+
+BATCH_SIZE = 500
+
+# copied from the choices - the votes and the ballot index start anew
+CHOICE_FIELDS = ('choice_text', 'choice_slug', 'review_status', 'review_remark')
+
+
+class CloneResult:
+
+    def __init__(self, question):
+        self.question = question
+        self.choices = 0
+        self.rules = 0
+        self.voters = 0
+
+    def __str__(self):
+        return "{} with {} choice(s), {} moderation rule(s), {} voter(s)".format(
+            self.question, self.choices, self.rules, self.voters)
+
+
+def clone_question(question, text=None, collection_start_date=None, review_statuses=(Choice.APPROVED,),
+                   participations=True, batch_size=BATCH_SIZE):
+    """clone `question` (see the module docstring) - returns a CloneResult"""
+    start = collection_start_date or timezone.now()
+    shift = start - question.collection_start_date
+    skip = {'id', 'number', 'slug', 'created', 'voter_participation'} | set(Question.COUNTER_FIELDS)
+    values = {field.name: getattr(question, field.name) for field in Question._meta.concrete_fields
+              if field.name not in skip}
+    values.update(text=text or question.text,
+                  collection_start_date=start,
+                  collection_end_date=question.collection_end_date + shift,
+                  voting_start_date=question.voting_start_date + shift,
+                  voting_end_date=question.voting_end_date + shift)
+
+    with transaction.atomic():
+        clone = Question.objects.create(**values)
+        result = CloneResult(clone)
+
+        rows = question.choice_set.filter(review_status__in=review_statuses).order_by('created', 'pk'). \
+            values_list(*CHOICE_FIELDS).iterator(chunk_size=batch_size)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            Choice.objects.bulk_create([Choice(question=clone, **dict(zip(CHOICE_FIELDS, row))) for row in batch])
+            result.choices += len(batch)
+
+        rules = [ModerationRule(question=clone, position=rule.position, kind=rule.kind, value=rule.value,
+                                action=rule.action, remark=rule.remark, is_active=rule.is_active)
+                 for rule in question.moderationrule_set.all()]
+        ModerationRule.objects.bulk_create(rules)
+        result.rules = len(rules)
+
+        if participations:
+            voters = Voter.objects.filter(participation__question=question, participation__is_allowed=True)
+            result.voters = Participation.objects.grant(clone, voters, batch_size=batch_size)
+
+        Question.objects.filter(pk=clone.pk).update_counters()
+        clone.refresh_from_db()
+    return result
@@ -11,3 +11,11 @@ class ParticipationAllVotesUsed(Exception):
 class QuestionVoteNotActive(Exception):
     """The question is not active for voting"""
     pass
+
+
+class RateLimited(Exception):
+    """Too many requests - retry after `retry_after` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit exceeded - retry after {:.0f} seconds".format(retry_after))
+        self.retry_after = retry_after
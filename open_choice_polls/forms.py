@@ -1,8 +1,11 @@
 import re
+import uuid
+
 from django import forms
 from django.core.exceptions import MultipleObjectsReturned
 from django.utils.translation import gettext_lazy as _
 
+from . import settings
 from .models import Choice, Question
 
 
@@ -37,14 +40,16 @@ class ChoiceForm(forms.ModelForm):
         fields = ['choice_text']
 
     def clean_choice_text(self):
-        # remove duplicate spaces and strip space from start and end
-        data = self.cleaned_data['choice_text']
-        return re.sub(' +', ' ', data.strip())
+        return Choice.normalize_text(self.cleaned_data['choice_text'])
 
     def clean(self):
         cleaned_data = super().clean()
         clean_choice_text = cleaned_data['choice_text']
 
+        if settings.OPEN_CHOICE_POLLS_MODERATION_QUEUE:
+            # checked by the moderation worker (see moderation_queue)
+            return cleaned_data
+
         # check regex
         if self.instance.choice_validation_regex and \
                 not re.compile(self.instance.choice_validation_regex).search(clean_choice_text):
@@ -91,8 +96,69 @@ class VoteForm(forms.ModelForm):
 
         # make sure this Choice exists for this Question
         try:
-            self.instance.choice_set.get(pk=clean_choice)
+            self.selected_choice = self.instance.choice_set.get(pk=clean_choice)
         except Choice.DoesNotExist as err:
             raise forms.ValidationError("Not found: {} - {}".format(clean_choice, err))
 
         return cleaned_data
+
+
+class RankedVoteForm(forms.ModelForm):
+    """Ranked ballot - the choice ids (``ranking``, repeated) in order of preference"""
+    ranking = forms.Field(label=_("Ranking"), required=True, widget=forms.MultipleHiddenInput)
+
+    class Meta:
+        model = Question
+        fields = ['ranking']
+
+    def clean_ranking(self):
+        values = [value for value in self.cleaned_data['ranking'] if value]
+        if not values:
+            raise forms.ValidationError("Rank at least one choice.")
+        if len(values) > self.instance.ranked_choices:
+            raise forms.ValidationError("Rank at most {} choices.".format(self.instance.ranked_choices))
+
+        try:
+            # parsed first - one id can be spelled in several ways (case, dashes)
+            ids = [uuid.UUID(value) for value in values]
+        except ValueError:
+            raise forms.ValidationError("Not found: {}".format(', '.join(values)))
+        if len(set(ids)) != len(ids):
+            raise forms.ValidationError("Each choice can only be ranked once.")
+
+        choices = self.instance.choice_set.filter(review_status=Choice.APPROVED, pk__in=ids).in_bulk()
+        ranking = [choices.get(choice_id) for choice_id in ids]
+        if None in ranking:
+            raise forms.ValidationError("Not found: {}".format(', '.join(
+                value for value, choice in zip(values, ranking) if choice is None)))
+
+        # the choices in order of preference
+        self.ranking = ranking
+        return values
+
+
+class ChoiceImportForm(forms.Form):
+    file = forms.FileField(label=_("File"), help_text=_("CSV (one choice per row) or JSON Lines"))
+    format = forms.ChoiceField(label=_("Format"), required=False,
+                               choices=(('', _('from file name')), ('csv', 'CSV'), ('jsonl', 'JSON Lines')))
+    review_status = forms.ChoiceField(label=_("Review status"), choices=Choice.REVIEW_STATUS_CHOICES,
+                                      initial=Choice.OPEN)
+
+
+class CloneQuestionForm(forms.Form):
+    text = forms.CharField(label=_("Text"), max_length=200)
+    collection_start_date = forms.DateTimeField(label=_("Start Collection Phase"),
+                                                help_text=_("The other dates keep their distance to it"))
+    review_statuses = forms.MultipleChoiceField(label=_("Copy choices"), widget=forms.CheckboxSelectMultiple,
+                                                choices=Choice.REVIEW_STATUS_CHOICES, initial=[Choice.APPROVED],
+                                                required=False)
+    participations = forms.BooleanField(label=_("Copy allowed voters"), initial=True, required=False)
+
+
+class AssignVotersForm(forms.Form):
+    GRANT = 'grant'
+    REVOKE = 'revoke'
+
+    question = forms.ModelChoiceField(label=_("Question"), queryset=Question.objects.all())
+    operation = forms.ChoiceField(label=_("Operation"), widget=forms.RadioSelect, initial=GRANT,
+                                  choices=((GRANT, _('allow to vote')), (REVOKE, _('do not allow to vote'))))
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from open_choice_polls import settings
+from open_choice_polls.archive import BATCH_SIZE, archive_question
+from open_choice_polls.models import Choice, Participation, Question
+
+
+class Command(BaseCommand):
+    help = 'Move closed questions to archive files in OPEN_CHOICE_POLLS_ARCHIVE_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', nargs='*', type=str, help='ID of Question to archive')
+        parser.add_argument('--closed-for', type=int,
+                            help='Archive all questions whose voting ended at least this many days ago')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows read and deleted at a time')
+
+    def handle(self, *args, **options):
+        if not settings.OPEN_CHOICE_POLLS_ARCHIVE_DIR:
+            raise CommandError('OPEN_CHOICE_POLLS_ARCHIVE_DIR is not set')
+
+        if options.get('question'):
+            try:
+                questions = list(Question.objects.filter(pk__in=options.get('question')))
+            except ValidationError as err:
+                raise CommandError(err)
+            if len(questions) != len(set(options.get('question'))):
+                raise CommandError('Question does not exist')
+        elif options.get('closed_for') is not None:
+            closed_before = timezone.now() - timedelta(days=options.get('closed_for'))
+            # archived questions whose rows were not deleted completely are finished as well
+            questions = list(Question.objects.filter(voting_end_date__lt=closed_before).annotate(
+                has_choices=Exists(Choice.objects.filter(question=OuterRef('pk'))),
+                has_participations=Exists(Participation.objects.filter(question=OuterRef('pk')))).filter(
+                Q(archive__isnull=True) | Q(has_choices=True) | Q(has_participations=True)).order_by('number'))
+        else:
+            raise CommandError('Give the questions to archive or --closed-for')
+
+        for q in questions:
+            try:
+                stub = archive_question(q, batch_size=options.get('batch_size'))
+            except ValueError as err:
+                raise CommandError(err)
+            self.stdout.write(self.style.SUCCESS('Archived {} to {}: {} choice(s), {} participation(s), '
+                                                 '{} voter(s), {} bytes'.format(q, stub.file_name, stub.choices,
+                                                                                stub.participations, stub.voters,
+                                                                                stub.size)))
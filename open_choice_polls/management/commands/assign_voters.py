@@ -0,0 +1,40 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from open_choice_polls.models import Participation, Question, Voter
+
+
+class Command(BaseCommand):
+    help = 'Allow (or disallow) voters to vote on a question - all voters, the enrolled ones or ' \
+           'the ones allowed on another question'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', type=str, help='ID of Question')
+        parser.add_argument('--revoke', action='store_true', help='Disallow the voters to vote on the Question')
+        parser.add_argument('--enrolled', action='store_true', help='Only voters that are enrolled')
+        parser.add_argument('--from-question', type=str,
+                            help='ID of Question - only voters that are allowed to vote on this Question')
+
+    def handle(self, *args, **options):
+        try:
+            question = Question.objects.get(pk=options['question'])
+        except (Question.DoesNotExist, ValidationError):
+            raise CommandError('Question "{}" does not exist'.format(options['question']))
+
+        voters = Voter.objects.filter(is_voter=True)
+        if options['enrolled']:
+            voters = voters.filter(is_enrolled=True)
+        if options['from_question']:
+            try:
+                from_question = Question.objects.get(pk=options['from_question'])
+            except (Question.DoesNotExist, ValidationError):
+                raise CommandError('Question "{}" does not exist'.format(options['from_question']))
+            voters = voters.filter(participation__question=from_question,
+                                   participation__is_allowed=True)
+
+        if options['revoke']:
+            count = Participation.objects.revoke(question, voters)
+            self.stdout.write(self.style.SUCCESS('{} voter(s) no longer allowed to vote on: {}'.format(
+                count, question)))
+        else:
+            count = Participation.objects.grant(question, voters)
+            self.stdout.write(self.style.SUCCESS('{} voter(s) newly allowed to vote on: {}'.format(count, question)))
@@ -0,0 +1,44 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from open_choice_polls.cloning import BATCH_SIZE, clone_question
+from open_choice_polls.models import Choice, Question
+
+
+class Command(BaseCommand):
+    help = 'Clone a question with its choices and allowed voters for the next round'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', type=str, help='ID of Question to clone')
+        parser.add_argument('--text', type=str, help='Text of the clone (default: the text of the question)')
+        parser.add_argument('--start', type=str,
+                            help='Start of the collection phase, e.g. 2024-05-01T12:00 (default: now) - '
+                                 'the other dates keep their distance to it')
+        parser.add_argument('--review-status', action='append', choices=[c[0] for c in Choice.REVIEW_STATUS_CHOICES],
+                            help='Copy the choices with this review status (repeatable, default: APPROVED)')
+        parser.add_argument('--no-voters', action='store_true', help='Do not copy the allowed voters')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        try:
+            question = Question.objects.get(pk=options.get('question'))
+        except (Question.DoesNotExist, ValidationError):
+            raise CommandError('Question "{}" does not exist'.format(options.get('question')))
+
+        start = None
+        if options.get('start'):
+            try:
+                start = parse_datetime(options.get('start'))
+            except ValueError:
+                start = None
+            if start is None:
+                raise CommandError('Invalid date "{}"'.format(options.get('start')))
+            if timezone.is_naive(start):
+                start = timezone.make_aware(start)
+
+        result = clone_question(question, text=options.get('text'), collection_start_date=start,
+                                review_statuses=options.get('review_status') or [Choice.APPROVED],
+                                participations=not options.get('no_voters'), batch_size=options.get('batch_size'))
+
+        self.stdout.write(self.style.SUCCESS('Cloned {}: {}'.format(question, result)))
@@ -19,7 +19,7 @@ class Command(BaseCommand):
             res = Voter.create_voter(amount, code_valid_timedelta_days=30)
 
         if res:
-            self.stdout.write(self.style.SUCCESS('Successfully created {} voter(s)'.format(amount)))
+            self.stdout.write(self.style.SUCCESS('Successfully created {} voter(s)'.format(len(res))))
             for voter in res:
                 self.stdout.write(self.style.SUCCESS('Voter: {}'.format(voter.username)))
         else:
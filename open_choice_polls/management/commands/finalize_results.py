@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from open_choice_polls.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Write the final results snapshot of questions whose voting has ended'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=str, help='ID of Question to finalize (default: all)')
+        parser.add_argument('--refresh', action='store_true', help='Discard existing snapshots and finalize again')
+
+    def handle(self, *args, **options):
+        question = options.get('question')
+        refresh = options.get('refresh')
+
+        if question:
+            questions = Question.objects.filter(pk=question)
+        else:
+            questions = Question.objects.filter(results_snapshot__isnull=True)
+
+        for q in questions:
+            if refresh:
+                q.invalidate_results()
+            snapshot = q.finalize_results()
+            if snapshot:
+                self.stdout.write(self.style.SUCCESS('Finalized: {} ({} votes)'.format(q, snapshot.total_votes)))
+            else:
+                self.stdout.write(self.style.WARNING('Voting has not ended: {}'.format(q)))
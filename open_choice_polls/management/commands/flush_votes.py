@@ -0,0 +1,41 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+from open_choice_polls import settings
+from open_choice_polls.vote_buffer import VoteBuffer
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Apply the votes of the write-behind vote buffer (OPEN_CHOICE_POLLS_VOTE_BUFFER)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Flush once and exit')
+        parser.add_argument('--interval', type=int, default=settings.OPEN_CHOICE_POLLS_VOTE_BUFFER_FLUSH_INTERVAL,
+                            help='Milliseconds between two flushes')
+
+    def handle(self, *args, **options):
+        if not settings.OPEN_CHOICE_POLLS_VOTE_BUFFER:
+            raise CommandError('OPEN_CHOICE_POLLS_VOTE_BUFFER is not set')
+
+        vote_buffer = VoteBuffer(settings.OPEN_CHOICE_POLLS_VOTE_BUFFER)
+        interval = options.get('interval') / 1000.0
+
+        while True:
+            try:
+                votes = vote_buffer.flush()
+            except DatabaseError:
+                if options.get('once'):
+                    raise
+                # the segment stays on disk and is applied by the next flush
+                logger.exception("Flushing the vote buffer failed")
+                votes = 0
+            if votes or options.get('once'):
+                self.stdout.write(self.style.SUCCESS('Flushed {} vote(s)'.format(votes)))
+            if options.get('once'):
+                break
+            time.sleep(interval)
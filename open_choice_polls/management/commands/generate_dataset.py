@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from open_choice_polls.synthetic import BATCH_SIZE, PREFIX, generate
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic data set (questions, choices, voters and votes) for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=5, help='Questions to create')
+        parser.add_argument('--choices', type=int, default=200, help='Suggested choices per question')
+        parser.add_argument('--voters', type=int, default=1000, help='Voters to create (allowed on every question)')
+        parser.add_argument('--votes', type=int, default=10000,
+                            help='Votes in total (split between the questions in or after their voting phase)')
+        parser.add_argument('--seed', type=int, default=0, help='Seed of the random numbers')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Exponent of the Zipf distribution of the votes')
+        parser.add_argument('--password', default='synthetic', help='Password of all created voters')
+        parser.add_argument('--prefix', default=PREFIX, help='Username prefix of the created voters')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        for name in ('questions', 'choices', 'voters', 'votes', 'batch_size'):
+            if options[name] < (1 if name == 'batch_size' else 0):
+                raise CommandError('--{} must not be negative'.format(name.replace('_', '-')))
+
+        start = time.perf_counter()
+        result = generate(questions=options['questions'], choices=options['choices'], voters=options['voters'],
+                          votes=options['votes'], seed=options['seed'], zipf=options['zipf'],
+                          password=options['password'], prefix=options['prefix'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS('Generated {} in {:.1f}s'.format(result, time.perf_counter() - start)))
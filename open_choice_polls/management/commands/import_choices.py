@@ -0,0 +1,43 @@
+import io
+import sys
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from open_choice_polls.choice_import import FORMATS, guess_format, import_choices, read_choice_texts
+from open_choice_polls.models import Choice, Question
+
+
+class Command(BaseCommand):
+    help = 'Import choices of a question from a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', type=str, help='ID of Question to add the choices to')
+        parser.add_argument('file', type=str, help='CSV/JSONL file to import ("-" for stdin)')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the file name)')
+        parser.add_argument('--review-status', choices=[c[0] for c in Choice.REVIEW_STATUS_CHOICES],
+                            default=Choice.OPEN, help='Review status of the imported choices')
+        parser.add_argument('--batch-size', type=int, default=500, help='Choices per INSERT/transaction')
+
+    def handle(self, *args, **options):
+        try:
+            question = Question.objects.get(pk=options.get('question'))
+        except (Question.DoesNotExist, ValidationError):
+            raise CommandError('Question "{}" does not exist'.format(options.get('question')))
+
+        filename = options.get('file')
+        fmt = options.get('format') or guess_format(filename)
+
+        if filename == '-':
+            lines = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            try:
+                lines = open(filename, encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError('Can not read "{}": {}'.format(filename, e.strerror))
+
+        with lines:
+            result = import_choices(question, read_choice_texts(lines, fmt),
+                                    review_status=options.get('review_status'),
+                                    batch_size=options.get('batch_size'))
+
+        self.stdout.write(self.style.SUCCESS('Imported choices of {}: {}'.format(question, result)))
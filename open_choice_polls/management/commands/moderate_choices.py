@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from open_choice_polls.models import Question
+from open_choice_polls.moderation import ModerationEngine
+
+
+class Command(BaseCommand):
+    help = 'Apply the moderation rules to the open choices of questions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=str, help='ID of Question to moderate (default: all)')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the choices each rule would change')
+
+    def handle(self, *args, **options):
+        question = options.get('question')
+        dry_run = options.get('dry_run')
+
+        questions = Question.objects.filter(pk=question) if question else Question.objects.all()
+
+        for q in questions:
+            counts = ModerationEngine.for_question(q).run(q.choice_set.all(), dry_run=dry_run)
+            self.stdout.write(self.style.SUCCESS('{}{}: {} choice(s) moderated'.format(
+                'Dry run - ' if dry_run else '', q, sum(count for _, count in counts))))
+            for rule, count in counts:
+                self.stdout.write('    {:>7}  {}'.format(count, rule))
@@ -0,0 +1,73 @@
+import logging
+import threading
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+from open_choice_polls import moderation_queue, settings
+from open_choice_polls.models import ModerationTask
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Moderate the suggestions queued with OPEN_CHOICE_POLLS_MODERATION_QUEUE'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--threads', type=int, default=1, help='Worker threads (each with its own connection)')
+        parser.add_argument('--batch-size', type=int, default=moderation_queue.BATCH_SIZE,
+                            help='Tasks claimed at a time')
+        parser.add_argument('--lease', type=int, default=int(moderation_queue.LEASE.total_seconds()),
+                            help='Seconds until the tasks of a worker that did not finish are claimed again')
+        parser.add_argument('--max-attempts', type=int, default=moderation_queue.MAX_ATTEMPTS,
+                            help='Claims of a task before it is given up')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls of an empty queue')
+
+    def handle(self, *args, **options):
+        if not settings.OPEN_CHOICE_POLLS_MODERATION_QUEUE:
+            raise CommandError('OPEN_CHOICE_POLLS_MODERATION_QUEUE is not set')
+        if options.get('threads') < 1 or options.get('batch_size') < 1:
+            raise CommandError('--threads and --batch-size must be at least 1')
+
+        self.stop = threading.Event()
+        self.kwargs = {'batch_size': options.get('batch_size'), 'lease': timedelta(seconds=options.get('lease')),
+                       'max_attempts': options.get('max_attempts'), 'interval': options.get('interval'),
+                       'once': options.get('once')}
+
+        if options.get('threads') == 1:
+            self.work()
+        else:
+            threads = [threading.Thread(target=self.work_in_thread, name='moderation-worker-{}'.format(number))
+                       for number in range(options.get('threads'))]
+            for thread in threads:
+                thread.start()
+            try:
+                for thread in threads:
+                    thread.join()
+            except KeyboardInterrupt:
+                self.stop.set()
+                for thread in threads:
+                    thread.join()
+
+        self.stdout.write(self.style.SUCCESS('{} suggestion(s) waiting for moderation'.format(
+            ModerationTask.objects.count())))
+
+    def work(self):
+        while not self.stop.is_set():
+            try:
+                moderation_queue.run(stop=self.stop, **self.kwargs)
+                return
+            except DatabaseError:
+                if self.kwargs['once']:
+                    raise
+                # the claimed tasks are claimed again when their lease has expired
+                logger.exception("Moderating suggestions failed")
+                self.stop.wait(self.kwargs['interval'])
+
+    def work_in_thread(self):
+        try:
+            self.work()
+        finally:
+            connections.close_all()
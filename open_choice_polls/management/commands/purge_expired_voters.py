@@ -0,0 +1,40 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError
+from open_choice_polls.purge import BATCH_SIZE, expired_voters, purge_expired_voters
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Delete voters that never enrolled and whose enrollment code has expired'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only count the expired voters')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Voters deleted per transaction')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Keep running and purge every INTERVAL seconds (default: purge once and exit)')
+
+    def handle(self, *args, **options):
+        if options.get('dry_run'):
+            self.stdout.write(self.style.SUCCESS('{} expired voter(s)'.format(expired_voters().count())))
+            return
+
+        interval = options.get('interval')
+        while True:
+            try:
+                deleted = purge_expired_voters(batch_size=options.get('batch_size'))
+            except DatabaseError:
+                if not interval:
+                    raise
+                # the remaining voters are purged next time
+                logger.exception("Purging expired voters failed")
+                deleted = 0
+            if deleted or not interval:
+                self.stdout.write(self.style.SUCCESS('Purged {} expired voter(s)'.format(deleted)))
+            if not interval:
+                break
+            time.sleep(interval)
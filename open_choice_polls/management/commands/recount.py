@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from open_choice_polls.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Recount the counters of questions (total choices, approved choices, votes and allowed voters)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--question', type=str, help='ID of Question to recount (default: all)')
+
+    def handle(self, *args, **options):
+        question = options.get('question')
+
+        questions = Question.objects.filter(pk=question) if question else Question.objects.all()
+        # the counters of archived questions keep the values they had when they were archived
+        questions = questions.filter(archive__isnull=True)
+        before = {q[0]: q[1:] for q in questions.values_list('pk', *Question.COUNTER_FIELDS)}
+
+        questions.update_counters()
+
+        for q in questions:
+            counters = tuple(getattr(q, name) for name in Question.COUNTER_FIELDS)
+            if before.get(q.pk) != counters:
+                self.stdout.write(self.style.WARNING('Repaired: {} {} -> {}'.format(q, before.get(q.pk), counters)))
+        self.stdout.write(self.style.SUCCESS('Recounted {} question(s)'.format(len(before))))
@@ -0,0 +1,25 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from open_choice_polls import settings
+from open_choice_polls.archive import BATCH_SIZE, restore_question
+from open_choice_polls.models import Question
+
+
+class Command(BaseCommand):
+    help = 'Restore an archived question from its archive file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('question', type=str, help='ID of Question to restore')
+        parser.add_argument('--keep-file', action='store_true', help='Do not delete the archive file')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        if not settings.OPEN_CHOICE_POLLS_ARCHIVE_DIR:
+            raise CommandError('OPEN_CHOICE_POLLS_ARCHIVE_DIR is not set')
+        try:
+            question = Question.objects.get(pk=options.get('question'), archive__isnull=False)
+        except (Question.DoesNotExist, ValidationError):
+            raise CommandError('Archived question "{}" does not exist'.format(options.get('question')))
+
+        result = restore_question(question, keep_file=options.get('keep_file'), batch_size=options.get('batch_size'))
+        self.stdout.write(self.style.SUCCESS('Restored {}: {}'.format(question, result)))
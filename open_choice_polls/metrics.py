@@ -0,0 +1,305 @@
+"""Prometheus metrics
+
+Counters and histograms exposed in the Prometheus text format by the
+``metrics`` view. Without ``OPEN_CHOICE_POLLS_METRICS_DIR`` the values are
+kept in the memory of each process, so with several worker processes every
+scrape only sees the process that answered it.
+
+With ``OPEN_CHOICE_POLLS_METRICS_DIR`` set, each process keeps its values in
+its own memory mapped file ``metrics-<pid>.db`` in that directory and the
+view adds up the files of all processes - including the ones that have
+exited, so counters never go backwards when a worker is restarted. The
+directory has to be emptied when the application is (re)started.
+
+File layout: the number of bytes used (4 bytes), then one entry per sample -
+the length of the key (4 bytes), the key (UTF-8, padded to 8 bytes) and the
+value (double). Only the owning process writes its file; a new entry is
+written before the used bytes are updated, so readers never see half of one.
+"""
+import bisect
+import glob
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+from . import settings
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0, float('inf'))
+
+
+class MemoryValues:
+    """Sample values of this process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, key, amount):
+        with self.lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def items(self):
+        with self.lock:
+            return list(self._values.items())
+
+
+class MmapValues:
+    """Sample values of this process in a memory mapped file - see the module docstring"""
+
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < self.INITIAL_SIZE:
+            self._file.truncate(self.INITIAL_SIZE)
+            size = self.INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = struct.unpack_from('i', self._map, 0)[0] or 8
+        self._positions = {key: pos for key, _, pos in read_entries(self._map, self._used)}
+
+    def _add_entry(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (8 - (4 + len(encoded)) % 8)
+        entry = struct.pack('i{}sd'.format(len(padded)), len(encoded), padded, 0.0)
+        if self._used + len(entry) > len(self._map):
+            size = len(self._map)
+            while self._used + len(entry) > size:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        self._map[self._used:self._used + len(entry)] = entry
+        self._positions[key] = self._used + len(entry) - 8
+        self._used += len(entry)
+        struct.pack_into('i', self._map, 0, self._used)
+
+    def inc(self, key, amount):
+        with self.lock:
+            if key not in self._positions:
+                self._add_entry(key)
+            pos = self._positions[key]
+            struct.pack_into('d', self._map, pos, struct.unpack_from('d', self._map, pos)[0] + amount)
+
+    def items(self):
+        with self.lock:
+            return [(key, value) for key, value, _ in read_entries(self._map, self._used)]
+
+
+def read_entries(data, used):
+    """(key, value, position of the value) of the entries of a metrics file"""
+    pos = 8
+    while pos < used:
+        length = struct.unpack_from('i', data, pos)[0]
+        key = bytes(data[pos + 4:pos + 4 + length]).decode('utf-8')
+        pos += 4 + length
+        pos += 8 - pos % 8
+        yield key, struct.unpack_from('d', data, pos)[0], pos
+        pos += 8
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < 8:
+        return []
+    return [(key, value) for key, value, _ in read_entries(data, struct.unpack_from('i', data, 0)[0])]
+
+
+_values = None
+_values_pid = None
+_values_lock = threading.Lock()
+
+
+def get_values():
+    """the sample values of this process (a new file after a fork)"""
+    global _values, _values_pid
+    pid = os.getpid()
+    if _values_pid != pid:
+        with _values_lock:
+            if _values_pid != pid:
+                directory = settings.OPEN_CHOICE_POLLS_METRICS_DIR
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                    _values = MmapValues(os.path.join(directory, 'metrics-{}.db'.format(pid)))
+                else:
+                    _values = MemoryValues()
+                _values_pid = pid
+    return _values
+
+
+def collect():
+    """{key: value} of all processes"""
+    directory = settings.OPEN_CHOICE_POLLS_METRICS_DIR
+    if not directory:
+        return dict(get_values().items())
+
+    get_values()  # the file of this process exists even before its first sample
+    totals = {}
+    for path in sorted(glob.glob(os.path.join(directory, 'metrics-*.db'))):
+        for key, value in read_file(path):
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+REGISTRY = []
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _labels(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError("{} needs the labels {}".format(self.name, ', '.join(self.labelnames)))
+        return [[name, str(labels[name])] for name in self.labelnames]
+
+    def _inc(self, suffix, labels, amount):
+        get_values().inc(json.dumps([self.name, suffix, labels]), amount)
+
+    def samples(self, values):
+        """(sample name, labels, value) of this metric from the collected values"""
+        for key, value in sorted(values.items()):
+            name, suffix, labels = json.loads(key)
+            if name == self.name:
+                yield self.name + suffix, labels, value
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self._inc('_total', self._labels(labels), amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != float('inf'):
+            self.buckets += (float('inf'),)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        # only the smallest bucket is written - the buckets are made cumulative when collected
+        bound = self.buckets[bisect.bisect_left(self.buckets, value)]
+        self._inc('_bucket', labels + [['le', format_value(bound)]], 1)
+        self._inc('_sum', labels, value)
+        self._inc('_count', labels, 1)
+
+    def samples(self, values):
+        buckets = {}
+        for name, labels, value in super().samples(values):
+            if name.endswith('_bucket'):
+                buckets.setdefault(tuple(map(tuple, labels[:-1])), {})[float(labels[-1][1])] = value
+            else:
+                yield name, labels, value
+        for labels, counts in sorted(buckets.items()):
+            cumulative = 0.0
+            for bound in self.buckets:
+                cumulative += counts.get(bound, 0.0)
+                yield self.name + '_bucket', list(labels) + [['le', format_value(bound)]], cumulative
+
+
+class Gauge(Metric):
+    """A value read by `function` whenever the metrics are collected (None: no sample)"""
+    type = 'gauge'
+
+    def __init__(self, name, documentation, function):
+        super().__init__(name, documentation)
+        self.function = function
+
+    def samples(self, values):
+        try:
+            value = self.function()
+        except Exception:
+            logger.exception("Reading the gauge %s failed", self.name)
+            return
+        if value is not None:
+            yield self.name, [], value
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def exposition():
+    """all metrics in the Prometheus text format"""
+    values = collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(metric.name, metric.type))
+        for name, labels, value in metric.samples(values):
+            label_str = ','.join('{}="{}"'.format(k, escape(v)) for k, v in labels)
+            lines.append('{}{} {}'.format(name, '{' + label_str + '}' if label_str else '', format_value(value)))
+
+    # ratios are derived from the aggregated counters
+    lines.append('# HELP ocp_cache_hit_ratio Hits / requests of the caches')
+    lines.append('# TYPE ocp_cache_hit_ratio gauge')
+    requests = {}
+    for name, labels, value in CACHE_REQUESTS.samples(values):
+        labels = dict(labels)
+        hits, total = requests.get(labels['cache'], (0.0, 0.0))
+        requests[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0.0), total + value)
+    for cache, (hits, total) in sorted(requests.items()):
+        lines.append('ocp_cache_hit_ratio{{cache="{}"}} {}'.format(escape(cache), format_value(hits / total)))
+    return '\n'.join(lines) + '\n'
+
+
+def get_sample_value(name, **labels):
+    """value of a sample (e.g. "ocp_votes_total") of all processes - None if there is none"""
+    values = collect()
+    for metric in REGISTRY:
+        for sample_name, sample_labels, value in metric.samples(values):
+            if sample_name == name and dict(sample_labels) == labels:
+                return value
+    return None
+
+
+class MetricsMiddleware:
+    """Time each request by the name of the view that handled it"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        VIEW_DURATION.observe(time.perf_counter() - start, view=match.view_name if match else '<unresolved>',
+                              method=request.method if request.method in ('GET', 'HEAD', 'POST') else 'other')
+        return response
+
+
+VOTES = Counter('ocp_votes', 'Votes cast', ['buffered'])
+VOTES_REJECTED = Counter('ocp_votes_rejected', 'Votes (and vote pages) rejected', ['reason'])
+SUGGESTIONS = Counter('ocp_suggestions', 'Choices suggested')
+ENROLLMENTS = Counter('ocp_enrollments', 'Enrollments', ['result'])
+SIGN_INS = Counter('ocp_sign_ins', 'Sign ins of voters', ['result'])
+CACHE_REQUESTS = Counter('ocp_cache_requests', 'Cache lookups', ['cache', 'result'])
+VIEW_DURATION = Histogram('ocp_view_duration_seconds', 'Time to answer a request', ['view', 'method'])
+MODERATED = Counter('ocp_moderated_choices', 'Suggestions moderated by the moderation worker', ['result'])
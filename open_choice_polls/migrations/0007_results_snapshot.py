@@ -0,0 +1,31 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0006_remove_dj_ext'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='choice',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, verbose_name='date modified'),
+        ),
+        migrations.CreateModel(
+            name='ResultsSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('total_votes', models.PositiveIntegerField(default=0)),
+                ('allowed_voters', models.PositiveIntegerField(default=0)),
+                ('participating_voters', models.PositiveIntegerField(default=0, help_text='Allowed voters that cast a vote')),
+                ('results_json', models.TextField(default='[]', editable=False)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='results_snapshot', to='open_choice_polls.Question')),
+            ],
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:40
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicate_participations(apps, schema_editor):
+    """merge duplicate (voter, question) rows into the oldest one
+
+    The merged row is allowed if any duplicate was allowed and counts the
+    votes cast through all of them.
+    """
+    Participation = apps.get_model('open_choice_polls', 'Participation')
+    db_alias = schema_editor.connection.alias
+
+    duplicates = Participation.objects.using(db_alias).values('voter', 'question'). \
+        annotate(rows=Count('id'), keep=Min('id')).filter(rows__gt=1)
+
+    for duplicate in duplicates:
+        rows = list(Participation.objects.using(db_alias).
+                    filter(voter=duplicate['voter'], question=duplicate['question']))
+        keep = next(row for row in rows if row.id == duplicate['keep'])
+        keep.is_allowed = any(row.is_allowed for row in rows)
+        keep.votes_cast = sum(row.votes_cast for row in rows)
+        keep.save()
+        Participation.objects.using(db_alias).filter(pk__in=[row.id for row in rows if row.id != keep.id]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0007_results_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_participations, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='participation',
+            unique_together={('voter', 'question')},
+        ),
+    ]
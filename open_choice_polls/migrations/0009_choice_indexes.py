@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:42
+
+from django.db import migrations, models
+
+CHOICE_LOWER_TEXT_INDEX = 'choice_status_lower_text_idx'
+
+
+def create_lower_text_index(apps, schema_editor):
+    """functional index matching the default ordering of choices (Lower('choice_text'))"""
+    expression = 'LOWER(choice_text)'
+    if schema_editor.connection.vendor == 'mysql':
+        expression = '({})'.format(expression)  # MySQL 8.0.13+ wants key parts in parentheses
+    schema_editor.execute('CREATE INDEX {} ON open_choice_polls_choice (question_id, review_status, {})'.format(
+        CHOICE_LOWER_TEXT_INDEX, expression))
+
+
+def drop_lower_text_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP INDEX {} ON open_choice_polls_choice'.format(CHOICE_LOWER_TEXT_INDEX))
+    else:
+        schema_editor.execute('DROP INDEX {}'.format(CHOICE_LOWER_TEXT_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0008_participation_unique_voter_question'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(fields=['question', 'review_status', '-votes'], name='choice_status_votes_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(fields=['question', 'choice_text'], name='choice_text_idx'),
+        ),
+        migrations.RunPython(create_lower_text_index, drop_lower_text_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0009_choice_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoterIdPool',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('range_start', models.PositiveIntegerField()),
+                ('range_end', models.PositiveIntegerField()),
+                ('key', models.CharField(editable=False, max_length=32)),
+                ('next_index', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('range_start', 'range_end')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0010_voter_id_pool'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0, help_text='Rules are checked in ascending order')),
+                ('kind', models.CharField(choices=[('REGEX', 'matches regular expression'), ('NOT_REGEX', 'does not match regular expression'), ('MIN_LENGTH', 'shorter than'), ('MAX_LENGTH', 'longer than'), ('BANNED', 'contains one of the words (one per line)'), ('DUPLICATE', 'duplicate of an approved choice (ignoring case)')], max_length=10)),
+                ('value', models.TextField(blank=True, help_text='Regular expression, length or banned words')),
+                ('action', models.CharField(choices=[('APPROVED', 'approve'), ('REJECTED', 'reject')], default='REJECTED', max_length=8)),
+                ('remark', models.CharField(blank=True, help_text='Review remark of matching choices (default: the rule)', max_length=200)),
+                ('is_active', models.BooleanField(default=True)),
+                ('question', models.ForeignKey(blank=True, help_text='Leave empty for rules that apply to all questions', null=True, on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Question')),
+            ],
+            options={
+                'ordering': ('position', 'id'),
+            },
+        ),
+    ]
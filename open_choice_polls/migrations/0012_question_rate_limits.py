@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:50
+
+from django.db import migrations, models
+import open_choice_polls.ratelimit
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0011_moderation_rule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='suggestion_rate_limit',
+            field=models.CharField(blank=True, help_text='Suggestions per question, e.g. 100/m (s, m, h or d) - leave empty for the default', max_length=16, validators=[open_choice_polls.ratelimit.validate_rate], verbose_name='suggestion rate limit'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='vote_rate_limit',
+            field=models.CharField(blank=True, help_text='Votes per question, e.g. 1000/m (s, m, h or d) - leave empty for the default', max_length=16, validators=[open_choice_polls.ratelimit.validate_rate], verbose_name='vote rate limit'),
+        ),
+    ]
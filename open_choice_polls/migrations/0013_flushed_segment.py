@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0012_question_rate_limits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlushedSegment',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('votes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:54
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def count(apps, schema_editor):
+    Question = apps.get_model('open_choice_polls', 'Question')
+    db_alias = schema_editor.connection.alias
+
+    approved = Q(choice__review_status='APPROVED')
+    for question in Question.objects.using(db_alias).annotate(
+            choices=Count('choice'), approved_choices=Count('choice', filter=approved),
+            votes=Sum('choice__votes', filter=approved)):
+        Question.objects.using(db_alias).filter(pk=question.pk).update(
+            total_choices=question.choices,
+            total_approved_choices=question.approved_choices,
+            total_votes=question.votes or 0,
+            allowed_voters=question.participation_set.filter(is_allowed=True).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0013_flushed_segment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='allowed_voters',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_approved_choices',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_choices',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='total_votes',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Votes of the approved choices'),
+        ),
+        migrations.RunPython(count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-19 13:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0014_question_counters'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='voter',
+            name='enrollment_code',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=80, verbose_name='Enrollment Code'),
+        ),
+        migrations.AlterField(
+            model_name='voter',
+            name='enrollment_code_valid_until',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Leave empty for codes that never expire', null=True, verbose_name='Enrollment Code valid until'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:04
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def restore_lower_text_index(apps, schema_editor):
+    """SQLite rebuilds the choice table for the new field - which drops the raw index of migration 0009"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS choice_status_lower_text_idx '
+                              'ON open_choice_polls_choice (question_id, review_status, LOWER(choice_text))')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0015_voter_code_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='choice',
+            name='ballot_index',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='counting_method',
+            field=models.CharField(choices=[('PLURALITY', 'plurality (one choice per vote)'), ('IRV', 'instant-runoff (ranked choices)'), ('BORDA', 'Borda count (ranked choices)')], default='PLURALITY', max_length=10, verbose_name='counting method'),
+        ),
+        migrations.AddField(
+            model_name='question',
+            name='ranked_choices',
+            field=models.PositiveSmallIntegerField(default=3, help_text='Choices a voter ranks on a ballot (ranked counting methods only)', validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(100)], verbose_name='number of ranked choices'),
+        ),
+        migrations.AddField(
+            model_name='resultssnapshot',
+            name='rounds_json',
+            field=models.TextField(default='[]', editable=False),
+        ),
+        migrations.AlterUniqueTogether(
+            name='choice',
+            unique_together={('question', 'ballot_index')},
+        ),
+        migrations.CreateModel(
+            name='Ballot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('ranking', models.BinaryField()),
+                ('participation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Participation')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Question')),
+            ],
+        ),
+        migrations.RunPython(restore_lower_text_index, migrations.RunPython.noop),
+    ]
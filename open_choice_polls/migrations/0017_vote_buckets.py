@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0016_ranked_ballots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VoteBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seconds', models.PositiveIntegerField(default=60, help_text='Length of the bucket')),
+                ('start', models.DateTimeField()),
+                ('votes', models.PositiveIntegerField(default=0)),
+                ('choice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Question')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='votebucket',
+            index=models.Index(fields=['question', 'start'], name='votebucket_question_start_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='votebucket',
+            unique_together={('choice', 'seconds', 'start')},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0017_vote_buckets'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='choice',
+            index=models.Index(fields=['question', 'modified'], name='choice_modified_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 2.2.28 on 2026-10-19 16:40
+
+from django.db import migrations
+
+# external content FTS5 table: the index only, the texts stay in the choice table (see search.py)
+FTS = 'open_choice_polls_choice_fts'
+COLUMNS = 'choice_text, question_id, review_status'
+NEW = 'new.rowid, new.choice_text, new.question_id, new.review_status'
+OLD = "'delete', old.rowid, old.choice_text, old.question_id, old.review_status"
+
+CREATE_FTS = [
+    "CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='open_choice_polls_choice', content_rowid='rowid', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER {fts}_insert AFTER INSERT ON open_choice_polls_choice BEGIN "
+    "INSERT INTO {fts} (rowid, {columns}) VALUES ({new}); END",
+    "CREATE TRIGGER {fts}_delete AFTER DELETE ON open_choice_polls_choice BEGIN "
+    "INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ({old}); END",
+    "CREATE TRIGGER {fts}_update AFTER UPDATE OF {columns} ON open_choice_polls_choice BEGIN "
+    "INSERT INTO {fts} ({fts}, rowid, {columns}) VALUES ({old}); "
+    "INSERT INTO {fts} (rowid, {columns}) VALUES ({new}); END",
+    "INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+]
+
+DROP_FTS = [
+    "DROP TRIGGER IF EXISTS open_choice_polls_choice_fts_insert",
+    "DROP TRIGGER IF EXISTS open_choice_polls_choice_fts_delete",
+    "DROP TRIGGER IF EXISTS open_choice_polls_choice_fts_update",
+    "DROP TABLE IF EXISTS open_choice_polls_choice_fts",
+]
+
+
+def fts5_available(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+        return bool(cursor.fetchone()[0])
+
+
+def create_choice_fts(apps, schema_editor):
+    """full-text index of the choices on SQLite with FTS5 - other databases search with LIKE"""
+    if schema_editor.connection.vendor != 'sqlite' or not fts5_available(schema_editor.connection):
+        return
+    for sql in CREATE_FTS:
+        schema_editor.execute(sql.format(fts=FTS, columns=COLUMNS, new=NEW, old=OLD))
+
+
+def drop_choice_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_FTS:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0018_choice_modified_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_choice_fts, drop_choice_fts),
+    ]
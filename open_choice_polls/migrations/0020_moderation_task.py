@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0019_choice_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of times a worker claimed the task')),
+                ('locked_by', models.CharField(blank=True, help_text='Claim of the worker processing the task', max_length=32)),
+                ('locked_until', models.DateTimeField(blank=True, help_text='End of the lease of the claim', null=True)),
+                ('choice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Choice')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='open_choice_polls.Question')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='moderationtask',
+            index=models.Index(fields=['locked_until'], name='moderationtask_lease_idx'),
+        ),
+    ]
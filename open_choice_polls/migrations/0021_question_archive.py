@@ -0,0 +1,28 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0020_moderation_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='date created')),
+                ('file_name', models.CharField(max_length=200, unique=True)),
+                ('size', models.BigIntegerField(default=0, help_text='Bytes')),
+                ('choices', models.PositiveIntegerField(default=0)),
+                ('participations', models.PositiveIntegerField(default=0)),
+                ('voters', models.PositiveIntegerField(default=0, help_text='Voters (and their users) that were archived')),
+                ('ballots', models.PositiveIntegerField(default=0)),
+                ('question', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='open_choice_polls.Question')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.28 on 2026-10-19 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('open_choice_polls', '0021_question_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='question',
+            name='votes_per_session',
+            field=models.PositiveSmallIntegerField(default=5, help_text='Plurality only - a voter casts one ballot on ranked questions', verbose_name='number of votes allowed per (cookie-based session)'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ballot',
+            unique_together={('question', 'participation')},
+        ),
+    ]
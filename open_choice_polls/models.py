@@ -1,27 +1,41 @@
-import random
+import itertools
+import json
+import logging
+import os
 import re
 import uuid
 from datetime import timedelta
 
 from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
 from django.core.exceptions import ValidationError
-from django.db import models, IntegrityError
-from django.db.models import Q
-from django.db.models.functions import Lower
-from django.db.models.signals import post_save, post_delete
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import connections, models, router, transaction, IntegrityError
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Lower, Trunc
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
-from open_choice_polls import settings
+from open_choice_polls import archive_file, metrics, settings, tally
+from open_choice_polls.ratelimit import validate_rate
+from open_choice_polls.voter_ids import Permutation
+
+logger = logging.getLogger(__name__)
 
 SELECTED_LETTERS = 'ABCDEFGHKMNPQRSTUVWX'
 SELECTED_NUMBERS = '23456789'
 
+# session key holding the Voter id of the signed-in user
+VOTER_ID_SESSION_KEY = '_ocp_voter_id'
+
 
 class ActiveVoterManager(models.Manager):
     def get_queryset(self):
@@ -37,14 +51,14 @@ class Voter(models.Model):
     is_enrolled = models.BooleanField(default=False, editable=True,
                                       verbose_name=_('Is Enrolled?'))
 
-    enrollment_code = models.CharField(max_length=80, blank=True, editable=False,
+    enrollment_code = models.CharField(max_length=80, blank=True, editable=False, db_index=True,
                                        verbose_name=_('Enrollment Code'))
 
     enrollment_code_is_distributed = models.BooleanField(default=False, editable=True,
                                                          verbose_name=_('Is Distributed?'))
 
     enrollment_code_valid_until = models.DateTimeField(verbose_name=_('Enrollment Code valid until'),
-                                                       blank=True, null=True,
+                                                       blank=True, null=True, db_index=True,
                                                        help_text=_("Leave empty for codes that never expire"))
 
     # MANAGERS
@@ -68,6 +82,14 @@ class Voter(models.Model):
     def get_absolute_url(self):
         return reverse('open_choice_polls:voter-detail', kwargs={'username': self.user})
 
+    def get_dirty_fields(self):
+        """names of the fields changed since the voter was loaded or saved"""
+        return [name for name, value in self._loaded_values.items() if self.__dict__.get(name) != value]
+
+    @property
+    def enrollment_code_is_expired(self):
+        return bool(self.enrollment_code_valid_until and self.enrollment_code_valid_until < timezone.now())
+
     @staticmethod
     def create_enrollment_code():
         first = get_random_string(5, SELECTED_LETTERS)
@@ -84,42 +106,116 @@ class Voter(models.Model):
 
     @classmethod
     def create_voter(cls, amount=1, code_valid_timedelta_days=None, question_id=None):
-        """ creates **upto** `amount` voters - duplicate random ids will not create a new voter"""
+        """ creates **upto** `amount` voters - fewer when the voter id range is used up"""
         if amount < 1:
             raise NotImplementedError("create at least 1 Voter!")
 
-        prefix = settings.OPEN_CHOICE_POLLS_VOTER_PREFIX
-
-        ids_rand = random.sample(range(settings.OPEN_CHOICE_POLLS_VOTER_RANGE_START,
-                                       settings.OPEN_CHOICE_POLLS_VOTER_RANGE_END), amount)
+        question = None
+        if question_id:
+            try:
+                question = Question.objects.get(pk=question_id)
+            except Question.DoesNotExist:
+                pass
 
         res = []
-        for i in ids_rand:
+        for voter_username in VoterIdPool.allocate_usernames(amount):
             # Create user and save to the database
-            voter_username = '{}{}'.format(prefix, str(i).zfill(3))
             try:
-                enrollment_code = Voter.create_enrollment_code()
-                user = User.objects.create_user(voter_username, password=enrollment_code)
+                with transaction.atomic():
+                    enrollment_code = Voter.create_enrollment_code()
+                    user = User.objects.create_user(voter_username, password=enrollment_code)
 
-                user.voter.is_voter = True
-                user.voter.enrollment_code = enrollment_code
-                if code_valid_timedelta_days:
-                    user.voter.enrollment_code_valid_until = timezone.now() + timedelta(days=code_valid_timedelta_days)
+                    user.voter.is_voter = True
+                    user.voter.enrollment_code = enrollment_code
+                    if code_valid_timedelta_days:
+                        user.voter.enrollment_code_valid_until = \
+                            timezone.now() + timedelta(days=code_valid_timedelta_days)
 
-                if question_id:
-                    try:
-                        question = Question.objects.get(pk=question_id)
+                    if question:
                         user.voter.participation_set.create(voter=user.voter, question=question, is_allowed=True)
-                    except Question.DoesNotExist:
-                        pass
-                user.save()
-
-                res.append(user)
+                    user.save()
             except IntegrityError:
-                break
+                # username taken since it was allocated (e.g. created in the admin)
+                logger.warning("Voter username %s taken - skipped", voter_username)
+                continue
+
+            res.append(user)
         return res
 
 
+class VoterIdPool(models.Model):
+    """Counter of the voter ids handed out from a range
+
+    Index ``n`` of the pool is mapped to a voter id by a permutation keyed with
+    ``key``, so consecutive indices give random looking, never repeating ids.
+    Allocating a batch is a single atomic increment of ``next_index`` - jobs
+    running at the same time get disjoint batches.
+    """
+    # DATABASE FIELDS
+    range_start = models.PositiveIntegerField()
+    range_end = models.PositiveIntegerField()
+
+    key = models.CharField(max_length=32, editable=False)
+    next_index = models.PositiveIntegerField(default=0)
+
+    # META CLASS
+    class Meta:
+        unique_together = (('range_start', 'range_end'),)
+
+    # REPR and TO STRING METHOD
+    def __str__(self):
+        return "{}-{} ({} used)".format(self.range_start, self.range_end, self.next_index)
+
+    @property
+    def size(self):
+        return self.range_end - self.range_start
+
+    @cached_property
+    def permutation(self):
+        return Permutation(self.size, self.key)
+
+    def voter_id(self, index):
+        return self.range_start + self.permutation[index]
+
+    @classmethod
+    def allocate(cls, amount, range_start=None, range_end=None):
+        """reserve upto `amount` ids of the range - returns the pool and the range of its indices"""
+        range_start = settings.OPEN_CHOICE_POLLS_VOTER_RANGE_START if range_start is None else range_start
+        range_end = settings.OPEN_CHOICE_POLLS_VOTER_RANGE_END if range_end is None else range_end
+
+        with transaction.atomic(using=router.db_for_write(cls)):
+            pool, _ = cls.objects.get_or_create(range_start=range_start, range_end=range_end,
+                                                defaults={'key': get_random_string(32)})
+            cls.objects.filter(pk=pool.pk).update(next_index=F('next_index') + amount)
+            pool.refresh_from_db(fields=['next_index'])
+
+        end = min(pool.next_index, pool.size)
+        start = min(pool.next_index - amount, end)
+        return pool, range(start, end)
+
+    @classmethod
+    def allocate_usernames(cls, amount):
+        """`amount` (or fewer when the range is used up) voter usernames that are not taken"""
+        prefix = settings.OPEN_CHOICE_POLLS_VOTER_PREFIX
+        width = settings.OPEN_CHOICE_POLLS_VOTER_ID_WIDTH
+
+        usernames = []
+        while len(usernames) < amount:
+            pool, indices = cls.allocate(amount - len(usernames))
+            if not indices:
+                logger.warning("Voter id range %s is used up", pool)
+                break
+
+            candidates = ['{}{}'.format(prefix, str(pool.voter_id(i)).zfill(width)) for i in indices]
+            # ids handed out before the pool existed (or by hand) are skipped
+            taken = set()
+            for chunk_start in range(0, len(candidates), 500):
+                taken.update(User.objects.filter(username__in=candidates[chunk_start:chunk_start + 500]).
+                             values_list('username', flat=True))
+            usernames.extend(username for username in candidates if username not in taken)
+        return usernames
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -128,10 +224,27 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    try:
-        instance.voter.save()
-    except Voter.DoesNotExist:
-        pass
+    # only a voter that was loaded (or assigned) and changed through the user - e.g. user.voter.is_enrolled = True
+    if not User.voter.related.is_cached(instance):
+        return
+    voter = instance.voter
+    dirty = voter.get_dirty_fields()
+    if voter.pk and dirty:
+        voter.save(update_fields=dirty)
+
+
+@receiver(post_init, sender=Voter)
+@receiver(post_save, sender=Voter)
+def remember_voter_values(sender, instance, **kwargs):
+    # deferred fields are not loaded
+    instance._loaded_values = {field.attname: instance.__dict__.get(field.attname)
+                               for field in Voter._meta.concrete_fields if not field.primary_key}
+
+
+@receiver(user_logged_in)
+def remember_voter_id(sender, request, user, **kwargs):
+    voter = getattr(user, 'voter', None)
+    request.session[VOTER_ID_SESSION_KEY] = voter.pk if voter else None
 
 
 @receiver(post_delete, sender=Voter)
@@ -140,7 +253,36 @@ def post_delete_user(sender, instance, *args, **kwargs):
         instance.user.delete()
 
 
+class QuestionQuerySet(models.QuerySet):
+
+    def add_to_counters(self, **deltas):
+        """add to the counter columns of the questions, e.g. add_to_counters(total_votes=1)"""
+        deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+        return self.update(**deltas) if deltas else 0
+
+    def update_counters(self):
+        """recount the counter columns of the questions (one UPDATE)"""
+        def count(queryset, aggregate=Count('pk')):
+            return Coalesce(Subquery(queryset.filter(question=OuterRef('pk')).order_by().values('question').
+                                     annotate(value=aggregate).values('value')), 0)
+
+        return self.update(total_choices=count(Choice.objects.all()),
+                           total_approved_choices=count(Choice.approved.all()),
+                           total_votes=count(Choice.approved.all(), Sum('votes')),
+                           allowed_voters=count(Participation.objects.filter(is_allowed=True)))
+
+
 class Question(models.Model):
+    # CHOICES
+    PLURALITY = 'PLURALITY'
+    INSTANT_RUNOFF = 'IRV'
+    BORDA = 'BORDA'
+    COUNTING_METHOD_CHOICES = (
+        (PLURALITY, _('plurality (one choice per vote)')),
+        (INSTANT_RUNOFF, _('instant-runoff (ranked choices)')),
+        (BORDA, _('Borda count (ranked choices)')),
+    )
+
     # DATABASE FIELDS
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
@@ -176,12 +318,40 @@ class Question(models.Model):
     show_voting_results = models.BooleanField(verbose_name=_('show voting results before vote ends'), default=True)
 
     votes_per_session = models.PositiveSmallIntegerField(verbose_name=_('number of votes allowed '
-                                                                        'per (cookie-based session)'), default=5)
+                                                                        'per (cookie-based session)'), default=5,
+                                                         help_text=_('Plurality only - a voter casts one ballot '
+                                                                     'on ranked questions'))
+
+    counting_method = models.CharField(verbose_name=_('counting method'), max_length=10,
+                                       choices=COUNTING_METHOD_CHOICES, default=PLURALITY)
+    ranked_choices = models.PositiveSmallIntegerField(verbose_name=_('number of ranked choices'), default=3,
+                                                      validators=[MinValueValidator(1), MaxValueValidator(100)],
+                                                      help_text=_('Choices a voter ranks on a ballot '
+                                                                  '(ranked counting methods only)'))
+
+    suggestion_rate_limit = models.CharField(verbose_name=_('suggestion rate limit'), max_length=16, blank=True,
+                                             validators=[validate_rate],
+                                             help_text=_("Suggestions per question, e.g. 100/m (s, m, h or d) - "
+                                                         "leave empty for the default"))
+    vote_rate_limit = models.CharField(verbose_name=_('vote rate limit'), max_length=16, blank=True,
+                                       validators=[validate_rate],
+                                       help_text=_("Votes per question, e.g. 1000/m (s, m, h or d) - "
+                                                   "leave empty for the default"))
 
     voter_participation = models.ManyToManyField(Voter, through='Participation')
 
+    # counters - kept up to date by UPDATEs on every write to choices and participations
+    # (repaired by "manage.py recount")
+    total_choices = models.PositiveIntegerField(default=0, editable=False)
+    total_approved_choices = models.PositiveIntegerField(default=0, editable=False)
+    total_votes = models.PositiveIntegerField(default=0, editable=False,
+                                              help_text=_('Votes of the approved choices'))
+    allowed_voters = models.PositiveIntegerField(default=0, editable=False)
+
+    COUNTER_FIELDS = ('total_choices', 'total_approved_choices', 'total_votes', 'allowed_voters')
+
     # MANAGERS
-    objects = models.Manager()  # default
+    objects = QuestionQuerySet.as_manager()  # default
 
     # META CLASS
     class Meta:
@@ -214,6 +384,11 @@ class Question(models.Model):
             if last_number is not None:
                 self.number = last_number + 1
 
+        elif kwargs.get('update_fields') is None:
+            # never write back counters loaded with this instance - they may have changed since
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in self.COUNTER_FIELDS]
+
         super().save(*args, **kwargs)
 
     # ABSOLUTE URL METHOD
@@ -293,24 +468,289 @@ class Question(models.Model):
     def number_text(self):
         return "{0} {1}".format(self.number_zfill, self.text)
 
+    def compute_results(self, using=None):
+        """ranked results (list of dicts) and total votes of the approved choices"""
+        choices = Choice.approved.using(using).filter(question=self.id).order_by('-votes'). \
+            values_list('id', 'choice_text', 'votes')
+        choices = sorted(choices, key=lambda c: (-c[2], c[1].lower()))
+
+        total = sum(votes for _, _, votes in choices)
+        results = []
+        for idx, (choice_id, choice_text, votes) in enumerate(choices):
+            # equal votes share a rank ("1, 2, 2, 4")
+            rank = results[-1]['rank'] if results and results[-1]['votes'] == votes else idx + 1
+            results.append({
+                'rank': rank,
+                'choice_id': str(choice_id),
+                'choice_text': choice_text,
+                'votes': votes,
+                'percentage': float(votes) / total * 100 if total else 0.0,
+            })
+        return results, total
+
     @property
-    def total_choices(self):
-        return self.choice_set.count()
+    def is_ranked(self):
+        return self.counting_method != Question.PLURALITY
 
     @property
-    def total_approved_choices(self):
-        return self.choice_set.filter(review_status=Choice.APPROVED).count()
+    def votes_allowed(self):
+        """votes per participation - one ballot on ranked questions (a ranking must count once)"""
+        return 1 if self.is_ranked else self.votes_per_session
 
     @property
-    def total_votes(self):
-        total = 0
-        for choice in Choice.approved.filter(question=self.id):
-            total += choice.votes
-        return total
+    def ranks(self):
+        """1 .. the number of choices on a ranked ballot"""
+        return range(1, min(self.ranked_choices, self.total_approved_choices) + 1)
+
+    def assign_ballot_indexes(self):
+        """give the approved choices without one a ballot index (the next free one)"""
+        for attempt in range(3):
+            try:
+                with transaction.atomic():
+                    missing = list(self.choice_set.filter(review_status=Choice.APPROVED, ballot_index__isnull=True).
+                                   order_by('created').values_list('pk', flat=True))
+                    if not missing:
+                        return
+                    start = self.choice_set.aggregate(last=models.Max('ballot_index'))['last']
+                    start = 0 if start is None else start + 1
+                    if start + len(missing) > tally.MAX_INDEX:
+                        raise ValueError("too many choices for ranked ballots")
+                    for index, choice_id in enumerate(missing, start):
+                        Choice.objects.filter(pk=choice_id).update(ballot_index=index)
+                return
+            except IntegrityError:
+                # indexes assigned concurrently - try again with the new ones
+                if attempt == 2:
+                    raise
+
+    def compute_rounds(self, using=None):
+        """rounds of the ranked tally - list of {round, results, exhausted, eliminated, winner}
+
+        Results are like compute_results() but with the votes of the round (or
+        the Borda points). Empty for plurality questions.
+        """
+        if not self.is_ranked:
+            return []
+
+        choices = {index: (str(choice_id), choice_text) for index, choice_id, choice_text in
+                   Choice.approved.using(using).filter(question=self.id, ballot_index__isnull=False).
+                   order_by().values_list('ballot_index', 'id', 'choice_text')}
+        ballots = Ballot.objects.using(using).filter(question=self.id).order_by(). \
+            values_list('ranking', flat=True).iterator()
+        data = tally.join_ballots(ballots, self.ranked_choices)
+
+        if self.counting_method == Question.BORDA:
+            tally_rounds = [{'votes': tally.borda(data, self.ranked_choices, choices), 'exhausted': 0,
+                             'eliminated': None, 'winner': None}]
+        else:
+            tally_rounds = tally.instant_runoff(data, self.ranked_choices, choices)
+
+        rounds = []
+        for number, tally_round in enumerate(tally_rounds, 1):
+            votes = sorted(tally_round['votes'].items(), key=lambda item: (-item[1], choices[item[0]][1].lower()))
+            total = sum(count for _, count in votes)
+            rounds.append({
+                'round': number,
+                'results': [{'choice_id': choices[index][0],
+                             'choice_text': choices[index][1],
+                             'votes': count,
+                             'percentage': float(count) / total * 100 if total else 0.0}
+                            for index, count in votes],
+                'exhausted': tally_round['exhausted'],
+                'eliminated': choices[tally_round['eliminated']][1] if tally_round['eliminated'] is not None else None,
+                'winner': choices[tally_round['winner']][1] if tally_round['winner'] is not None else None,
+            })
+        return rounds
+
+    def finalize_results(self):
+        """return the ResultsSnapshot of this question - create it if voting has ended
+
+        Returns None while voting has not ended yet.
+        """
+        if not self.voting_is_in_past():
+            return None
+
+        using = router.db_for_write(ResultsSnapshot)
+        try:
+            snapshot = ResultsSnapshot.objects.using(using).get(question=self)
+            metrics.CACHE_REQUESTS.inc(cache='results_snapshot', result='hit')
+            return snapshot
+        except ResultsSnapshot.DoesNotExist:
+            metrics.CACHE_REQUESTS.inc(cache='results_snapshot', result='miss')
+
+        if self.is_archived:
+            return self.archive.snapshot()
+
+        results, total = self.compute_results(using=using)
+        participations = Participation.objects.using(using).filter(question=self, is_allowed=True)
+        snapshot = ResultsSnapshot(question=self,
+                                   total_votes=total,
+                                   allowed_voters=participations.count(),
+                                   participating_voters=participations.filter(votes_cast__gt=0).count(),
+                                   results_json=json.dumps(results),
+                                   rounds_json=json.dumps(self.compute_rounds(using=using)))
+        try:
+            with transaction.atomic(using=using):
+                snapshot.save(using=using)
+        except IntegrityError:
+            # finalized concurrently by another request
+            return ResultsSnapshot.objects.using(using).get(question=self)
+        VoteBucket.objects.downsample(self)
+        return snapshot
+
+    def invalidate_results(self):
+        """delete the results snapshot - must be called whenever votes change after voting has ended"""
+        ResultsSnapshot.objects.filter(question=self).delete()
 
     @property
-    def allowed_voters(self):
-        return self.participation_set.filter(is_allowed=True).count()
+    def is_archived(self):
+        # the reverse one-to-one accessor caches a missing archive as well
+        return hasattr(self, 'archive')
+
+
+class ResultsSnapshot(models.Model):
+    """Final (ranked) results of a Question - written once when voting has ended"""
+    # DATABASE FIELDS
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='results_snapshot')
+
+    created = models.DateTimeField(verbose_name=_('date created'), auto_now_add=True)
+
+    total_votes = models.PositiveIntegerField(default=0)
+    allowed_voters = models.PositiveIntegerField(default=0)
+    participating_voters = models.PositiveIntegerField(default=0, help_text=_('Allowed voters that cast a vote'))
+
+    # list of {rank, choice_id, choice_text, votes, percentage}
+    results_json = models.TextField(default='[]', editable=False)
+    # ranked questions: list of {round, results, exhausted, eliminated, winner} (see Question.compute_rounds())
+    rounds_json = models.TextField(default='[]', editable=False)
+
+    # REPR and TO STRING METHOD
+    def __repr__(self):
+        return "<{0}: {1}>".format(
+            self.__class__.__name__,
+            self.question_id)
+
+    def __str__(self):
+        return "{}".format(self.question_id)
+
+    # SAVE METHOD
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise IntegrityError("results snapshots are immutable - delete and finalize again instead")
+        super().save(*args, **kwargs)
+
+    @cached_property
+    def results(self):
+        return json.loads(self.results_json)
+
+    @cached_property
+    def rounds(self):
+        return json.loads(self.rounds_json)
+
+    @property
+    def turnout(self):
+        if self.allowed_voters:
+            return float(self.participating_voters) / self.allowed_voters * 100
+        return 0.0
+
+
+class QuestionArchive(models.Model):
+    """Stub of an archived Question - its choices, participations and results are in an archive file
+
+    See ``archive.py``. The counters of the question keep the values they had
+    when it was archived.
+    """
+    # DATABASE FIELDS
+    question = models.OneToOneField(Question, on_delete=models.CASCADE, related_name='archive')
+
+    created = models.DateTimeField(verbose_name=_('date created'), auto_now_add=True)
+
+    # in OPEN_CHOICE_POLLS_ARCHIVE_DIR
+    file_name = models.CharField(max_length=200, unique=True)
+    size = models.BigIntegerField(default=0, help_text=_('Bytes'))
+
+    choices = models.PositiveIntegerField(default=0)
+    participations = models.PositiveIntegerField(default=0)
+    voters = models.PositiveIntegerField(default=0, help_text=_('Voters (and their users) that were archived'))
+    ballots = models.PositiveIntegerField(default=0)
+
+    # REPR and TO STRING METHOD
+    def __repr__(self):
+        return "<{0}: {1}>".format(
+            self.__class__.__name__,
+            self.question_id)
+
+    def __str__(self):
+        return self.file_name
+
+    @property
+    def path(self):
+        return os.path.join(settings.OPEN_CHOICE_POLLS_ARCHIVE_DIR or '', self.file_name)
+
+    def snapshot(self):
+        """the (unsaved) ResultsSnapshot of the question from the archive file"""
+        fields = archive_file.read_results(self.path)[1]['fields']
+        snapshot = ResultsSnapshot(**{field.name: field.to_python(fields[field.name])
+                                      for field in ResultsSnapshot._meta.concrete_fields
+                                      if field.name not in ('id', 'question')})
+        snapshot.question = self.question
+        return snapshot
+
+    def vote_totals(self):
+        """(start, seconds, votes) of the vote buckets - summed up over the choices"""
+        return [(parse_datetime(start), seconds, votes)
+                for start, seconds, votes in archive_file.read_results(self.path)[1]['vote_totals']]
+
+    def vote_buckets(self):
+        """(choice id, start, seconds, votes) of the vote buckets in the archive file"""
+        for record in archive_file.read_records(self.path):
+            if record['type'] == 'votebucket':
+                fields = record['fields']
+                yield uuid.UUID(fields['choice']), parse_datetime(fields['start']), fields['seconds'], fields['votes']
+            elif record['type'] not in ('archive', 'question', 'resultssnapshot'):
+                break  # the vote buckets are the first records after the results
+
+
+class ParticipationManager(models.Manager):
+    def get_allowed(self, voter_id, question_id):
+        """return the Participation of a voter that is allowed to vote on a question (or None)
+
+        Uses the unique (voter, question) index - no join through Voter or User.
+        """
+        try:
+            return self.get_queryset().get(voter_id=voter_id, question_id=question_id, is_allowed=True)
+        except self.model.DoesNotExist:
+            return None
+
+    def grant(self, question, voters, batch_size=500):
+        """allow all `voters` (queryset) to vote on `question` - returns the number of voters newly allowed
+
+        Existing participations are updated with one UPDATE, the missing ones
+        are inserted with bulk_create() (in batches of voter ids).
+        """
+        before = question.participation_set.filter(is_allowed=True).count()
+        with transaction.atomic():
+            self.get_queryset().filter(question=question, voter__in=voters, is_allowed=False).update(is_allowed=True)
+
+            voter_ids = voters.order_by().values_list('pk', flat=True).iterator(chunk_size=batch_size)
+            while True:
+                batch = list(itertools.islice(voter_ids, batch_size))
+                if not batch:
+                    break
+                self.bulk_create([self.model(voter_id=voter_id, question=question, is_allowed=True)
+                                  for voter_id in batch], ignore_conflicts=True)
+
+            # update() and bulk_create() send no signals
+            Question.objects.filter(pk=question.pk).update_counters()
+        return question.participation_set.filter(is_allowed=True).count() - before
+
+    def revoke(self, question, voters):
+        """disallow all `voters` (queryset) to vote on `question` - returns the number of voters"""
+        with transaction.atomic():
+            revoked = self.get_queryset().filter(question=question, voter__in=voters, is_allowed=True). \
+                update(is_allowed=False)
+            Question.objects.filter(pk=question.pk).update_counters()
+        return revoked
 
 
 class Participation(models.Model):
@@ -320,6 +760,13 @@ class Participation(models.Model):
     is_allowed = models.BooleanField(default=False, help_text=_('Is participation (vote) allowed?'))
     votes_cast = models.PositiveIntegerField(default=0, help_text=_('Number of votes cast no Question'))
 
+    # MANAGERS
+    objects = ParticipationManager()
+
+    # META CLASS
+    class Meta:
+        unique_together = (('voter', 'question'),)
+
     # REPR and TO STRING METHOD
     def __repr__(self):
         return "<{}: {} {} {} ({})>".format(
@@ -333,6 +780,26 @@ class Participation(models.Model):
         return "{}_<{}>".format(self.voter.user.username, self.question.number_text)
 
 
+@receiver(post_init, sender=Participation)
+def remember_participation_counts(sender, instance, **kwargs):
+    instance._counted = bool(instance.__dict__.get('is_allowed'))
+
+
+@receiver(post_save, sender=Participation)
+def count_participation(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    was_allowed = False if created else instance._counted
+    Question.objects.filter(pk=instance.question_id).add_to_counters(
+        allowed_voters=int(instance.is_allowed) - int(was_allowed))
+    instance._counted = instance.is_allowed
+
+
+@receiver(post_delete, sender=Participation)
+def uncount_participation(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id).add_to_counters(allowed_voters=-int(instance._counted))
+
+
 class ApprovedChoiceManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().filter(review_status=Choice.APPROVED)
@@ -372,6 +839,9 @@ class Choice(models.Model):
 
     votes = models.IntegerField(default=0)
 
+    # position of the choice on ranked ballots (see tally.py) - assigned once it is approved and ranked
+    ballot_index = models.PositiveIntegerField(null=True, blank=True, editable=False)
+
     review_status = models.CharField(verbose_name=_("review status"), max_length=8,
                                      choices=REVIEW_STATUS_CHOICES, default=OPEN)
 
@@ -388,6 +858,15 @@ class Choice(models.Model):
         verbose_name = 'choice'
         verbose_name_plural = 'choices'
         ordering = [Lower('choice_text')]
+        # the functional index on (question, review_status, lower(choice_text)) for the default
+        # ordering is created in migration 0009 (not supported by Meta.indexes in Django 2.2)
+        indexes = [
+            models.Index(fields=['question', 'review_status', '-votes'], name='choice_status_votes_idx'),
+            models.Index(fields=['question', 'choice_text'], name='choice_text_idx'),
+            # delta feed of the choices page
+            models.Index(fields=['question', 'modified'], name='choice_modified_idx'),
+        ]
+        unique_together = (('question', 'ballot_index'),)
 
     # REPR and TO STRING METHOD
     def __repr__(self):
@@ -397,3 +876,248 @@ class Choice(models.Model):
 
     def __str__(self):
         return self.choice_text
+
+    @staticmethod
+    def normalize_text(text):
+        """remove duplicate spaces and strip space from start and end"""
+        return re.sub(' +', ' ', text.strip())
+
+
+@receiver(post_init, sender=Choice)
+def remember_choice_counts(sender, instance, **kwargs):
+    # what this choice adds to the counters of its question (deferred fields are not loaded)
+    instance._counted = (instance.__dict__.get('review_status') == Choice.APPROVED, instance.__dict__.get('votes') or 0)
+
+
+@receiver(post_save, sender=Choice)
+def count_choice(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    approved = instance.review_status == Choice.APPROVED
+    was_approved, votes = (False, 0) if created else instance._counted
+    Question.objects.filter(pk=instance.question_id).add_to_counters(
+        total_choices=int(created),
+        total_approved_choices=int(approved) - int(was_approved),
+        total_votes=(instance.votes if approved else 0) - (votes if was_approved else 0))
+    instance._counted = (approved, instance.votes)
+
+
+@receiver(post_delete, sender=Choice)
+def uncount_choice(sender, instance, **kwargs):
+    was_approved, votes = instance._counted
+    Question.objects.filter(pk=instance.question_id).add_to_counters(
+        total_choices=-1, total_approved_choices=-int(was_approved), total_votes=-votes if was_approved else 0)
+
+
+class ModerationRule(models.Model):
+    """Rule of the bulk moderation of open choices (see ``moderation.py``) - the first matching rule wins"""
+    # CHOICES
+    REGEX = 'REGEX'
+    NOT_REGEX = 'NOT_REGEX'
+    MIN_LENGTH = 'MIN_LENGTH'
+    MAX_LENGTH = 'MAX_LENGTH'
+    BANNED_WORDS = 'BANNED'
+    DUPLICATE_OF_APPROVED = 'DUPLICATE'
+    KIND_CHOICES = (
+        (REGEX, _('matches regular expression')),
+        (NOT_REGEX, _('does not match regular expression')),
+        (MIN_LENGTH, _('shorter than')),
+        (MAX_LENGTH, _('longer than')),
+        (BANNED_WORDS, _('contains one of the words (one per line)')),
+        (DUPLICATE_OF_APPROVED, _('duplicate of an approved choice (ignoring case)')),
+    )
+    ACTION_CHOICES = (
+        (Choice.APPROVED, _('approve')),
+        (Choice.REJECTED, _('reject')),
+    )
+
+    # DATABASE FIELDS
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, blank=True, null=True,
+                                 help_text=_("Leave empty for rules that apply to all questions"))
+
+    position = models.PositiveIntegerField(default=0, help_text=_("Rules are checked in ascending order"))
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    value = models.TextField(blank=True, help_text=_("Regular expression, length or banned words"))
+    action = models.CharField(max_length=8, choices=ACTION_CHOICES, default=Choice.REJECTED)
+    remark = models.CharField(max_length=200, blank=True,
+                              help_text=_("Review remark of matching choices (default: the rule)"))
+
+    is_active = models.BooleanField(default=True)
+
+    # META CLASS
+    class Meta:
+        ordering = ('position', 'id')
+
+    # REPR and TO STRING METHOD
+    def __str__(self):
+        if self.kind == self.DUPLICATE_OF_APPROVED:
+            return "{}: {}".format(self.get_action_display(), self.get_kind_display())
+        return "{}: {} {}".format(self.get_action_display(), self.get_kind_display(),
+                                  ", ".join(self.words) if self.kind == self.BANNED_WORDS else self.value)
+
+    @property
+    def words(self):
+        return [word.strip() for word in self.value.splitlines() if word.strip()]
+
+    def clean(self):
+        if self.kind in (self.REGEX, self.NOT_REGEX):
+            try:
+                re.compile(self.value)
+            except re.error as err:
+                raise ValidationError({'value': "Invalid regular expression: {}".format(err)})
+        elif self.kind in (self.MIN_LENGTH, self.MAX_LENGTH):
+            if not self.value.strip().isdigit():
+                raise ValidationError({'value': "Length must be a number"})
+        elif self.kind == self.BANNED_WORDS:
+            if not self.words:
+                raise ValidationError({'value': "Enter at least one word"})
+
+
+class ModerationTask(models.Model):
+    """A suggested choice waiting for the moderation worker (see moderation_queue.py)"""
+    # DATABASE FIELDS
+    choice = models.OneToOneField(Choice, on_delete=models.CASCADE)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    created = models.DateTimeField(verbose_name=_('date created'), auto_now_add=True)
+
+    attempts = models.PositiveIntegerField(default=0, help_text=_('Number of times a worker claimed the task'))
+    locked_by = models.CharField(max_length=32, blank=True, help_text=_('Claim of the worker processing the task'))
+    locked_until = models.DateTimeField(blank=True, null=True, help_text=_('End of the lease of the claim'))
+
+    # META CLASS
+    class Meta:
+        ordering = ('id',)
+        indexes = [
+            models.Index(fields=['locked_until'], name='moderationtask_lease_idx'),
+        ]
+
+    # REPR and TO STRING METHOD
+    def __str__(self):
+        return "{} ({} attempt(s))".format(self.choice_id, self.attempts)
+
+
+class FlushedSegment(models.Model):
+    """Segment of the vote buffer (see ``vote_buffer.py``) whose votes were applied"""
+    # DATABASE FIELDS
+    name = models.CharField(max_length=100, unique=True)
+    created = models.DateTimeField(verbose_name=_('date created'), auto_now_add=True)
+    votes = models.PositiveIntegerField(default=0)
+
+    # REPR and TO STRING METHOD
+    def __str__(self):
+        return self.name
+
+
+class Ballot(models.Model):
+    """Ranked ballot - the ballot indexes of the choices in order of preference (see ``tally.py``)"""
+    # DATABASE FIELDS
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    participation = models.ForeignKey(Participation, on_delete=models.CASCADE)
+    created = models.DateTimeField(verbose_name=_('date created'), auto_now_add=True)
+    ranking = models.BinaryField()
+
+    # META CLASS
+    class Meta:
+        unique_together = (('question', 'participation'),)
+
+    # REPR and TO STRING METHOD
+    def __str__(self):
+        return "{} ({})".format(self.question_id, self.pk)
+
+    @property
+    def indexes(self):
+        return tally.decode_ballot(self.ranking)
+
+
+class VoteBucketManager(models.Manager):
+
+    def add(self, question_id, votes, at=None):
+        """count `votes` ({choice id: votes}) in the minute buckets of `at` (default: now) - one statement
+
+        An upsert (INSERT ... ON CONFLICT / ON DUPLICATE KEY) where the database
+        supports it, UPDATE and INSERT otherwise.
+        """
+        start = (at or timezone.now()).replace(second=0, microsecond=0)
+        self._add([(question_id, choice_id, VoteBucket.MINUTE, start, count)
+                   for choice_id, count in votes.items() if count])
+
+    def _add(self, rows):
+        if not rows:
+            return
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        if connection.vendor == 'sqlite' and connection.Database.sqlite_version_info < (3, 24):
+            vendor = None  # no upsert before SQLite 3.24
+        else:
+            vendor = connection.vendor
+
+        if vendor not in ('sqlite', 'postgresql', 'mysql'):
+            for question_id, choice_id, seconds, start, count in rows:
+                buckets = self.using(using).filter(choice_id=choice_id, seconds=seconds, start=start)
+                if not buckets.update(votes=F('votes') + count):
+                    try:
+                        with transaction.atomic(using=using):
+                            self.using(using).create(question_id=question_id, choice_id=choice_id,
+                                                     seconds=seconds, start=start, votes=count)
+                    except IntegrityError:
+                        # created concurrently
+                        buckets.update(votes=F('votes') + count)
+            return
+
+        fields = [self.model._meta.get_field(name) for name in ('question', 'choice', 'seconds', 'start', 'votes')]
+        params = []
+        for row in rows:
+            params.extend(field.get_db_prep_value(value, connection) for field, value in zip(fields, row))
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sql = 'INSERT INTO {} ({}) VALUES {}'.format(
+            table, ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['({})'.format(', '.join(['%s'] * len(fields)))] * len(rows)))
+        if vendor == 'mysql':
+            sql += ' ON DUPLICATE KEY UPDATE votes = votes + VALUES(votes)'
+        else:
+            sql += ' ON CONFLICT (choice_id, seconds, start) DO UPDATE SET votes = {}.votes + excluded.votes'. \
+                format(table)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def downsample(self, question):
+        """merge the minute buckets of `question` (but the current minute's) into hour buckets"""
+        # read on the primary - the buckets are deleted there
+        using = router.db_for_write(self.model)
+        minutes = self.db_manager(using).filter(question=question, seconds=VoteBucket.MINUTE,
+                                                start__lt=timezone.now().replace(second=0, microsecond=0))
+        with transaction.atomic(using=using):
+            hours = minutes.annotate(hour=Trunc('start', 'hour', tzinfo=timezone.utc)).order_by(). \
+                values_list('choice', 'hour').annotate(total=Sum('votes'))
+            rows = [(question.pk, choice_id, VoteBucket.HOUR, hour, total) for choice_id, hour, total in hours]
+            for offset in range(0, len(rows), 100):
+                self._add(rows[offset:offset + 100])
+            minutes.delete()
+        return len(rows)
+
+
+class VoteBucket(models.Model):
+    """Votes of a choice in a minute (while voting) or an hour (after voting has ended)"""
+    MINUTE = 60
+    HOUR = 60 * 60
+
+    # DATABASE FIELDS
+    question = models.ForeignKey(Question, on_delete=models.CASCADE)
+    choice = models.ForeignKey(Choice, on_delete=models.CASCADE)
+    seconds = models.PositiveIntegerField(default=MINUTE, help_text=_('Length of the bucket'))
+    start = models.DateTimeField()
+    votes = models.PositiveIntegerField(default=0)
+
+    # MANAGERS
+    objects = VoteBucketManager()
+
+    # META CLASS
+    class Meta:
+        unique_together = (('choice', 'seconds', 'start'),)
+        indexes = [
+            models.Index(fields=['question', 'start'], name='votebucket_question_start_idx'),
+        ]
+
+    # REPR and TO STRING METHOD
+    def __str__(self):
+        return "{} {} +{}s: {}".format(self.choice_id, self.start, self.seconds, self.votes)
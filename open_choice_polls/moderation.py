@@ -0,0 +1,119 @@
+"""Rule based bulk moderation of open choices
+
+Every rule is turned into a filter on the choices, so a rule is applied to
+all matching choices with one ``UPDATE`` (setting ``review_status`` and
+``review_remark`` and ``modified``) - no choice is loaded into Python. Rules are applied in
+order and a choice is only changed by the first rule it matches: each rule
+works on the choices that are still open, and in a dry run the conditions
+of the rules before are excluded instead.
+
+The validation regex of the question (as checked by ``ChoiceForm``) is
+always applied first.
+"""
+import logging
+import re
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Length, Lower
+from django.utils import timezone
+
+from .models import Choice, ModerationRule, Question, ResultsSnapshot
+
+logger = logging.getLogger(__name__)
+
+
+class Rule:
+    """A moderation rule - either a ModerationRule or the validation regex of the question"""
+
+    def __init__(self, kind, value, action, remark):
+        self.kind = kind
+        self.value = value
+        self.action = action
+        self.remark = remark[:Choice._meta.get_field('review_remark').max_length]
+
+    @classmethod
+    def from_model(cls, rule):
+        return cls(rule.kind, rule.words if rule.kind == ModerationRule.BANNED_WORDS else rule.value,
+                   rule.action, rule.remark or str(rule))
+
+    def __str__(self):
+        return self.remark
+
+    def condition(self):
+        """Q object matching the choices this rule applies to (see ModerationEngine.annotate())"""
+        if self.kind == ModerationRule.REGEX:
+            return Q(choice_text__regex=self.value)
+        if self.kind == ModerationRule.NOT_REGEX:
+            return ~Q(choice_text__regex=self.value)
+        if self.kind == ModerationRule.MIN_LENGTH:
+            return Q(moderation_length__lt=int(self.value))
+        if self.kind == ModerationRule.MAX_LENGTH:
+            return Q(moderation_length__gt=int(self.value))
+        if self.kind == ModerationRule.BANNED_WORDS:
+            condition = Q()
+            for word in self.value:
+                # whole words only ("ass" does not match "Class") - \W instead of \b, which is a backspace in
+                # PostgreSQL regular expressions
+                condition |= Q(choice_text__iregex=r'(^|\W){}(\W|$)'.format(re.escape(word)))
+            return condition
+        if self.kind == ModerationRule.DUPLICATE_OF_APPROVED:
+            return Q(moderation_duplicate=True)
+        raise ValueError("unknown moderation rule: {}".format(self.kind))
+
+
+class ModerationEngine:
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    @classmethod
+    def for_question(cls, question):
+        """engine with the validation regex of `question` and its active rules (and the global ones)"""
+        rules = []
+        if question.choice_validation_regex:
+            rules.append(Rule(ModerationRule.NOT_REGEX, question.choice_validation_regex, Choice.REJECTED,
+                              "Failed Regex. Hint: {}".format(question.choice_validation_hint)))
+        rules.extend(Rule.from_model(rule) for rule in ModerationRule.objects.
+                     filter(Q(question=question) | Q(question__isnull=True), is_active=True))
+        return cls(rules)
+
+    @staticmethod
+    def annotate(queryset):
+        """add the expressions the rule conditions refer to"""
+        approved = Choice.approved.annotate(lower_text=Lower('choice_text')). \
+            filter(question=OuterRef('question'), lower_text=OuterRef('moderation_lower_text'))
+        return queryset.annotate(moderation_length=Length('choice_text'),
+                                 moderation_lower_text=Lower('choice_text')). \
+            annotate(moderation_duplicate=Exists(approved))
+
+    def run(self, queryset, dry_run=False):
+        """moderate the open choices of `queryset` - returns a list of (rule, matched choices)"""
+        queryset = self.annotate(queryset.filter(review_status=Choice.OPEN).order_by())
+
+        question_ids = set()
+        if not dry_run:
+            question_ids = set(queryset.values_list('question', flat=True).distinct())
+
+        counts = []
+        previous = Q()
+        with transaction.atomic():
+            for rule in self.rules:
+                condition = rule.condition()
+                if dry_run:
+                    count = queryset.filter(condition).exclude(previous).count() if previous else \
+                        queryset.filter(condition).count()
+                    previous |= condition
+                else:
+                    count = queryset.filter(condition).update(review_status=rule.action, review_remark=rule.remark,
+                                                              modified=timezone.now())
+                    if count:
+                        logger.info("Moderation rule \"%s\" matched %s choice(s)", rule, count)
+                counts.append((rule, count))
+
+            if any(count for rule, count in counts):
+                Question.objects.filter(pk__in=question_ids).update_counters()
+            if any(count for rule, count in counts if rule.action == Choice.APPROVED):
+                # approved choices make a final results snapshot stale
+                ResultsSnapshot.objects.filter(question__in=question_ids).delete()
+        return counts
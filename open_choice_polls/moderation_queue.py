@@ -0,0 +1,151 @@
+"""Background moderation of new suggestions
+
+With ``OPEN_CHOICE_POLLS_MODERATION_QUEUE`` set, a suggestion is stored as an
+open choice together with a ``ModerationTask`` (in one transaction) and the
+request returns - the validation regex and the duplicate check are not run
+in the request. The ``moderation_worker`` command processes the tasks.
+
+A worker claims a batch of tasks with one ``UPDATE`` that sets a token and a
+lease (``locked_until``) on tasks nobody holds or whose lease has expired -
+several threads and processes can claim at the same time without getting the
+same task. A batch is moderated per question, in one transaction that also
+deletes its tasks:
+
+1. the texts are normalized (like ``ChoiceForm`` does),
+2. a choice with the text of an earlier suggestion of the question (in any
+   status) is rejected as a duplicate,
+3. the remaining ones go through the ``ModerationEngine`` of the question
+   (the validation regex and the moderation rules) and stay open if no rule
+   matches.
+
+Delivery is at-least-once: a worker that dies (or takes longer than the
+lease) leaves its tasks to be claimed again. Every step only changes choices
+that are still open, so moderating a choice twice does no harm. A task is
+given up after ``max_attempts`` claims; it stays in the table (and in the
+backlog metric) for a human to look at.
+"""
+import logging
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F, Min, Q
+from django.utils import timezone
+
+from . import metrics, settings
+from .models import Choice, ModerationTask
+from .moderation import ModerationEngine
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+LEASE = timedelta(minutes=5)
+MAX_ATTEMPTS = 5
+
+DUPLICATE_REMARK = "Duplicate of an earlier suggestion"
+
+
+def enqueue(choice):
+    """queue a new choice for the moderation worker"""
+    return ModerationTask.objects.create(choice=choice, question_id=choice.question_id)
+
+
+def claim(batch_size=BATCH_SIZE, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+    """claim up to `batch_size` tasks for `lease` - returns the token of the claim and the tasks"""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    available = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    candidates = ModerationTask.objects.filter(available, attempts__lt=max_attempts).order_by('pk'). \
+        values('pk')[:batch_size]
+    # the condition is repeated for the rows: on PostgreSQL a concurrent claim of the same
+    # candidates waits for the first one and then finds the rows locked
+    ModerationTask.objects.filter(available, pk__in=candidates). \
+        update(locked_by=token, locked_until=now + lease, attempts=F('attempts') + 1)
+    return token, list(ModerationTask.objects.filter(locked_by=token).select_related('question'))
+
+
+def moderate(question, choice_ids):
+    """moderate the open choices `choice_ids` of `question` - returns {result: number of choices}"""
+    results = {}
+    choices = list(Choice.open.filter(question=question, pk__in=choice_ids).values_list('pk', 'choice_text'))
+    if not choices:
+        return results
+
+    now = timezone.now()
+    texts = {}
+    for pk, text in choices:
+        texts[pk] = Choice.normalize_text(text)
+        if texts[pk] != text:
+            Choice.objects.filter(pk=pk).update(choice_text=texts[pk], modified=now)
+
+    # the earliest suggestion of each text is the original (whether it is in this batch or not)
+    originals = {}
+    for pk, text, created in question.choice_set.filter(choice_text__in=set(texts.values())). \
+            order_by('created', 'pk').values_list('pk', 'choice_text', 'created'):
+        originals.setdefault(text, pk)
+    duplicates = [pk for pk, text in texts.items() if originals.get(text, pk) != pk]
+    if duplicates:
+        results['duplicate'] = Choice.open.filter(pk__in=duplicates). \
+            update(review_status=Choice.REJECTED, review_remark=DUPLICATE_REMARK, modified=now)
+
+    remaining = Choice.objects.filter(pk__in=[pk for pk in texts if pk not in duplicates])
+    for rule, count in ModerationEngine.for_question(question).run(remaining):
+        if count:
+            result = rule.action.lower()
+            results[result] = results.get(result, 0) + count
+    results['open'] = len(choices) - sum(results.values())
+    return results
+
+
+def process(batch_size=BATCH_SIZE, lease=LEASE, max_attempts=MAX_ATTEMPTS):
+    """claim and moderate one batch of tasks - returns the number of tasks done"""
+    token, tasks = claim(batch_size, lease, max_attempts)
+    if not tasks:
+        return 0
+
+    by_question = {}
+    for task in tasks:
+        by_question.setdefault(task.question_id, (task.question, []))[1].append(task.choice_id)
+
+    done = 0
+    for question, choice_ids in by_question.values():
+        with transaction.atomic():
+            results = moderate(question, choice_ids)
+            # only the tasks still held by this claim - a task whose lease expired may be claimed again
+            done += ModerationTask.objects.filter(locked_by=token, choice__in=choice_ids).delete()[0]
+        for result, count in results.items():
+            if count:
+                metrics.MODERATED.inc(count, result=result)
+        logger.debug("Moderated %s choice(s) of %s: %s", len(choice_ids), question, results)
+    return done
+
+
+def run(batch_size=BATCH_SIZE, lease=LEASE, max_attempts=MAX_ATTEMPTS, interval=1.0, once=False, stop=None):
+    """process batches until `stop` (a threading.Event) is set - or the queue is empty with `once`"""
+    while stop is None or not stop.is_set():
+        done = process(batch_size, lease, max_attempts)
+        if not done:
+            if once:
+                break
+            if stop is not None:
+                stop.wait(interval)
+            else:
+                time.sleep(interval)
+
+
+def backlog():
+    return ModerationTask.objects.count() if settings.OPEN_CHOICE_POLLS_MODERATION_QUEUE else None
+
+
+def backlog_age():
+    """seconds the oldest task is waiting"""
+    if not settings.OPEN_CHOICE_POLLS_MODERATION_QUEUE:
+        return None
+    oldest = ModerationTask.objects.aggregate(oldest=Min('created'))['oldest']
+    return (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+
+BACKLOG = metrics.Gauge('ocp_moderation_backlog', 'Suggestions waiting for the moderation worker', backlog)
+BACKLOG_AGE = metrics.Gauge('ocp_moderation_backlog_age_seconds',
+                            'Age of the oldest suggestion waiting for the moderation worker', backlog_age)
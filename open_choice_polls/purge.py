@@ -0,0 +1,60 @@
+"""Purge of expired voters
+
+Voters that never enrolled and whose enrollment code has expired
+(``enrollment_code_valid_until``) are deleted in chunks. Each chunk is a
+handful of set-based ``DELETE`` statements (ballots, participations, voters, then the
+users with their group and permission rows) in one transaction - no model
+instance is loaded and no ``post_delete`` signal is sent, so deleting a
+voter does not cascade row by row through ``post_delete_user``. The counters
+of the questions the voters were allowed on are recounted afterwards.
+"""
+import logging
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .bulk import raw_delete
+from .models import Ballot, Participation, Question, Voter
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+def expired_voters(now=None):
+    """voters that never enrolled and whose enrollment code expired before `now`"""
+    return Voter.objects.filter(is_voter=True, is_enrolled=False,
+                                enrollment_code_valid_until__lt=now or timezone.now(),
+                                user__is_staff=False, user__is_superuser=False)
+
+
+def purge_expired_voters(now=None, batch_size=BATCH_SIZE):
+    """delete the expired voters (and their users and participations) - returns the number of voters deleted"""
+    now = now or timezone.now()
+    voters = expired_voters(now).order_by('enrollment_code_valid_until').values_list('pk', 'user')
+
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            batch = list(voters[:batch_size])
+            if not batch:
+                break
+            voter_ids = [voter_id for voter_id, _ in batch]
+            user_ids = [user_id for _, user_id in batch]
+
+            question_ids = list(Participation.objects.filter(voter__in=voter_ids).
+                                order_by().values_list('question', flat=True).distinct())
+            raw_delete(Ballot.objects.filter(participation__voter__in=voter_ids))
+            raw_delete(Participation.objects.filter(voter__in=voter_ids))
+            raw_delete(Voter.objects.filter(pk__in=voter_ids))
+            raw_delete(User.groups.through.objects.filter(user__in=user_ids))
+            raw_delete(User.user_permissions.through.objects.filter(user__in=user_ids))
+            raw_delete(User.objects.filter(pk__in=user_ids))
+
+            # raw deletes send no signals
+            Question.objects.filter(pk__in=question_ids).update_counters()
+
+        deleted += len(batch)
+        logger.debug("Purged %s expired voter(s)", len(batch))
+    return deleted
@@ -0,0 +1,82 @@
+"""Token bucket rate limits on Django's cache framework
+
+A rate like ``"10/m"`` is a bucket holding 10 tokens that refills at 10 per
+minute. The buckets are kept as a "theoretical arrival time" (the generic
+cell rate algorithm): one float per bucket in the cache, no timer and no
+background refill. A check reads all buckets of a request with one
+``get_many()`` and - only if all of them have a token left - takes one from
+each with one ``set_many()``.
+
+Checks are serialized by a lock per process, so limits hold exactly for the
+threads of a process. Processes sharing a cache (e.g. memcached) can race
+between the read and the write and let a few extra requests through.
+"""
+import math
+import re
+import threading
+import time
+from functools import lru_cache
+
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+
+from .exceptions import RateLimited
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+RATE_RE = re.compile(r'^(\d+)/([smhd])$')
+
+KEY_PREFIX = 'ocp-rl'
+
+
+@lru_cache(maxsize=64)
+def parse_rate(rate):
+    """(requests, period in seconds) of a rate like "10/m" """
+    match = RATE_RE.match(rate.strip())
+    if not match or not int(match.group(1)):
+        raise ValueError("invalid rate: {!r} (expected e.g. 10/s, 10/m, 10/h or 10/d)".format(rate))
+    return int(match.group(1)), PERIODS[match.group(2)]
+
+
+def validate_rate(value):
+    try:
+        parse_rate(value)
+    except ValueError as err:
+        raise ValidationError(str(err))
+
+
+class RateLimiter:
+
+    def __init__(self, cache_alias='default'):
+        self.cache_alias = cache_alias
+        self.lock = threading.Lock()
+
+    def check(self, buckets):
+        """take a token from each of the `buckets` (dict of key: rate) or raise RateLimited
+
+        Buckets with an empty rate are not limited.
+        """
+        limits = {'{}:{}'.format(KEY_PREFIX, key): parse_rate(rate) for key, rate in buckets.items() if rate}
+        if not limits:
+            return
+
+        cache = caches[self.cache_alias]
+        with self.lock:
+            now = time.time()
+            arrivals = cache.get_many(list(limits))
+
+            updates = {}
+            retry_after = 0.0
+            for key, (requests, period) in limits.items():
+                interval = float(period) / requests
+                arrival = max(arrivals.get(key, now), now)
+                wait = arrival + interval - period - now
+                if wait > 0:
+                    retry_after = max(retry_after, wait)
+                else:
+                    updates[key] = arrival + interval
+
+            if retry_after:
+                raise RateLimited(retry_after)
+
+            timeout = math.ceil(max(updates.values()) - now) + 1
+            cache.set_many(updates, timeout)
@@ -0,0 +1,47 @@
+import threading
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS
+
+from open_choice_polls import settings
+
+PIN_PRIMARY_COOKIE = 'ocp_pin_primary'
+
+_state = threading.local()
+
+
+@contextmanager
+def use_replica():
+    """Route reads of this app's models to the read replica (if configured) within the block"""
+    previous = getattr(_state, 'use_replica', False)
+    _state.use_replica = True
+    try:
+        yield
+    finally:
+        _state.use_replica = previous
+
+
+class PrimaryReplicaRouter:
+    """Send reads of read-mostly views to the replica, everything else to the primary
+
+    Only reads inside ``use_replica()`` (used by the read-mostly views) go to
+    the alias configured as ``OPEN_CHOICE_POLLS_DB_REPLICA``. All writes go to
+    the primary - also for objects that were loaded from the replica.
+    """
+    app_label = 'open_choice_polls'
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == self.app_label and getattr(_state, 'use_replica', False):
+            return settings.OPEN_CHOICE_POLLS_DB_REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == self.app_label:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, settings.OPEN_CHOICE_POLLS_DB_REPLICA}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -5,3 +5,46 @@ OPEN_CHOICE_POLLS_QUESTION_ZFILL = getattr(settings, 'OPEN_CHOICE_POLLS_QUESTION
 OPEN_CHOICE_POLLS_VOTER_PREFIX = getattr(settings, 'OPEN_CHOICE_POLLS_VOTER_PREFIX', 'anon')
 OPEN_CHOICE_POLLS_VOTER_RANGE_START = getattr(settings, 'OPEN_CHOICE_POLLS_VOTER_RANGE_START', 220000)
 OPEN_CHOICE_POLLS_VOTER_RANGE_END = getattr(settings, 'OPEN_CHOICE_POLLS_VOTER_RANGE_END', 220999)
+# voter ids are zero padded to this many digits (e.g. 7 for a range of 0 - 9999999)
+OPEN_CHOICE_POLLS_VOTER_ID_WIDTH = getattr(settings, 'OPEN_CHOICE_POLLS_VOTER_ID_WIDTH', 3)
+
+# database alias of a read replica for the read-mostly views (None: no replica)
+OPEN_CHOICE_POLLS_DB_REPLICA = getattr(settings, 'OPEN_CHOICE_POLLS_DB_REPLICA', None)
+# seconds a client reads from the primary after it wrote something (read-your-writes)
+OPEN_CHOICE_POLLS_DB_REPLICA_PIN_SECONDS = getattr(settings, 'OPEN_CHOICE_POLLS_DB_REPLICA_PIN_SECONDS', 15)
+
+# seconds browsers/proxies may cache the results page of a question that has ended
+OPEN_CHOICE_POLLS_RESULTS_MAX_AGE = getattr(settings, 'OPEN_CHOICE_POLLS_RESULTS_MAX_AGE', 24 * 60 * 60)
+
+# cache (alias in settings.CACHES) and seconds for the rounds of ranked questions during voting - keyed on the
+# vote and choice counters, so a new ballot is shown right away
+OPEN_CHOICE_POLLS_RESULTS_CACHE = getattr(settings, 'OPEN_CHOICE_POLLS_RESULTS_CACHE', 'default')
+OPEN_CHOICE_POLLS_RESULTS_CACHE_TIMEOUT = getattr(settings, 'OPEN_CHOICE_POLLS_RESULTS_CACHE_TIMEOUT', 60 * 60)
+
+# token bucket rate limits ("<requests>/<s|m|h|d>", None: unlimited) of suggestions and votes - per client IP
+# address, per signed-in user and per question (the per question rates can be overridden for each Question)
+OPEN_CHOICE_POLLS_RATE_LIMITS = getattr(settings, 'OPEN_CHOICE_POLLS_RATE_LIMITS', {
+    'suggestion': {'ip': '20/m', 'user': '10/m', 'question': '600/m'},
+    'vote': {'ip': '600/m', 'user': '30/m', 'question': None},
+})
+# cache (alias in settings.CACHES) holding the token buckets - must be shared by all worker processes
+OPEN_CHOICE_POLLS_RATE_LIMIT_CACHE = getattr(settings, 'OPEN_CHOICE_POLLS_RATE_LIMIT_CACHE', 'default')
+
+# directory of the write-behind vote buffer (None: votes are written to the database directly) - the votes are
+# applied by "manage.py flush_votes", which has to run on every host with a buffer
+OPEN_CHOICE_POLLS_VOTE_BUFFER = getattr(settings, 'OPEN_CHOICE_POLLS_VOTE_BUFFER', None)
+# fsync the buffer after each vote (a vote is only acknowledged when it is on disk)
+OPEN_CHOICE_POLLS_VOTE_BUFFER_FSYNC = getattr(settings, 'OPEN_CHOICE_POLLS_VOTE_BUFFER_FSYNC', True)
+# milliseconds between two flushes of "manage.py flush_votes"
+OPEN_CHOICE_POLLS_VOTE_BUFFER_FLUSH_INTERVAL = getattr(settings, 'OPEN_CHOICE_POLLS_VOTE_BUFFER_FLUSH_INTERVAL', 500)
+
+# directory of the memory mapped metrics files shared by the worker processes of a host (None: every process has
+# its own metrics) - has to be emptied when the application is started
+OPEN_CHOICE_POLLS_METRICS_DIR = getattr(settings, 'OPEN_CHOICE_POLLS_METRICS_DIR', None)
+
+# moderate new suggestions in the background ("manage.py moderation_worker") instead of checking the validation
+# regex and duplicates in the request
+OPEN_CHOICE_POLLS_MODERATION_QUEUE = getattr(settings, 'OPEN_CHOICE_POLLS_MODERATION_QUEUE', False)
+
+# directory of the archive files of closed questions ("manage.py archive_questions", None: no archival)
+OPEN_CHOICE_POLLS_ARCHIVE_DIR = getattr(settings, 'OPEN_CHOICE_POLLS_ARCHIVE_DIR', None)
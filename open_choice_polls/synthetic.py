@@ -0,0 +1,206 @@
+"""Synthetic data set for benchmarking at scale
+
+Generates questions with their phases spread around now, suggested choices
+with a mix of review statuses and near-duplicates (other case, punctuation or
+plural of another suggestion), voters allowed on every generated question and
+the votes of the enrolled ones: each question in (or after) its voting phase
+gets its share of the votes, spread over a random turnout of its voters and
+over the approved choices by a Zipf distribution (the n-th most popular
+choice gets ``1 / n ** s`` of the votes) and counted in hourly vote buckets.
+
+Everything is written in one transaction without sending signals; the
+counters of the questions are recounted at the end. The large tables (users,
+voters, participations and vote buckets) are filled with ``executemany()``
+of plain tuples of database values, as building a model instance for every
+row would take most of the time. All users share one password hash, so only
+one hash is computed.
+
+The same seed generates the same texts, dates, review statuses and vote counts
+(relative to now). Voters are named ``<prefix><number>`` (counting on from
+the voters generated before, not from the voter id range) and get new ids,
+so a data set can be generated more than once into the same database.
+"""
+import collections
+import itertools
+import math
+import random
+import re
+import uuid
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.text import slugify
+
+from .bulk import db_value, insert_rows
+from .models import SELECTED_LETTERS, SELECTED_NUMBERS, Choice, Participation, Question, VoteBucket, Voter
+
+BATCH_SIZE = 2000
+PREFIX = 'synth'
+WIDTH = 7
+
+ADJECTIVES = ('Blue', 'Brave', 'Bright', 'Calm', 'Clever', 'Crimson', 'Dancing', 'Electric', 'Flying', 'Frosty',
+              'Gentle', 'Golden', 'Happy', 'Hidden', 'Iron', 'Jolly', 'Lucky', 'Mighty', 'Misty', 'Noble',
+              'Quiet', 'Rapid', 'Rusty', 'Silent', 'Silver', 'Sunny', 'Swift', 'Velvet', 'Wild', 'Wise')
+NOUNS = ('Badger', 'Comet', 'Falcon', 'Fox', 'Harbor', 'Lantern', 'Meadow', 'Otter', 'Panda', 'Pebble', 'Phoenix',
+         'Pine', 'Raven', 'River', 'Rocket', 'Shadow', 'Sparrow', 'Storm', 'Tiger', 'Voyager', 'Whale', 'Willow')
+
+# share of the suggestions per review status
+REVIEW_STATUS_WEIGHTS = ((Choice.APPROVED, 60), (Choice.OPEN, 25), (Choice.REJECTED, 15))
+
+
+class GenerateResult:
+
+    def __init__(self):
+        self.questions = 0
+        self.choices = 0
+        self.voters = 0
+        self.participations = 0
+        self.votes = 0
+
+    def __str__(self):
+        return "{} question(s), {} choice(s), {} voter(s), {} participation(s), {} vote(s)".format(
+            self.questions, self.choices, self.voters, self.participations, self.votes)
+
+
+def choice_texts(rnd, amount, near_duplicates=0.1):
+    """`amount` distinct suggestion texts - about `near_duplicates` of them variants of another one"""
+    texts = []
+    seen = set()
+    for _ in range(amount * 20):
+        if len(texts) == amount:
+            break
+        if texts and rnd.random() < near_duplicates:
+            original = rnd.choice(texts)
+            text = rnd.choice((original.lower(), original.upper(), original + '!', original + 's',
+                               original.replace(' ', '-')))
+        else:
+            text = '{} {}'.format(rnd.choice(ADJECTIVES), rnd.choice(NOUNS))
+            if rnd.random() < 0.5:
+                text += ' {}'.format(rnd.randint(1, 999))
+        if text not in seen:
+            seen.add(text)
+            texts.append(text)
+    return texts
+
+
+def enrollment_code(rnd):
+    """like Voter.create_enrollment_code() but from `rnd`"""
+    return '{}-{}-{}'.format(''.join(rnd.choices(SELECTED_LETTERS, k=5)), ''.join(rnd.choices(SELECTED_NUMBERS, k=4)),
+                             ''.join(rnd.choices(SELECTED_LETTERS.lower(), k=5)))
+
+
+def zipf_weights(amount, exponent):
+    """cumulative weights of a Zipf distribution over `amount` ranks"""
+    return list(itertools.accumulate(1.0 / rank ** exponent for rank in range(1, amount + 1)))
+
+
+def split(total, parts):
+    """`total` split into `parts` (almost) equal integers"""
+    return [total // parts + (1 if part < total % parts else 0) for part in range(parts)]
+
+
+def create_voters(rnd, amount, password, now, prefix=PREFIX, batch_size=BATCH_SIZE):
+    """create `amount` voters (about 80% enrolled, 5% with an expired code)
+
+    Returns the ids of the enrolled voters and of the others.
+    """
+    last = User.objects.filter(username__regex=r'^{}[0-9]{{{}}}$'.format(re.escape(prefix), WIDTH)). \
+        order_by('-username').values_list('username', flat=True).first()
+    first = int(last[len(prefix):]) + 1 if last else 1
+    usernames = ['{}{}'.format(prefix, str(number).zfill(WIDTH)) for number in range(first, first + amount)]
+
+    user = (make_password(password), db_value(User, 'date_joined', now))
+    valid, expired = (db_value(Voter, 'enrollment_code_valid_until', now + timedelta(days=days)) for days in (30, -1))
+    enrolled, others = [], []
+    for offset in range(0, len(usernames), batch_size):
+        batch = usernames[offset:offset + batch_size]
+        insert_rows(User, ('username', 'password', 'date_joined', 'first_name', 'last_name', 'email',
+                           'is_superuser', 'is_staff', 'is_active'),
+                    [(username,) + user + ('', '', '', False, False, True) for username in batch])
+
+        rows = []
+        for user_id in User.objects.filter(username__in=batch).order_by('pk').values_list('pk', flat=True):
+            draw = rnd.random()
+            rows.append((user_id, True, draw < 0.8, enrollment_code(rnd), draw < 0.95,
+                         valid if draw < 0.95 else expired))
+        insert_rows(Voter, ('user', 'is_voter', 'is_enrolled', 'enrollment_code', 'enrollment_code_is_distributed',
+                            'enrollment_code_valid_until'), rows)
+        for voter_id, is_enrolled in Voter.objects.filter(user__username__in=batch).order_by('pk'). \
+                values_list('pk', 'is_enrolled'):
+            (enrolled if is_enrolled else others).append(voter_id)
+    return enrolled, others
+
+
+def generate(questions=5, choices=200, voters=1000, votes=10000, seed=0, zipf=1.1, password='synthetic',
+             prefix=PREFIX, batch_size=BATCH_SIZE):
+    """generate a synthetic data set (see the module docstring) - returns a GenerateResult"""
+    rnd = random.Random(seed)
+    now = timezone.now().replace(minute=0, second=0, microsecond=0)
+    result = GenerateResult()
+
+    with transaction.atomic():
+        enrolled, others = create_voters(rnd, voters, password, now, prefix, batch_size)
+        result.voters = len(enrolled) + len(others)
+
+        last_number = Question.objects.aggregate(largest=Max('number'))['largest'] or 0
+        new_questions = []
+        for number in range(last_number + 1, last_number + 1 + questions):
+            text = 'Synthetic question {}'.format(number)
+            collection_start = now + timedelta(days=rnd.randint(-40, 20))
+            voting_start = collection_start + timedelta(days=7)
+            new_questions.append(Question(number=number, text=text, slug=slugify(text),
+                                          collection_start_date=collection_start,
+                                          collection_end_date=voting_start,
+                                          voting_start_date=voting_start,
+                                          voting_end_date=voting_start + timedelta(days=7)))
+
+        voting = [question for question in new_questions if question.voting_start_date <= now]
+        budgets = dict(zip(voting, split(votes, len(voting)))) if voting else {}
+        cum_weights = zipf_weights(choices, zipf)
+
+        new_choices, participations, buckets = [], [], []
+        for question in new_questions:
+            question_choices = [Choice(id=uuid.uuid4(), question=question, choice_text=text,
+                                       review_status=rnd.choices(*zip(*REVIEW_STATUS_WEIGHTS))[0])
+                                for text in choice_texts(rnd, choices)]
+            question_id = db_value(Participation, 'question', question.pk)
+            approved = [choice for choice in question_choices if choice.review_status == Choice.APPROVED]
+            rnd.shuffle(approved)  # the most popular choices are not the first suggested
+
+            votes_cast = {}
+            budget = budgets.get(question, 0) if approved and enrolled else 0
+            if budget:
+                turnout = rnd.sample(enrolled, max(1, int(len(enrolled) * rnd.uniform(0.5, 0.9))))
+                question.votes_per_session = max(1, math.ceil(budget / len(turnout)))
+                votes_cast = dict(zip(turnout, split(budget, len(turnout))))
+
+                hours = max(1, int((min(now, question.voting_end_date) - question.voting_start_date) /
+                                   timedelta(hours=1)))
+                picks = rnd.choices(range(len(approved)), cum_weights=cum_weights[:len(approved)], k=budget)
+                counts = collections.Counter(zip(picks, rnd.choices(range(hours), k=budget)))
+                starts = [db_value(VoteBucket, 'start', question.voting_start_date + timedelta(hours=hour))
+                          for hour in range(hours)]
+                choice_ids = [db_value(VoteBucket, 'choice', choice.pk) for choice in approved]
+                for (index, hour), count in counts.items():
+                    approved[index].votes += count
+                    buckets.append((question_id, choice_ids[index], VoteBucket.HOUR, starts[hour], count))
+                result.votes += budget
+
+            participations.extend((voter_id, question_id, True, votes_cast.get(voter_id, 0))
+                                  for voter_id in enrolled + others)
+            new_choices.extend(question_choices)
+
+        Question.objects.bulk_create(new_questions)
+        Choice.objects.bulk_create(new_choices)
+        insert_rows(Participation, ('voter', 'question', 'is_allowed', 'votes_cast'), participations)
+        insert_rows(VoteBucket, ('question', 'choice', 'seconds', 'start', 'votes'), buckets)
+        Question.objects.filter(pk__in=[question.pk for question in new_questions]).update_counters()
+
+        result.questions = len(new_questions)
+        result.choices = len(new_choices)
+        result.participations = len(participations)
+    return result
@@ -0,0 +1,201 @@
+"""Tally of ranked ballots (instant-runoff and Borda count)
+
+A ballot is stored as a fixed-width array of unsigned 16 bit integers
+(little endian): the ``Choice.ballot_index`` of the voter's first, second,
+... choice, padded with ``EMPTY``. The ballots of a question are joined to
+one buffer and tallied as an ``(ballots, width)`` matrix.
+
+Instant-runoff: every ballot counts for its highest ranked choice that is
+still running. The choice with the fewest votes is eliminated and its
+ballots move on to their next running choice until one choice has more than
+half of the votes of the ballots that are not exhausted. Ties for the last
+place are broken by the votes in the rounds before (most recent first),
+then the choice suggested last (highest ballot index) is eliminated.
+
+Borda count: a ballot gives ``width`` points to its first choice,
+``width - 1`` to the second and so on.
+
+Only the ballots of the eliminated choice are looked at in a round. With
+NumPy installed this is vectorized over the ballot matrix; without it the
+ballots are kept in one list per choice (``benchmarks/bench_tally.py``).
+"""
+import collections
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+EMPTY = 0xFFFF
+MAX_INDEX = EMPTY - 1
+
+
+def encode_ballot(indexes, width):
+    """ballot (bytes) of a ranking (list of ballot indexes)"""
+    if len(indexes) > width:
+        raise ValueError("a ballot has at most {} choices".format(width))
+    values = array('H', list(indexes) + [EMPTY] * (width - len(indexes)))
+    if sys.byteorder == 'big':  # pragma: no cover
+        values.byteswap()
+    return values.tobytes()
+
+
+def decode_ballot(data):
+    """ranking (list of ballot indexes) of a ballot"""
+    values = array('H')
+    values.frombytes(bytes(data))
+    if sys.byteorder == 'big':  # pragma: no cover
+        values.byteswap()
+    return [value for value in values if value != EMPTY]
+
+
+def join_ballots(ballots, width):
+    """one buffer of `width` wide ballots - ballots of another width are padded or truncated"""
+    size = width * 2
+    return b''.join(bytes(ballot) if len(ballot) == size else
+                    (bytes(ballot[:size]) + b'\xff' * size)[:size] for ballot in ballots)
+
+
+class _NumpyBallots:
+
+    def __init__(self, data, width):
+        self.width = width
+        self.matrix = np.frombuffer(data, dtype='<u2').reshape(-1, width)
+        self.count = len(self.matrix)
+        self.pos = np.zeros(self.count, dtype=np.int32)
+        self.top = self.matrix[:, 0].astype(np.int32) if self.count else np.zeros(0, dtype=np.int32)
+        self.running = np.zeros(EMPTY + 1, dtype=bool)
+
+    def _advance(self, rows):
+        """move the ballots `rows` on to their highest ranked choice that is still running"""
+        while rows.size:
+            rows = rows[~self.running[self.top[rows]]]
+            if not rows.size:
+                break
+            self.pos[rows] += 1
+            exhausted = self.pos[rows] >= self.width
+            self.top[rows[exhausted]] = EMPTY
+            rows = rows[~exhausted]
+            self.top[rows] = self.matrix[rows, self.pos[rows]]
+
+    def _counts(self, tops):
+        tops = tops[tops != EMPTY]
+        counts = np.bincount(tops)
+        return {int(index): int(counts[index]) for index in np.flatnonzero(counts)}
+
+    def first_preferences(self, running):
+        self.running[list(running)] = True
+        self._advance(np.arange(self.count))
+        return self._counts(self.top)
+
+    def transfer(self, eliminated):
+        """(votes moved to the running choices, ballots exhausted) when `eliminated` is eliminated"""
+        self.running[eliminated] = False
+        rows = np.flatnonzero(self.top == eliminated)
+        self._advance(rows)
+        tops = self.top[rows]
+        return self._counts(tops), int(np.count_nonzero(tops == EMPTY))
+
+    def borda(self):
+        valid = self.matrix != EMPTY
+        points = np.broadcast_to(np.arange(self.width, 0, -1), self.matrix.shape)
+        counts = np.bincount(self.matrix[valid], weights=points[valid])
+        return {int(index): int(counts[index]) for index in np.flatnonzero(counts)}
+
+
+class _PythonBallots:
+
+    def __init__(self, data, width):
+        values = array('H')
+        values.frombytes(data)
+        if sys.byteorder == 'big':  # pragma: no cover
+            values.byteswap()
+        self.width = width
+        self.rows = [values[start:start + width] for start in range(0, len(values), width)]
+        self.count = len(self.rows)
+        self.pos = [0] * self.count
+        self.piles = collections.defaultdict(list)  # running choice -> ballots counting for it
+        self.running = set()
+
+    def _advance(self, ballot):
+        row, pos = self.rows[ballot], self.pos[ballot]
+        while pos < self.width and row[pos] not in self.running:
+            pos += 1
+        self.pos[ballot] = pos
+        if pos < self.width:
+            self.piles[row[pos]].append(ballot)
+            return row[pos]
+        return None
+
+    def first_preferences(self, running):
+        self.running = set(running)
+        for ballot in range(self.count):
+            self._advance(ballot)
+        return {index: len(pile) for index, pile in self.piles.items()}
+
+    def transfer(self, eliminated):
+        self.running.discard(eliminated)
+        moved, exhausted = collections.Counter(), 0
+        for ballot in self.piles.pop(eliminated, []):
+            index = self._advance(ballot)
+            if index is None:
+                exhausted += 1
+            else:
+                moved[index] += 1
+        return dict(moved), exhausted
+
+    def borda(self):
+        points = collections.Counter()
+        for row in self.rows:
+            for rank, index in enumerate(row):
+                if index != EMPTY:
+                    points[index] += self.width - rank
+        return dict(points)
+
+
+def load(data, width):
+    return (_NumpyBallots if np is not None else _PythonBallots)(data, width)
+
+
+def instant_runoff(data, width, candidates):
+    """rounds of an instant-runoff tally of the ballots in `data` among `candidates` (ballot indexes)
+
+    Every round is a dict with the ``votes`` per running choice, the number of
+    ``exhausted`` ballots and the ``eliminated`` choice - or the ``winner`` in
+    the last round (None without any votes).
+    """
+    ballots = load(data, width)
+    running = set(candidates)
+    counts = ballots.first_preferences(running)
+    exhausted = ballots.count - sum(counts.values())
+
+    rounds = []
+    while running:
+        votes = {index: counts.get(index, 0) for index in running}
+        total = sum(votes.values())
+        leader = max(running, key=lambda index: (votes[index], -index))
+        if not total or votes[leader] * 2 > total or len(running) == 1:
+            rounds.append({'votes': votes, 'exhausted': exhausted, 'eliminated': None,
+                           'winner': leader if total else None})
+            break
+
+        fewest = min(votes.values())
+        tied = [index for index in running if votes[index] == fewest]
+        eliminated = min(tied, key=lambda index: [r['votes'][index] for r in reversed(rounds)] + [-index])
+        rounds.append({'votes': votes, 'exhausted': exhausted, 'eliminated': eliminated, 'winner': None})
+
+        running.discard(eliminated)
+        counts.pop(eliminated, None)
+        moved, lost = ballots.transfer(eliminated)
+        for index, count in moved.items():
+            counts[index] = counts.get(index, 0) + count
+        exhausted += lost
+    return rounds
+
+
+def borda(data, width, candidates):
+    """points per candidate (ballot index) of a Borda count of the ballots in `data`"""
+    points = load(data, width).borda()
+    return {index: points.get(index, 0) for index in candidates}
@@ -1,9 +1,75 @@
+import base64
 import datetime
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+from unittest import mock, skipUnless
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connection, connections
+from django.db.models import Sum
+from django.db.models.functions import Lower
+from django.db.models.signals import post_delete
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 from django.utils import timezone
 
-from .models import Question
+from namevote.log import JsonFormatter, QueueHandler, configured_formatter
+from namevote.sessions import SessionStore
+from namevote.sqlite3.base import DatabaseWrapper
+
+from . import archive, archive_file, metrics, moderation_queue, search, settings as app_settings, tally, views
+from .choice_import import import_choices, read_choice_texts
+from .cloning import clone_question
+from .exceptions import ParticipationAllVotesUsed, RateLimited
+from .forms import AssignVotersForm
+from .models import (VOTER_ID_SESSION_KEY, Ballot, Choice, ModerationRule, ModerationTask, Participation, Question,
+                     QuestionArchive, ResultsSnapshot, VoteBucket, Voter, VoterIdPool)
+from .moderation import ModerationEngine
+from .purge import purge_expired_voters
+from .search import fts_query, search_choices
+from .synthetic import generate
+from .ratelimit import RateLimiter, parse_rate
+from .routers import PIN_PRIMARY_COOKIE, PrimaryReplicaRouter, use_replica
+from .vote_buffer import BufferFile, VoteBuffer
+from .voter_ids import Permutation
+
+
+def create_question(choices=3, **kwargs):
+    """Create a question that is open for voting with `choices` approved choices"""
+    now = timezone.now()
+    defaults = {
+        'text': 'Test Question',
+        'collection_start_date': now - datetime.timedelta(days=2),
+        'collection_end_date': now - datetime.timedelta(days=1),
+        'voting_start_date': now - datetime.timedelta(hours=1),
+        'voting_end_date': now + datetime.timedelta(days=1),
+    }
+    defaults.update(kwargs)
+    question = Question.objects.create(**defaults)
+    for i in range(choices):
+        question.choice_set.create(choice_text='Choice {}'.format(i), review_status=Choice.APPROVED)
+    return question
+
+
+def create_enrolled_voter(question=None, password='secret'):
+    """Create an enrolled voter (allowed to vote on `question`) and return the User"""
+    user = Voter.create_voter(1, question_id=question.id if question else None)[0]
+    user.voter.is_enrolled = True
+    user.set_password(password)
+    user.save()
+    return user
 
 
 class QuestionModelTests(TestCase):
@@ -29,4 +95,1690 @@ class ChoiceModelTests(TestCase):
         # time = timezone.now() + datetime.timedelta(days=30)
         # future_question = Question(pub_date=time)
         # self.assertIs(future_question.was_published_recently(), False)
-        self.assertTrue(True)
\ No newline at end of file
+        self.assertTrue(True)
+
+
+class _BlockingHandler(logging.Handler):
+    """Collects records - waits for `unblock` before handling the first one"""
+
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.lines = []
+
+    def emit(self, record):
+        self.unblock.wait(5)
+        self.lines.append(self.format(record))
+
+
+class QueueHandlerTests(SimpleTestCase):
+
+    def make_handler(self, **kwargs):
+        handler = QueueHandler({'class': '{}._BlockingHandler'.format(__name__)}, **kwargs)
+        self.addCleanup(handler.close)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        return handler
+
+    def make_record(self, msg, *args, level=logging.DEBUG):
+        return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+    def test_records_are_formatted_and_written_by_listener(self):
+        handler = self.make_handler()
+        handler.target.unblock.set()
+
+        handler.handle(self.make_record('hello %s', 'world'))
+        handler.flush()
+
+        self.assertEqual(handler.target.lines, ['DEBUG hello world'])
+
+    def test_prepare_merges_arguments(self):
+        handler = self.make_handler()
+        args = ['before']
+
+        record = handler.prepare(self.make_record('value: %s', args))
+        args[0] = 'after'
+
+        self.assertEqual(record.msg, "value: ['before']")
+        self.assertIsNone(record.args)
+
+    def test_full_queue_drops_and_reports(self):
+        handler = self.make_handler(maxsize=2, block_timeout=0)
+
+        # the first record is taken by the (blocked) listener, two fill the queue
+        for i in range(6):
+            handler.handle(self.make_record('record %s', i))
+        self.assertGreaterEqual(handler.dropped, 3)
+
+        handler.target.unblock.set()
+        handler.flush()
+
+        self.assertTrue(handler.target.lines[-1].startswith('WARNING {} log record(s) dropped'.format(
+            handler.dropped)))
+
+
+class JsonFormatterTests(SimpleTestCase):
+
+    def test_format(self):
+        record = logging.LogRecord('open_choice_polls.views', logging.INFO, __file__, 42, 'hello %s', ('world',), None)
+
+        data = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(data['level'], 'INFO')
+        self.assertEqual(data['logger'], 'open_choice_polls.views')
+        self.assertEqual(data['line'], 42)
+        self.assertEqual(data['message'], 'hello world')
+        self.assertNotIn('exc_info', data)
+
+    def test_configured_formatter(self):
+        # LOG_FORMAT is read when logging is configured, not when the settings are imported
+        with self.settings(LOG_FORMAT='json'):
+            self.assertIsInstance(configured_formatter('%(message)s'), JsonFormatter)
+        with self.settings(LOG_FORMAT='standard'):
+            self.assertEqual(configured_formatter('%(message)s')._fmt, '%(message)s')
+
+
+class VoteCycleTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question()
+        self.user = create_enrolled_voter(self.question)
+        self.kwargs = {'slug': self.question.slug, 'id': self.question.id}
+
+    def test_vote_cycle_does_not_touch_session_table(self):
+        choice = self.question.choice_set.first()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('open_choice_polls:voter-sign-in'),
+                             {'username': self.user.username, 'password': 'secret'})
+            self.client.get(reverse('open_choice_polls:vote', kwargs=self.kwargs))
+            response = self.client.post(reverse('open_choice_polls:vote', kwargs=self.kwargs),
+                                        {'choice': choice.id}, follow=True)
+
+        self.assertContains(response, 'Vote successful!')
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, 1)
+        self.assertFalse([q['sql'] for q in queries if 'django_session' in q['sql']])
+
+    def test_vote_limit_is_enforced_on_post(self):
+        self.question.votes_per_session = 1
+        self.question.save()
+        choice = self.question.choice_set.first()
+        self.client.force_login(self.user)
+
+        for _ in range(3):
+            self.client.post(reverse('open_choice_polls:vote', kwargs=self.kwargs), {'choice': choice.id})
+
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, 1)
+
+
+class CacheSessionStoreTests(SimpleTestCase):
+
+    def test_unchanged_session_is_not_written(self):
+        store = SessionStore()
+        store['voter'] = 1
+        store.create()
+
+        store = SessionStore(store.session_key)
+        store['voter'] = 1
+        with mock.patch.object(store._cache, 'set') as cache_set:
+            store.save()
+        cache_set.assert_not_called()
+
+        store['voter'] = 2
+        with mock.patch.object(store._cache, 'set') as cache_set:
+            store.save()
+        cache_set.assert_called_once()
+
+
+class SQLiteBackendTests(TestCase):
+
+    def test_pragmas_are_applied(self):
+        wrapper = connections['default']
+        if not isinstance(wrapper, DatabaseWrapper):
+            self.skipTest('not using the namevote.sqlite3 backend')
+
+        with wrapper.cursor() as cursor:
+            for name, value in wrapper.pragmas.items():
+                if name in ('busy_timeout', 'cache_size'):
+                    cursor.execute('PRAGMA {}'.format(name))
+                    self.assertEqual(cursor.fetchone()[0], value)
+
+    def test_immediate_transaction_takes_write_lock(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(connection.settings_dict,
+                                 NAME=os.path.join(directory, 'db.sqlite3'),
+                                 OPTIONS={'transaction_mode': 'IMMEDIATE'})
+            wrapper = DatabaseWrapper(settings_dict, alias='immediate')
+            self.addCleanup(wrapper.close)
+
+            wrapper.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+
+            other = sqlite3.connect(settings_dict['NAME'], timeout=0)
+            self.addCleanup(other.close)
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'database is locked'):
+                other.execute('BEGIN IMMEDIATE')
+
+            wrapper.rollback()
+            wrapper.set_autocommit(True)
+
+
+class ReplicaRoutingTests(TestCase):
+    databases = {'default', 'replica'} if 'replica' in settings.DATABASES else {'default'}
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+
+        with mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_DB_REPLICA', 'replica'):
+            self.assertIsNone(router.db_for_read(Choice))
+            with use_replica():
+                self.assertEqual(router.db_for_read(Choice), 'replica')
+                self.assertIsNone(router.db_for_read(User))
+                self.assertEqual(router.db_for_write(Choice), 'default')
+            self.assertIsNone(router.db_for_read(Choice))
+
+    def test_downsample_on_primary(self):
+        if app_settings.OPEN_CHOICE_POLLS_DB_REPLICA is None:
+            self.skipTest('no replica configured (run with --settings=namevote.settings_replica)')
+        question = create_question()
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+        VoteBucket.objects.add(question.pk, {question.choice_set.first().pk: 1}, at=hour)
+
+        # e.g. finalize_results() in the results view
+        with use_replica():
+            self.assertEqual(VoteBucket.objects.downsample(question), 1)
+
+        self.assertEqual(list(VoteBucket.objects.filter(question=question).values_list('seconds', 'votes')),
+                         [(VoteBucket.HOUR, 1)])
+
+    def test_vote_pins_client_to_primary(self):
+        question = create_question()
+        user = create_enrolled_voter(question)
+        self.client.force_login(user)
+
+        with mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_DB_REPLICA', 'replica'):
+            response = self.client.post(reverse('open_choice_polls:vote',
+                                                kwargs={'slug': question.slug, 'id': question.id}),
+                                        {'choice': question.choice_set.first().id})
+
+        self.assertEqual(response.cookies[PIN_PRIMARY_COOKIE]['max-age'],
+                         app_settings.OPEN_CHOICE_POLLS_DB_REPLICA_PIN_SECONDS)
+
+    def test_read_mostly_views_read_from_replica(self):
+        if app_settings.OPEN_CHOICE_POLLS_DB_REPLICA is None:
+            self.skipTest('no replica configured (run with --settings=namevote.settings_replica)')
+        # only the replica knows this question
+        question = Question.objects.using(app_settings.OPEN_CHOICE_POLLS_DB_REPLICA).create(text='Replica')
+        url = reverse('open_choice_polls:question-detail', kwargs={'slug': question.slug, 'id': question.id})
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.client.cookies[PIN_PRIMARY_COOKIE] = '1'
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ResultsSnapshotTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.question = create_question(voting_start_date=now - datetime.timedelta(days=2),
+                                        voting_end_date=now - datetime.timedelta(days=1))
+        self.choices = list(self.question.choice_set.order_by('choice_text'))
+        for choice, votes in zip(self.choices, (3, 1, 3)):
+            choice.votes = votes
+            choice.save()
+        voter = create_enrolled_voter(self.question).voter
+        Participation.objects.filter(voter=voter).update(votes_cast=7)
+        create_enrolled_voter(self.question)
+        self.url = reverse('open_choice_polls:results', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        # read the rows created above (also when a replica is configured)
+        self.client.cookies[PIN_PRIMARY_COOKIE] = '1'
+
+    def test_finalize_results(self):
+        snapshot = self.question.finalize_results()
+
+        self.assertEqual(snapshot.total_votes, 7)
+        self.assertEqual(snapshot.allowed_voters, 2)
+        self.assertEqual(snapshot.participating_voters, 1)
+        self.assertEqual([(r['rank'], r['choice_text'], r['votes']) for r in snapshot.results],
+                         [(1, 'Choice 0', 3), (1, 'Choice 2', 3), (3, 'Choice 1', 1)])
+        self.assertEqual(self.question.finalize_results().pk, snapshot.pk)
+
+        with self.assertRaises(IntegrityError):
+            snapshot.save()
+
+    def test_no_snapshot_while_voting(self):
+        question = create_question()
+        self.assertIsNone(question.finalize_results())
+
+    def test_results_view_serves_snapshot(self):
+        response = self.client.get(self.url)
+
+        self.assertContains(response, 'Final results')
+        self.assertIn('max-age={}'.format(app_settings.OPEN_CHOICE_POLLS_RESULTS_MAX_AGE),
+                      response['Cache-Control'])
+        self.assertTrue(ResultsSnapshot.objects.filter(question=self.question).exists())
+
+        # tallies are frozen
+        Choice.objects.filter(pk=self.choices[1].pk).update(votes=100)
+        self.assertContains(self.client.get(self.url), 'Total Votes: 7')
+
+    def test_reset_votes_invalidates_snapshot(self):
+        self.question.finalize_results()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+
+        self.client.post(reverse('admin:open_choice_polls_choice_changelist'),
+                         {'action': 'reset_votes', '_selected_action': [c.pk for c in self.choices]})
+
+        self.assertFalse(ResultsSnapshot.objects.filter(question=self.question).exists())
+        self.assertEqual(self.question.finalize_results().total_votes, 0)
+
+
+class ParticipationResolverTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question()
+        self.user = create_enrolled_voter(self.question)
+        self.url = reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def selects(queries, table):
+        return [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "{}"'.format(table) in q['sql']]
+
+    def test_vote_resolves_participation_once(self):
+        choice = self.question.choice_set.first()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertEqual(len(self.selects(queries, 'open_choice_polls_participation')), 1)
+        self.assertFalse(self.selects(queries, 'open_choice_polls_voter'))
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'choice': choice.id})
+        self.assertEqual(len(self.selects(queries, 'open_choice_polls_participation')), 1)
+        self.assertEqual(len(self.selects(queries, 'open_choice_polls_choice')), 1)
+        self.assertFalse(self.selects(queries, 'open_choice_polls_voter'))
+
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, 1)
+
+    def test_vote_query_counts(self):
+        choice = self.question.choice_set.first()
+
+        # user, question, participation, approved choices
+        with self.assertNumQueries(4):
+            self.client.get(self.url)
+        # user, question, choice, participation, update participation, choice, question and vote bucket
+        # (in a savepoint)
+        with self.assertNumQueries(10):
+            self.client.post(self.url, {'choice': choice.id})
+
+    def test_voter_id_is_looked_up_for_older_sessions(self):
+        session = self.client.session
+        del session['_ocp_voter_id']
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(len(self.selects(queries, 'open_choice_polls_voter')), 1)
+
+    def test_voter_and_question_are_unique(self):
+        with self.assertRaises(IntegrityError):
+            Participation.objects.create(voter=self.user.voter, question=self.question)
+
+
+class QueryPlanMixin:
+    """Check querysets against the SQLite query planner"""
+
+    # full table (or index) scans and sorts in a temporary B-tree
+    BAD_PLAN_STEPS = ('SCAN', 'USE TEMP B-TREE')
+
+    def assertIndexed(self, queryset):
+        """fail if the query plan of `queryset` scans a table or sorts the rows"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('query plans are only checked on SQLite')
+
+        plan = queryset.explain()
+        for step in plan.splitlines():
+            for bad in self.BAD_PLAN_STEPS:
+                self.assertNotIn(bad, step, msg='{}\n\n{}'.format(queryset.query, plan))
+
+
+class ChoiceQueryPlanTests(QueryPlanMixin, TestCase):
+
+    def setUp(self):
+        self.question = create_question()
+
+    def test_results(self):
+        self.assertIndexed(Choice.approved.filter(question=self.question.id).order_by('-votes').
+                           values_list('id', 'choice_text', 'votes'))
+
+    def test_choices_by_status(self):
+        for manager in (Choice.approved, Choice.open, Choice.rejected):
+            self.assertIndexed(manager.filter(question=self.question.id).order_by(Lower('choice_text')))
+        self.assertIndexed(self.question.choice_set.filter(review_status=Choice.APPROVED))
+
+    def test_duplicate_check(self):
+        # as run by ChoiceForm.clean() - get() drops the default ordering
+        self.assertIndexed(self.question.choice_set.filter(choice_text='Choice 1').order_by())
+
+    def test_choices_delta(self):
+        self.assertIndexed(self.question.choice_set.filter(modified__gt=timezone.now()).order_by('modified').
+                           values_list('pk', 'review_status', 'choice_text'))
+
+
+class VoterIdAllocationTests(TestCase):
+
+    def test_permutation_is_a_bijection(self):
+        for size in (1, 2, 999, 1000, 4097):
+            permutation = Permutation(size, 'key')
+            self.assertEqual(sorted(permutation[i] for i in range(size)), list(range(size)))
+
+    def test_permutation_depends_on_key(self):
+        first, second = Permutation(1000, 'one'), Permutation(1000, 'two')
+        self.assertNotEqual([first[i] for i in range(20)], [second[i] for i in range(20)])
+
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_VOTER_RANGE_START', 0)
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_VOTER_RANGE_END', 50)
+    def test_batches_do_not_overlap_and_skip_taken_ids(self):
+        pool, indices = VoterIdPool.allocate(1)
+        taken = '{}{}'.format(app_settings.OPEN_CHOICE_POLLS_VOTER_PREFIX, str(pool.voter_id(1)).zfill(3))
+        User.objects.create_user(taken)
+
+        usernames = VoterIdPool.allocate_usernames(20) + VoterIdPool.allocate_usernames(20)
+
+        self.assertEqual(len(usernames), 40)
+        self.assertEqual(len(set(usernames)), 40)
+        self.assertNotIn(taken, usernames)
+        # 1 + 20 + 20 ids handed out plus the one skipped
+        self.assertEqual(VoterIdPool.objects.get().next_index, 42)
+
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_VOTER_RANGE_START', 0)
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_VOTER_RANGE_END', 5)
+    def test_create_voter_stops_when_range_is_used_up(self):
+        users = Voter.create_voter(10)
+
+        self.assertEqual(len(users), 5)
+        self.assertEqual(Voter.create_voter(1), [])
+
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_VOTER_ID_WIDTH', 7)
+    def test_id_width(self):
+        username = Voter.create_voter(1)[0].username
+        self.assertRegex(username, r'^{}0\d{{6}}$'.format(app_settings.OPEN_CHOICE_POLLS_VOTER_PREFIX))
+
+
+class ChoiceImportTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=1, choice_validation_regex=r'^[A-Z]')
+
+    def test_import(self):
+        texts = ['Choice 0', '  New   one ', 'New one', 'lowercase', '', 'x' * 201, 'X' * 101, 'X' * 100, 'Another']
+
+        result = import_choices(self.question, iter(texts), review_status=Choice.APPROVED, batch_size=2)
+
+        self.assertEqual((result.created, result.duplicates, result.invalid), (3, 2, 4))
+        self.assertEqual(sorted(Choice.approved.filter(question=self.question).values_list('choice_text', flat=True)),
+                         ['Another', 'Choice 0', 'New one', 'X' * 100])
+
+    def test_read_formats(self):
+        self.assertEqual(list(read_choice_texts(['choice_text,remark\n', 'A,x\n', '"B, C",y\n'], 'csv')),
+                         ['A', 'B, C'])
+        self.assertEqual(list(read_choice_texts(['A\n', 'B\n'], 'csv')), ['A', 'B'])
+        self.assertEqual(list(read_choice_texts(['"A"\n', '\n', '{"choice_text": "B"}\n', '[1]\n'], 'jsonl')),
+                         ['A', 'B', ''])
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('"Alpha"\n"Beta"\n"Alpha"\n')
+        self.addCleanup(os.remove, f.name)
+
+        call_command('import_choices', str(self.question.pk), f.name, stdout=io.StringIO())
+
+        self.assertEqual(Choice.open.filter(question=self.question).count(), 2)
+        with self.assertRaises(CommandError):
+            call_command('import_choices', str(self.question.pk), f.name + '.missing', stdout=io.StringIO())
+
+    def test_admin_upload(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        url = reverse('admin:open_choice_polls_question_import_choices', args=(self.question.pk,))
+        self.assertContains(self.client.get(reverse('admin:open_choice_polls_question_change',
+                                                    args=(self.question.pk,))), url)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        upload = SimpleUploadedFile('choices.csv', 'Alpha\nBeta\n'.encode())
+
+        response = self.client.post(url, {'file': upload, 'format': '', 'review_status': Choice.APPROVED})
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Choice.approved.filter(question=self.question).count(), 3)
+
+
+class ModerationTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=0, choice_validation_regex=r'^[A-Z]',
+                                        choice_validation_hint='Start with a capital letter')
+        self.question.choice_set.create(choice_text='Approved', review_status=Choice.APPROVED)
+        for text in ('approved', 'APPROVED', 'Ok', 'Okay', 'Spam offer', 'lowercase', 'Fine name', 'Bad spam'):
+            self.question.choice_set.create(choice_text=text)
+        ModerationRule.objects.create(position=1, kind=ModerationRule.MIN_LENGTH, value='3')
+        ModerationRule.objects.create(position=2, kind=ModerationRule.BANNED_WORDS, value='spam\nscam',
+                                      remark='Banned word')
+        ModerationRule.objects.create(position=3, kind=ModerationRule.DUPLICATE_OF_APPROVED)
+        ModerationRule.objects.create(position=4, kind=ModerationRule.REGEX, value='^F', action=Choice.APPROVED,
+                                      question=self.question)
+        ModerationRule.objects.create(position=5, kind=ModerationRule.MAX_LENGTH, value='1', is_active=False)
+        self.engine = ModerationEngine.for_question(self.question)
+
+    def status(self):
+        return dict(self.question.choice_set.values_list('choice_text', 'review_status'))
+
+    def test_dry_run_counts_first_matching_rule(self):
+        counts = [count for rule, count in self.engine.run(self.question.choice_set.all(), dry_run=True)]
+
+        # regex, min length, banned words, duplicate, approve
+        self.assertEqual(counts, [2, 1, 2, 1, 1])
+        self.assertEqual(Choice.open.filter(question=self.question).count(), 8)
+
+    def test_run(self):
+        counts = [count for rule, count in self.engine.run(self.question.choice_set.all())]
+
+        self.assertEqual(counts, [2, 1, 2, 1, 1])
+        status = self.status()
+        self.assertEqual(status['approved'], Choice.REJECTED)
+        self.assertEqual(status['Ok'], Choice.REJECTED)
+        self.assertEqual(status['Bad spam'], Choice.REJECTED)
+        self.assertEqual(status['APPROVED'], Choice.REJECTED)
+        self.assertEqual(status['Fine name'], Choice.APPROVED)
+        self.assertEqual(status['Okay'], Choice.OPEN)
+        self.assertEqual(self.question.choice_set.get(choice_text='Spam offer').review_remark, 'Banned word')
+        self.assertTrue(self.question.choice_set.get(choice_text='lowercase').review_remark.startswith('Failed Regex'))
+
+    def test_banned_words_match_whole_words(self):
+        for text in ('Spamalot', 'Anti-spam', 'Scam!'):
+            self.question.choice_set.create(choice_text=text)
+
+        self.engine.run(self.question.choice_set.filter(choice_text__in=['Spamalot', 'Anti-spam', 'Scam!']))
+
+        status = self.status()
+        self.assertEqual(status['Spamalot'], Choice.OPEN)
+        self.assertEqual(status['Anti-spam'], Choice.REJECTED)
+        self.assertEqual(status['Scam!'], Choice.REJECTED)
+
+    def test_command_and_admin_action(self):
+        out = io.StringIO()
+        call_command('moderate_choices', '--dry-run', question=str(self.question.pk), stdout=out)
+        self.assertIn('Dry run', out.getvalue())
+        self.assertEqual(Choice.open.filter(question=self.question).count(), 8)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:open_choice_polls_question_changelist'),
+                         {'action': 'moderate_open_choices', '_selected_action': [self.question.pk]})
+        self.assertEqual(Choice.open.filter(question=self.question).count(), 1)
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.limiter = RateLimiter()
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('10/m'), (10, 60))
+        for rate in ('10', '0/s', '1/w', 'ten/m'):
+            with self.assertRaises(ValueError):
+                parse_rate(rate)
+
+    def test_bucket(self):
+        for _ in range(3):
+            self.limiter.check({'a': '3/m', 'b': None})
+
+        with self.assertRaises(RateLimited) as ctx:
+            self.limiter.check({'a': '3/m'})
+        self.assertAlmostEqual(ctx.exception.retry_after, 20, delta=1)
+
+        # a rejected request takes no token from the other buckets
+        with self.assertRaises(RateLimited):
+            self.limiter.check({'a': '3/m', 'c': '1/m'})
+        self.limiter.check({'c': '1/m'})
+
+    def test_limit_holds_across_threads(self):
+        allowed = []
+        barrier = threading.Barrier(20)
+
+        def client():
+            barrier.wait()
+            for _ in range(10):
+                try:
+                    self.limiter.check({'shared': '50/h'})
+                    allowed.append(1)
+                except RateLimited:
+                    pass
+
+        threads = [threading.Thread(target=client) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(allowed), 50)
+
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_RATE_LIMITS',
+                       {'suggestion': {'ip': '2/m', 'user': None, 'question': None}})
+    def test_suggestions_get_429(self):
+        now = timezone.now()
+        question = create_question(collection_start_date=now - datetime.timedelta(days=1),
+                                   collection_end_date=now + datetime.timedelta(days=1))
+        url = reverse('open_choice_polls:choices', kwargs={'slug': question.slug, 'id': question.id})
+
+        for i in range(2):
+            self.assertEqual(self.client.post(url, {'choice_text': 'Suggestion {}'.format(i)}).status_code, 302)
+        response = self.client.post(url, {'choice_text': 'Suggestion 2'})
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertFalse(question.choice_set.filter(choice_text='Suggestion 2').exists())
+        # GET is not limited
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    @mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_RATE_LIMITS', {})
+    def test_question_rate_limit(self):
+        question = create_question(vote_rate_limit='1/h')
+        url = reverse('open_choice_polls:vote', kwargs={'slug': question.slug, 'id': question.id})
+        choice = question.choice_set.first()
+
+        for user in (create_enrolled_voter(question), create_enrolled_voter(question)):
+            self.client.force_login(user)
+            response = self.client.post(url, {'choice': choice.id})
+
+        self.assertEqual(response.status_code, 429)
+        choice.refresh_from_db()
+        self.assertEqual(choice.votes, 1)
+
+
+class VoteBufferTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.buffer = VoteBuffer(self.directory, fsync=False)
+
+        self.question = create_question(votes_per_session=2)
+        self.choices = list(self.question.choice_set.all())
+        self.participation = Participation.objects.get(voter=create_enrolled_voter(self.question).voter)
+
+    def test_votes_are_aggregated_and_limit_is_exact(self):
+        self.buffer.append(self.participation, self.choices[0], 2)
+        self.buffer.append(self.participation, self.choices[0], 2)
+        with self.assertRaises(ParticipationAllVotesUsed):
+            self.buffer.append(self.participation, self.choices[1], 2)
+        self.assertEqual(self.buffer.pending(self.participation.pk), 2)
+
+        # segment flushed already?, savepoint, participation, choices, choice, question, vote bucket, segment,
+        # snapshots, release savepoint
+        with self.assertNumQueries(10):
+            self.assertEqual(self.buffer.flush(), 2)
+
+        self.choices[0].refresh_from_db()
+        self.participation.refresh_from_db()
+        self.assertEqual((self.choices[0].votes, self.participation.votes_cast), (2, 2))
+        # flushed votes still count against the limit
+        with self.assertRaises(ParticipationAllVotesUsed):
+            self.buffer.append(self.participation, self.choices[1], 2)
+
+    def test_crash_recovery(self):
+        self.buffer.append(self.participation, self.choices[0], 2)
+        with open(self.buffer.log_path(), 'a') as f:
+            f.write('{} {}'.format(self.participation.pk, self.choices[1].pk.hex[:8]))  # torn last line
+
+        # crash after the log was moved aside, before its transaction
+        with mock.patch.object(VoteBuffer, 'apply_segment', side_effect=DatabaseError('crash')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(len(self.buffer.segments()), 1)
+
+        # crash after the transaction, before the segment was deleted
+        with mock.patch('os.remove', side_effect=OSError('crash')):
+            with self.assertRaises(OSError):
+                VoteBuffer(self.directory).flush()
+        self.assertEqual(len(self.buffer.segments()), 1)
+
+        # the votes of the segment count against the limit - once
+        self.buffer.append(self.participation, self.choices[1], 2)
+        with self.assertRaises(ParticipationAllVotesUsed):
+            self.buffer.append(self.participation, self.choices[1], 2)
+
+        # replayed on the next flush - exactly once
+        self.buffer.flush()
+        self.assertEqual(self.buffer.segments(), [])
+
+        self.assertEqual([c.votes for c in Choice.objects.filter(pk__in=[c.pk for c in self.choices[:2]]).
+                         order_by('choice_text')], [1, 1])
+        self.participation.refresh_from_db()
+        self.assertEqual(self.participation.votes_cast, 2)
+
+    def test_pending_votes_are_read_incrementally(self):
+        self.buffer.append(self.participation, self.choices[0], 2)
+        with open(self.buffer.log_path(), 'a') as f:
+            # appended by another process
+            f.write('{} {}\n'.format(self.participation.pk, self.choices[1].pk.hex))
+        self.assertEqual(self.buffer.pending(self.participation.pk), 2)
+        buffer_file, = self.buffer.pending_votes.files.values()
+        self.assertEqual(buffer_file.offset, os.path.getsize(self.buffer.log_path()))
+
+        # moved aside but not applied yet
+        with mock.patch.object(VoteBuffer, 'apply_segment', side_effect=DatabaseError('crash')):
+            with self.assertRaises(DatabaseError):
+                self.buffer.flush()
+        self.assertEqual(VoteBuffer(self.directory).pending(self.participation.pk), 2)
+        with mock.patch.object(BufferFile, 'read') as read:
+            self.assertEqual(self.buffer.pending(self.participation.pk), 2)
+        read.assert_not_called()
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.assertEqual(self.buffer.pending(self.participation.pk), 0)
+        self.assertEqual(self.buffer.pending_votes.files, {})
+
+    def test_torn_line_does_not_swallow_next_vote(self):
+        with open(self.buffer.log_path(), 'w') as f:
+            f.write('{} {}'.format(self.participation.pk, self.choices[1].pk.hex[:8]))
+
+        self.buffer.append(self.participation, self.choices[0], 2)
+
+        self.assertEqual(list(VoteBuffer.read_votes(self.buffer.log_path())), [(self.participation.pk,
+                                                                             self.choices[0].pk)])
+
+    def test_vote_view(self):
+        self.client.force_login(self.participation.voter.user)
+        url = reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug, 'id': self.question.id})
+
+        with mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_VOTE_BUFFER', self.directory):
+            for _ in range(3):
+                self.client.post(url, {'choice': self.choices[0].id})
+            self.assertRedirects(self.client.get(url), reverse('open_choice_polls:results', kwargs={
+                'slug': self.question.slug, 'id': self.question.id}), fetch_redirect_response=False)
+            self.choices[0].refresh_from_db()
+            self.assertEqual(self.choices[0].votes, 0)
+
+            call_command('flush_votes', '--once', stdout=io.StringIO())
+
+        self.choices[0].refresh_from_db()
+        self.assertEqual(self.choices[0].votes, 2)
+
+
+class QuestionCounterTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=2)
+        self.user = create_enrolled_voter(self.question)
+
+    def assertCounters(self, total_choices, total_approved_choices, total_votes, allowed_voters):
+        question = Question.objects.get(pk=self.question.pk)
+        counters = [getattr(question, name) for name in Question.COUNTER_FIELDS]
+        self.assertEqual(counters, [total_choices, total_approved_choices, total_votes, allowed_voters])
+        Question.objects.filter(pk=question.pk).update_counters()
+        question.refresh_from_db()
+        self.assertEqual([getattr(question, name) for name in Question.COUNTER_FIELDS], counters)
+
+    def test_counters_follow_writes(self):
+        self.assertCounters(2, 2, 0, 1)
+
+        choice = self.question.choice_set.create(choice_text='Open')
+        self.assertCounters(3, 2, 0, 1)
+        choice.review_status = Choice.APPROVED
+        choice.save()
+        self.assertCounters(3, 3, 0, 1)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug,
+                                                                   'id': self.question.id}), {'choice': choice.id})
+        self.assertCounters(3, 3, 1, 1)
+
+        # a stale instance does not write back its counters
+        self.question.text = 'Renamed'
+        self.question.save()
+        self.assertCounters(3, 3, 1, 1)
+
+        Choice.objects.get(pk=choice.pk).delete()
+        self.assertCounters(2, 2, 0, 1)
+
+        import_choices(self.question, ['Imported 1', 'Imported 2'], review_status=Choice.APPROVED)
+        self.assertCounters(4, 4, 0, 1)
+
+        Participation.objects.filter(question=self.question).get().delete()
+        create_enrolled_voter(self.question)
+        create_enrolled_voter(self.question)
+        self.assertCounters(4, 4, 0, 2)
+
+    def test_admin_bulk_actions(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+
+        self.client.post(reverse('admin:open_choice_polls_choice_changelist'),
+                         {'action': 'reject', '_selected_action': [c.pk for c in self.question.choice_set.all()]})
+        self.assertCounters(2, 0, 0, 1)
+
+    def test_recount_repairs_drift(self):
+        Question.objects.filter(pk=self.question.pk).update(total_choices=10, total_votes=3)
+
+        out = io.StringIO()
+        call_command('recount', stdout=out)
+
+        self.assertIn('1 question(s)', out.getvalue())
+        self.assertCounters(2, 2, 0, 1)
+
+    def test_list_pages_read_counters_without_queries(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        create_question()
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('admin:open_choice_polls_question_changelist'))
+
+        self.assertFalse([q['sql'] for q in queries if 'open_choice_polls_choice' in q['sql'] or
+                          'open_choice_polls_participation' in q['sql']])
+
+
+class AssignVotersTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question()
+        self.other = create_question()
+        Voter.create_voter(5, question_id=self.other.id)
+        self.voters = Voter.objects.filter(is_voter=True)
+
+    def test_grant_and_revoke(self):
+        # one existing but disallowed participation is updated, the others are inserted
+        voter = self.voters[0]
+        Participation.objects.create(voter=voter, question=self.question, is_allowed=False)
+
+        self.assertEqual(Participation.objects.grant(self.question, self.voters), 5)
+        self.assertEqual(Participation.objects.grant(self.question, self.voters), 0)
+        self.assertEqual(self.question.participation_set.filter(is_allowed=True).count(), 5)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 5)
+
+        self.assertEqual(Participation.objects.revoke(self.question, self.voters.filter(pk=voter.pk)), 1)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 4)
+        self.assertEqual(self.question.participation_set.count(), 5)
+
+    def test_admin_action(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.force_login(admin)
+        url = reverse('admin:open_choice_polls_voter_changelist')
+        selected = [v.pk for v in self.voters[:3]]
+
+        response = self.client.post(url, {'action': 'assign_to_question', '_selected_action': selected})
+        self.assertContains(response, '3 voter(s) selected.')
+        self.assertEqual(self.question.participation_set.count(), 0)
+
+        self.client.post(url, {'action': 'assign_to_question', '_selected_action': selected, 'apply': 'Apply',
+                               'question': self.question.pk, 'operation': AssignVotersForm.GRANT})
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 3)
+
+        self.client.post(url, {'action': 'assign_to_question', '_selected_action': selected[:1], 'apply': 'Apply',
+                               'question': self.question.pk, 'operation': AssignVotersForm.REVOKE})
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 2)
+
+    def test_command_copies_eligibility(self):
+        create_enrolled_voter()  # not allowed on the other question
+
+        out = io.StringIO()
+        call_command('assign_voters', str(self.question.pk), from_question=str(self.other.pk), stdout=out)
+
+        self.assertIn('5 voter(s)', out.getvalue())
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 5)
+
+        call_command('assign_voters', str(self.question.pk), enrolled=True, stdout=out)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 6)
+
+        call_command('assign_voters', str(self.question.pk), revoke=True, stdout=out)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 0)
+
+        with self.assertRaises(CommandError):
+            call_command('assign_voters', 'no-such-question', stdout=out)
+
+
+class ExpiredVoterTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question()
+        self.expired = Voter.create_voter(3, code_valid_timedelta_days=1, question_id=self.question.id)
+        self.valid = Voter.create_voter(1, code_valid_timedelta_days=1, question_id=self.question.id)
+        self.enrolled = create_enrolled_voter(self.question)
+        Voter.objects.filter(user__in=self.expired + [self.enrolled]). \
+            update(enrollment_code_valid_until=timezone.now() - datetime.timedelta(days=1))
+
+    def test_purge(self):
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 5)
+
+        handler = mock.Mock()
+        post_delete.connect(handler)
+        try:
+            self.assertEqual(purge_expired_voters(batch_size=2), 3)
+        finally:
+            post_delete.disconnect(handler)
+        handler.assert_not_called()
+
+        self.assertFalse(User.objects.filter(pk__in=[u.pk for u in self.expired]).exists())
+        self.assertEqual(Voter.objects.filter(is_voter=True).count(), 2)
+        self.assertEqual(self.question.participation_set.count(), 2)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).allowed_voters, 2)
+        self.assertEqual(purge_expired_voters(), 0)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('purge_expired_voters', dry_run=True, stdout=out)
+        self.assertIn('3 expired voter(s)', out.getvalue())
+        self.assertEqual(User.objects.count(), 5)
+
+        call_command('purge_expired_voters', stdout=out)
+        self.assertIn('Purged 3 expired voter(s)', out.getvalue())
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_enroll_rejects_expired_code(self):
+        with mock.patch('open_choice_polls.views.authenticate') as authenticate:
+            response = self.client.post(reverse('open_choice_polls:voter-enroll'),
+                                        {'enrollment_code': self.expired[0].voter.enrollment_code})
+        authenticate.assert_not_called()
+        self.assertRedirects(response, reverse('open_choice_polls:voter-enroll'), fetch_redirect_response=False)
+        self.assertFalse(Voter.objects.get(user=self.expired[0]).is_enrolled)
+
+        self.client.post(reverse('open_choice_polls:voter-enroll'),
+                         {'enrollment_code': self.valid[0].voter.enrollment_code})
+        self.assertTrue(Voter.objects.get(user=self.valid[0]).is_enrolled)
+
+
+class VoterWriteTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question()
+
+    def test_dirty_fields(self):
+        user = create_enrolled_voter(self.question)
+        voter = Voter.objects.get(user=user)
+        self.assertEqual(voter.get_dirty_fields(), [])
+
+        voter.enrollment_code_is_distributed = True
+        self.assertEqual(voter.get_dirty_fields(), ['enrollment_code_is_distributed'])
+        voter.save()
+        self.assertEqual(voter.get_dirty_fields(), [])
+
+    def test_user_save_writes_changed_voter_fields_only(self):
+        user = create_enrolled_voter(self.question)
+        user = User.objects.get(pk=user.pk)
+
+        with self.assertNumQueries(1):  # voter not loaded
+            user.save()
+
+        user.voter.enrollment_code_is_distributed = True
+        with CaptureQueriesContext(connection) as queries:
+            user.save()
+        self.assertEqual(len(queries), 2)
+        self.assertIn('SET "enrollment_code_is_distributed"', queries[1]['sql'])
+        self.assertNotIn('"is_enrolled"', queries[1]['sql'])
+        self.assertTrue(Voter.objects.get(user=user).enrollment_code_is_distributed)
+
+    def test_sign_in_queries(self):
+        user = create_enrolled_voter(self.question)
+
+        # user, voter (is enrolled?) and last_login - no write to the voter
+        with self.assertNumQueries(3):
+            self.client.post(reverse('open_choice_polls:voter-sign-in'),
+                             {'username': user.username, 'password': 'secret'})
+        self.assertEqual(self.client.session[VOTER_ID_SESSION_KEY], user.voter.pk)
+
+    def test_enroll_queries(self):
+        user = Voter.create_voter(1, question_id=self.question.id)[0]
+
+        # voter (with user), user (authenticate), password, is_enrolled and last_login
+        with self.assertNumQueries(5):
+            self.client.post(reverse('open_choice_polls:voter-enroll'), {'enrollment_code': user.voter.enrollment_code})
+        self.assertTrue(Voter.objects.get(user=user).is_enrolled)
+
+
+class MetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def use_directory(self):
+        for name, value in (('_values', None), ('_values_pid', None)):
+            patcher = mock.patch.object(metrics, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_METRICS_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_mmap_values(self):
+        path = os.path.join(self.directory, 'metrics-1.db')
+        values = metrics.MmapValues(path)
+        for idx in range(5000):  # grows the file
+            values.inc('key-{}'.format(idx), idx)
+        values.inc('key-1', 0.5)
+
+        self.assertGreater(os.path.getsize(path), metrics.MmapValues.INITIAL_SIZE)
+        self.assertEqual(dict(metrics.read_file(path))['key-1'], 1.5)
+        self.assertEqual(dict(metrics.MmapValues(path).items())['key-4999'], 4999)
+
+    def test_processes_are_aggregated(self):
+        self.use_directory()
+        metrics.SUGGESTIONS.inc()
+
+        pid = os.fork()
+        if not pid:
+            metrics.SUGGESTIONS.inc(2)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertEqual(metrics.get_sample_value('ocp_suggestions_total'), 3)
+
+    def test_histogram(self):
+        self.use_directory()
+        for value in (0.001, 0.2, 0.3, 20):
+            metrics.VIEW_DURATION.observe(value, view='test', method='GET')
+
+        text = metrics.exposition()
+        self.assertIn('ocp_view_duration_seconds_bucket{view="test",method="GET",le="0.005"} 1.0', text)
+        self.assertIn('ocp_view_duration_seconds_bucket{view="test",method="GET",le="0.25"} 2.0', text)
+        self.assertIn('ocp_view_duration_seconds_bucket{view="test",method="GET",le="10.0"} 3.0', text)
+        self.assertIn('ocp_view_duration_seconds_bucket{view="test",method="GET",le="+Inf"} 4.0', text)
+        self.assertIn('ocp_view_duration_seconds_count{view="test",method="GET"} 4.0', text)
+
+    def test_votes_and_rejections(self):
+        self.use_directory()
+        question = create_question(votes_per_session=1)
+        self.client.force_login(create_enrolled_voter(question))
+        url = reverse('open_choice_polls:vote', kwargs={'slug': question.slug, 'id': question.id})
+        choice = question.choice_set.first()
+
+        self.client.post(url, {'choice': choice.id})
+        self.client.post(url, {'choice': choice.id})
+
+        self.assertEqual(metrics.get_sample_value('ocp_votes_total', buffered='false'), 1)
+        self.assertEqual(metrics.get_sample_value('ocp_votes_rejected_total', reason='ParticipationAllVotesUsed'), 1)
+        self.assertEqual(metrics.get_sample_value('ocp_view_duration_seconds_count', view='open_choice_polls:vote',
+                                                  method='POST'), 2)
+
+    def test_endpoint_access(self):
+        self.use_directory()
+        url = reverse('open_choice_polls:metrics')
+
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        self.assertContains(response, '# TYPE ocp_votes counter')
+
+        auth = 'Basic ' + base64.b64encode('{}:{}'.format(settings.BASIC_AUTH_LOGIN,
+                                                          settings.BASIC_AUTH_PASSWORD).encode()).decode()
+        with self.settings(BASIC_AUTH_WHITELISTED_IP_NETWORKS=['10.0.0.0/8']):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=auth).status_code, 403)
+            self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=auth).status_code, 200)
+
+
+class RankedVotingTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=0, counting_method=Question.INSTANT_RUNOFF, ranked_choices=3)
+        self.choices = {text: self.question.choice_set.create(choice_text=text, review_status=Choice.APPROVED)
+                        for text in ('Alpha', 'Beta', 'Gamma', 'Delta')}
+        self.question.assign_ballot_indexes()
+        self.indexes = dict(self.question.choice_set.values_list('choice_text', 'ballot_index'))
+        cache.clear()
+
+    def cast(self, *rankings):
+        for ranking in rankings:
+            user = create_enrolled_voter(self.question)
+            self.client.force_login(user)
+            response = self.client.post(reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug,
+                                                                                  'id': self.question.id}),
+                                        {'ranking': [str(self.choices[text].id) for text in ranking]})
+            self.assertEqual(response.status_code, 302)
+
+    def ballots(self, *rankings):
+        return b''.join(tally.encode_ballot([self.indexes[text] for text in ranking], 3) for ranking in rankings)
+
+    def test_encoding(self):
+        data = tally.encode_ballot([3, 0], 3)
+        self.assertEqual(len(data), 6)
+        self.assertEqual(tally.decode_ballot(data), [3, 0])
+        with self.assertRaises(ValueError):
+            tally.encode_ballot([0, 1, 2, 3], 3)
+        self.assertEqual(tally.join_ballots([data, data[:2]], 2), data[:4] + data[:2] + b'\xff\xff')
+
+    def test_instant_runoff(self):
+        # Delta is eliminated first (fewest votes), its ballot moves on to Gamma,
+        # then Gamma (tied with Beta, but fewer votes in round 1) - and Alpha wins
+        data = self.ballots(['Alpha'], ['Alpha'], ['Alpha', 'Beta'], ['Beta', 'Alpha'], ['Beta'],
+                            ['Gamma', 'Alpha'], ['Delta', 'Gamma'], ['Beta'], ['Gamma'])
+        rounds = tally.instant_runoff(data, 3, self.indexes.values())
+
+        names = {index: text for text, index in self.indexes.items()}
+        self.assertEqual([names[r['eliminated']] for r in rounds[:-1]], ['Delta', 'Gamma'])
+        self.assertEqual(names[rounds[-1]['winner']], 'Alpha')
+        self.assertEqual(rounds[-1]['votes'], {self.indexes['Alpha']: 4, self.indexes['Beta']: 3})
+        self.assertEqual(rounds[-1]['exhausted'], 2)
+
+    def test_borda(self):
+        data = self.ballots(['Alpha', 'Beta', 'Gamma'], ['Beta', 'Alpha'], ['Beta'])
+        points = tally.borda(data, 3, self.indexes.values())
+        self.assertEqual(points, {self.indexes['Alpha']: 5, self.indexes['Beta']: 8,
+                                  self.indexes['Gamma']: 1, self.indexes['Delta']: 0})
+
+    @skipUnless(tally.np is not None, "NumPy is not installed")
+    def test_numpy_and_python_agree(self):
+        rnd = random.Random(0)
+        data = b''.join(tally.encode_ballot(rnd.sample(range(40), rnd.randint(0, 5)), 5) for _ in range(5000))
+        numpy_rounds = tally.instant_runoff(data, 5, range(40))
+        with mock.patch.object(tally, 'np', None):
+            self.assertEqual(tally.instant_runoff(data, 5, range(40)), numpy_rounds)
+
+    def test_vote_and_results(self):
+        self.cast(['Alpha', 'Beta'], ['Beta', 'Alpha'], ['Gamma', 'Alpha'])
+
+        ballot = Ballot.objects.first()
+        self.assertEqual(len(ballot.ranking), 6)
+        self.assertEqual(Ballot.objects.count(), 3)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).total_votes, 3)
+        self.assertEqual(Choice.objects.get(pk=self.choices['Alpha'].pk).votes, 1)  # first preferences
+
+        response = self.client.get(reverse('open_choice_polls:results', kwargs={'slug': self.question.slug,
+                                                                                'id': self.question.id}))
+        rounds = response.context['rounds']
+        self.assertEqual(rounds[-1]['winner'], 'Alpha')
+        self.assertContains(response, 'Winner: <b>Alpha</b>')
+
+    def test_same_choice_spelled_differently(self):
+        url = reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        self.client.force_login(create_enrolled_voter(self.question))
+        choice_id = self.choices['Alpha'].id
+
+        response = self.client.post(url, {'ranking': [str(choice_id), str(choice_id).upper(), choice_id.hex]})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Each choice can only be ranked once.')
+        response = self.client.post(url, {'ranking': [str(choice_id), 'not-a-uuid']})
+        self.assertContains(response, 'Not found')
+        self.assertFalse(Ballot.objects.exists())
+
+    def test_rounds_are_cached_until_the_next_ballot(self):
+        url = reverse('open_choice_polls:results', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        self.cast(['Beta', 'Alpha'])
+        with mock.patch.object(Question, 'compute_rounds', autospec=True,
+                               side_effect=Question.compute_rounds) as compute_rounds:
+            self.assertEqual(self.client.get(url).context['rounds'][-1]['winner'], 'Beta')
+            self.assertEqual(self.client.get(url).context['rounds'][-1]['winner'], 'Beta')
+            self.assertEqual(compute_rounds.call_count, 1)
+
+            self.cast(['Alpha'], ['Alpha'])
+            self.assertEqual(self.client.get(url).context['rounds'][-1]['winner'], 'Alpha')
+            self.assertEqual(compute_rounds.call_count, 2)
+
+    def test_reset_votes_is_refused(self):
+        self.cast(['Alpha', 'Beta'])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+
+        response = self.client.post(reverse('admin:open_choice_polls_choice_changelist'),
+                                    {'action': 'reset_votes', '_selected_action': [self.choices['Alpha'].pk]},
+                                    follow=True)
+
+        self.assertContains(response, 'Votes of ranked questions can not be reset')
+        self.assertEqual(Choice.objects.get(pk=self.choices['Alpha'].pk).votes, 1)
+        self.assertEqual(Ballot.objects.count(), 1)
+
+    def test_one_ballot_per_voter(self):
+        url = reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        user = create_enrolled_voter(self.question)
+        self.client.force_login(user)
+        for ranking in (['Alpha', 'Beta'], ['Beta', 'Alpha']):
+            self.client.post(url, {'ranking': [str(self.choices[text].id) for text in ranking]})
+
+        # votes_per_session (5) does not apply to ranked questions
+        self.assertEqual(Ballot.objects.get().indexes, [self.indexes['Alpha'], self.indexes['Beta']])
+        self.assertEqual(Participation.objects.get(voter=user.voter).votes_cast, 1)
+        self.assertEqual(Question.objects.get(pk=self.question.pk).total_votes, 1)
+        with self.assertRaises(IntegrityError):
+            Ballot.objects.create(question=self.question, participation=Participation.objects.get(voter=user.voter),
+                                  ranking=tally.encode_ballot([0], 3))
+
+    def test_invalid_rankings(self):
+        url = reverse('open_choice_polls:vote', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        self.client.force_login(create_enrolled_voter(self.question))
+        rejected = self.question.choice_set.create(choice_text='Rejected', review_status=Choice.REJECTED)
+
+        for ranking in ([], [self.choices['Alpha'].id] * 2, [rejected.id], ['no-uuid'],
+                        [c.id for c in self.choices.values()]):
+            response = self.client.post(url, {'ranking': [str(value) for value in ranking]})
+            self.assertEqual(response.status_code, 200)
+        self.assertFalse(Ballot.objects.exists())
+
+    def test_snapshot_keeps_rounds(self):
+        self.cast(['Delta', 'Gamma'], ['Gamma'], ['Alpha'], ['Gamma'])
+        Question.objects.filter(pk=self.question.pk).update(voting_end_date=timezone.now() - datetime.timedelta(1))
+        question = Question.objects.get(pk=self.question.pk)
+
+        snapshot = question.finalize_results()
+        self.assertEqual(snapshot.rounds[-1]['winner'], 'Gamma')
+        self.assertEqual(ResultsSnapshot.objects.get(pk=snapshot.pk).rounds, snapshot.rounds)
+
+
+class VoteTimeSeriesTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=2)
+        self.choices = list(self.question.choice_set.order_by('choice_text'))
+
+    def buckets(self):
+        return list(VoteBucket.objects.order_by('seconds', 'start', 'choice__choice_text').
+                    values_list('choice__choice_text', 'seconds', 'start', 'votes'))
+
+    def test_upsert(self):
+        at = timezone.now().replace(hour=10, minute=5, second=30)
+        minute = at.replace(second=0, microsecond=0)
+        VoteBucket.objects.add(self.question.pk, {self.choices[0].pk: 1}, at=at)
+        VoteBucket.objects.add(self.question.pk, {self.choices[0].pk: 2, self.choices[1].pk: 1},
+                               at=at + datetime.timedelta(seconds=10))
+
+        self.assertEqual(self.buckets(), [('Choice 0', 60, minute, 3), ('Choice 1', 60, minute, 1)])
+
+    def test_update_insert_fallback(self):
+        at = timezone.now()
+        with mock.patch.object(connection, 'vendor', 'other'):
+            VoteBucket.objects.add(self.question.pk, {self.choices[0].pk: 1}, at=at)
+            VoteBucket.objects.add(self.question.pk, {self.choices[0].pk: 1}, at=at)
+        self.assertEqual([row[3] for row in self.buckets()], [2])
+
+    def test_downsample_at_finalize(self):
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0) - datetime.timedelta(hours=3)
+        for minutes, choice in ((1, 0), (2, 0), (59, 1), (61, 0)):
+            VoteBucket.objects.add(self.question.pk, {self.choices[choice].pk: 1},
+                                   at=hour + datetime.timedelta(minutes=minutes))
+
+        Question.objects.filter(pk=self.question.pk).update(voting_end_date=timezone.now() - datetime.timedelta(1))
+        Question.objects.get(pk=self.question.pk).finalize_results()
+
+        self.assertEqual(self.buckets(), [('Choice 0', 3600, hour, 2), ('Choice 1', 3600, hour, 1),
+                                          ('Choice 0', 3600, hour + datetime.timedelta(hours=1), 1)])
+
+    def test_votes_json_and_chart(self):
+        user = create_enrolled_voter(self.question)
+        self.client.force_login(user)
+        kwargs = {'slug': self.question.slug, 'id': self.question.id}
+        self.client.post(reverse('open_choice_polls:vote', kwargs=kwargs), {'choice': self.choices[1].id})
+        self.client.post(reverse('open_choice_polls:vote', kwargs=kwargs), {'choice': self.choices[1].id})
+
+        data = self.client.get(reverse('open_choice_polls:votes-over-time', kwargs=kwargs)).json()
+        self.assertEqual([row['votes'] for row in data['totals']], [2])
+        self.assertEqual([(c['choice_text'], c['buckets'][0]['votes']) for c in data['choices']], [('Choice 1', 2)])
+
+        response = self.client.get(reverse('open_choice_polls:results', kwargs=kwargs))
+        self.assertEqual(len(response.context['vote_chart']), 1)
+        self.assertContains(response, '<rect')
+
+        Question.objects.filter(pk=self.question.pk).update(show_voting_results=False)
+        self.assertEqual(self.client.get(reverse('open_choice_polls:votes-over-time', kwargs=kwargs)).status_code, 403)
+
+    def test_chart_bars(self):
+        start = timezone.now().replace(second=0, microsecond=0)
+        totals = [(start + datetime.timedelta(minutes=minutes), 60, votes)
+                  for minutes, votes in ((0, 1), (1, 3), (300, 2))]
+        bars = views.vote_chart(totals, bars=10)
+
+        self.assertEqual(len(bars), 10)  # 301 minutes in bars of 31 minutes
+        self.assertEqual([bar['votes'] for bar in bars if bar['votes']], [4, 2])
+        self.assertEqual(bars[0]['height'], 100.0)
+
+
+class SyntheticDataTests(TestCase):
+
+    def summary(self, questions):
+        return [(question.voting_start_date - question.collection_start_date,
+                 list(question.choice_set.order_by('created', 'choice_text').values_list('choice_text', 'review_status')),
+                 sorted(question.choice_set.values_list('votes', flat=True)),
+                 sorted(question.participation_set.values_list('votes_cast', flat=True)))
+                for question in questions]
+
+    def test_generate(self):
+        result = generate(questions=4, choices=30, voters=50, votes=600, seed=3)
+        self.assertEqual(str(result), "4 question(s), 120 choice(s), 50 voter(s), 200 participation(s), 600 vote(s)")
+
+        questions = list(Question.objects.order_by('number'))
+        self.assertEqual([question.number for question in questions], [1, 2, 3, 4])
+        for question in questions:
+            self.assertEqual(question.allowed_voters, 50)
+            self.assertEqual(question.total_choices, 30)
+            votes = question.participation_set.aggregate(votes=Sum('votes_cast'))['votes']
+            self.assertEqual(question.total_votes, votes)
+            self.assertEqual(VoteBucket.objects.filter(question=question).aggregate(votes=Sum('votes'))['votes'] or 0,
+                             votes)
+            self.assertFalse(question.participation_set.filter(votes_cast__gt=question.votes_per_session).exists())
+        self.assertEqual(sum(question.total_votes for question in questions), 600)
+        self.assertFalse(Choice.objects.exclude(review_status=Choice.APPROVED).filter(votes__gt=0).exists())
+        self.assertEqual(User.objects.get(username='synth0000001').voter.is_voter, True)
+        self.assertTrue(self.client.login(username='synth0000050', password='synthetic'))
+
+        # the same seed again: same data, new voters
+        generate(questions=4, choices=30, voters=50, votes=600, seed=3)
+        self.assertTrue(User.objects.filter(username='synth0000100').exists())
+        again = list(Question.objects.order_by('number'))[4:]
+        self.assertEqual(self.summary(again), self.summary(questions))
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('generate_dataset', questions=1, choices=5, voters=3, votes=0, stdout=out)
+        self.assertIn('1 question(s), 5 choice(s), 3 voter(s)', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', voters=-1, stdout=out)
+
+
+class ChoicesDeltaTests(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.question = create_question(choices=2, show_choices_rejected=False,
+                                        collection_start_date=now - datetime.timedelta(days=1),
+                                        collection_end_date=now + datetime.timedelta(days=1))
+        self.url = reverse('open_choice_polls:choices-delta',
+                           kwargs={'slug': self.question.slug, 'id': self.question.id})
+
+    def delta(self, cursor=None):
+        response = self.client.get(self.url, {'since': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['cursor'], [(choice['text'], choice['status']) for choice in data['choices']]
+
+    def test_delta(self):
+        rejected = self.question.choice_set.create(choice_text='Hidden', review_status=Choice.REJECTED)
+        cursor, choices = self.delta()
+        self.assertEqual(sorted(choices), [('Choice 0', Choice.APPROVED), ('Choice 1', Choice.APPROVED)])
+
+        # the choices of the last seconds are sent again (they may be committed after the request)
+        self.assertEqual(len(self.delta(cursor)[1]), 3)
+
+        later = timezone.now() + datetime.timedelta(seconds=10)
+        with mock.patch('django.utils.timezone.now', return_value=later):
+            cursor = self.delta()[0]
+        self.assertEqual(self.delta(cursor)[1], [])
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        with mock.patch('django.utils.timezone.now', return_value=later + datetime.timedelta(seconds=1)):
+            self.question.choice_set.create(choice_text='New')
+            self.client.post(reverse('admin:open_choice_polls_choice_changelist'),
+                             {'action': 'approve', '_selected_action': [rejected.pk]})
+        # the text of a choice in a status that is not shown is not sent
+        self.assertEqual(sorted(self.delta(cursor)[1]), [('Hidden', Choice.APPROVED), ('New', Choice.OPEN)])
+
+        Choice.objects.filter(pk=rejected.pk).update(review_status=Choice.REJECTED,
+                                                     modified=later + datetime.timedelta(seconds=2))
+        self.assertEqual(self.delta(cursor)[1][-1], (None, Choice.REJECTED))
+
+    def test_moderation_updates_modified(self):
+        before = timezone.now() - datetime.timedelta(hours=1)
+        choice = self.question.choice_set.create(choice_text='x')
+        Choice.objects.filter(pk=choice.pk).update(modified=before)
+        ModerationRule.objects.create(question=self.question, kind=ModerationRule.MIN_LENGTH, value='3')
+        ModerationEngine.for_question(self.question).run(self.question.choice_set.all())
+        self.assertGreater(Choice.objects.get(pk=choice.pk).modified, before)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': '9' * 30}).status_code, 400)
+
+    def test_page(self):
+        response = self.client.get(reverse('open_choice_polls:choices',
+                                           kwargs={'slug': self.question.slug, 'id': self.question.id}))
+        self.assertContains(response, 'data-id="{}"'.format(self.question.choice_set.first().pk))
+        self.assertContains(response, self.url)
+        self.assertEqual(views.decode_cursor(response.context['choices_cursor']).year, timezone.now().year)
+
+
+class ChoiceSearchTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=0, show_choices_rejected=False)
+        self.other = create_question(choices=0, text='Other Question')
+        for text, status in (('Blue Falcon', Choice.APPROVED), ('Blue Whale', Choice.OPEN),
+                             ('Bluebird', Choice.REJECTED), ('Green Fälcon', Choice.OPEN)):
+            self.question.choice_set.create(choice_text=text, review_status=status)
+        self.other.choice_set.create(choice_text='Blue Falcon', review_status=Choice.APPROVED)
+
+    def search(self, text, queryset=None):
+        queryset = self.question.choice_set.all() if queryset is None else queryset
+        return sorted(search_choices(queryset, text, self.question.pk).values_list('choice_text', flat=True))
+
+    def test_fts_query(self):
+        self.assertEqual(fts_query('blue fa'), 'choice_text : ("blue" "fa"*)')
+        self.assertEqual(fts_query('"blue" OR '), 'choice_text : ("blue" "OR")')
+        self.assertIsNone(fts_query(' -*" '))
+
+    def test_search(self):
+        self.assertTrue(search.fts_available('default'))
+        self.assertEqual(self.search('blu'), ['Blue Falcon', 'Blue Whale', 'Bluebird'])
+        self.assertEqual(self.search('blue '), ['Blue Falcon', 'Blue Whale'])
+        self.assertEqual(self.search('falcon'), ['Blue Falcon', 'Green Fälcon'])
+        self.assertEqual(self.search('FALCON blu'), ['Blue Falcon'])
+        self.assertEqual(self.search('falc blue'), [])  # only the last word is a prefix
+        self.assertEqual(self.search('*'), [])
+
+    def test_index_follows_changes(self):
+        choice = self.question.choice_set.get(choice_text='Blue Whale')
+        choice.choice_text = 'Red Whale'
+        choice.save()
+        Choice.objects.bulk_create([Choice(question=self.question, choice_text='Blue Moon')])
+        Choice.objects.filter(choice_text='Bluebird').delete()
+        self.question.choice_set.filter(choice_text='Green Fälcon').update(choice_text='Blue Fälcon')
+
+        self.assertEqual(self.search('blue'), ['Blue Falcon', 'Blue Fälcon', 'Blue Moon'])
+        self.assertEqual(self.search('red'), ['Red Whale'])
+        self.assertEqual(search_choices(Choice.objects.all(), 'falcon').count(), 3)
+
+        # the review status is indexed as well
+        Choice.objects.filter(choice_text='Blue Moon').update(review_status=Choice.APPROVED)
+        approved = search_choices(Choice.objects.all(), 'blue', self.question.pk, [Choice.APPROVED])
+        self.assertEqual(sorted(approved.values_list('choice_text', flat=True)), ['Blue Falcon', 'Blue Moon'])
+        self.assertEqual(len(search_choices(Choice.objects.all(), 'blue', self.question.pk, limit=2)), 2)
+
+    def test_fallback(self):
+        with mock.patch.object(search, 'fts_available', return_value=False):
+            self.assertEqual(self.search('blu'), ['Blue Falcon', 'Blue Whale', 'Bluebird'])
+            self.assertEqual(self.search('falc blue'), ['Blue Falcon'])
+
+    def test_typeahead(self):
+        url = reverse('open_choice_polls:choices-search', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        self.client.cookies[PIN_PRIMARY_COOKIE] = '1'  # the test data is on the primary only
+        data = self.client.get(url, {'q': 'blu'}).json()
+        # rejected choices are not shown by the question
+        self.assertEqual([(choice['text'], choice['status']) for choice in data['choices']],
+                         [('Blue Falcon', Choice.APPROVED), ('Blue Whale', Choice.OPEN)])
+        self.assertEqual(self.client.get(url, {'q': 'b'}).json(), {'choices': []})
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        response = self.client.get(reverse('admin:open_choice_polls_choice_changelist'), {'q': 'falc'})
+        self.assertEqual(sorted(choice.choice_text for choice in response.context['cl'].result_list),
+                         ['Blue Falcon', 'Blue Falcon', 'Green Fälcon'])
+
+
+@mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_MODERATION_QUEUE', True)
+class ModerationQueueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.question = create_question(choices=0, choice_validation_regex=r'^[A-Z]',
+                                        choice_validation_hint='Start with a capital letter',
+                                        collection_start_date=now - datetime.timedelta(days=1),
+                                        collection_end_date=now + datetime.timedelta(days=1))
+        self.question.choice_set.create(choice_text='Blue Falcon', review_status=Choice.REJECTED)
+        ModerationRule.objects.create(position=1, kind=ModerationRule.REGEX, value='^F', action=Choice.APPROVED,
+                                      question=self.question)
+
+    def suggest(self, *texts):
+        for text in texts:
+            moderation_queue.enqueue(self.question.choice_set.create(choice_text=text))
+
+    def status(self):
+        return dict(self.question.choice_set.values_list('choice_text', 'review_status'))
+
+    def test_suggestion_is_queued(self):
+        url = reverse('open_choice_polls:choices', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        # neither the regex nor the duplicate check is run in the request
+        for text in ('lowercase', 'Blue Falcon'):
+            self.assertEqual(self.client.post(url, {'choice_text': text}).status_code, 302)
+
+        self.assertEqual(ModerationTask.objects.filter(question=self.question).count(), 2)
+        self.assertEqual(Choice.open.filter(question=self.question).count(), 2)
+        self.assertEqual(metrics.get_sample_value('ocp_moderation_backlog'), 2)
+
+    def test_claim_and_lease(self):
+        self.suggest('Fine', 'Good', 'Great')
+        token, tasks = moderation_queue.claim(batch_size=2)
+        self.assertEqual(len(tasks), 2)
+        other, rest = moderation_queue.claim(batch_size=2)
+        self.assertEqual([task.choice.choice_text for task in rest], ['Great'])
+        self.assertEqual(moderation_queue.claim()[1], [])
+
+        # the tasks of a worker that did not finish are claimed again when the lease expires
+        ModerationTask.objects.filter(locked_by=token).update(locked_until=timezone.now() - datetime.timedelta(1))
+        again = moderation_queue.claim(max_attempts=2)[1]
+        self.assertEqual(sorted(task.pk for task in again), sorted(task.pk for task in tasks))
+        self.assertEqual({task.attempts for task in again}, {2})
+
+        # ... until they have been claimed max_attempts times
+        ModerationTask.objects.update(locked_until=timezone.now() - datetime.timedelta(1))
+        self.assertEqual(len(moderation_queue.claim(max_attempts=2)[1]), 1)
+
+    def test_process(self):
+        self.suggest('Fine', 'Blue Falcon', 'blue  falcon ', 'lowercase', 'Okay', 'Okay')
+        self.assertEqual(moderation_queue.process(), 6)
+
+        self.assertFalse(ModerationTask.objects.exists())
+        choices = self.question.choice_set.order_by('created', 'pk')
+        self.assertEqual([(choice.choice_text, choice.review_status) for choice in choices],
+                         [('Blue Falcon', Choice.REJECTED), ('Fine', Choice.APPROVED),
+                          ('Blue Falcon', Choice.REJECTED), ('blue falcon', Choice.REJECTED),
+                          ('lowercase', Choice.REJECTED), ('Okay', Choice.OPEN), ('Okay', Choice.REJECTED)])
+        self.assertEqual(choices[2].review_remark, moderation_queue.DUPLICATE_REMARK)
+        self.assertTrue(choices[4].review_remark.startswith('Failed Regex'))
+        self.assertEqual(metrics.get_sample_value('ocp_moderation_backlog'), 0)
+
+    def test_moderating_again_does_no_harm(self):
+        self.suggest('Fine', 'Okay', 'Okay')
+        choice_ids = list(self.question.choice_set.values_list('pk', flat=True))
+        moderation_queue.moderate(self.question, choice_ids)
+        status = self.status()
+
+        self.assertEqual(moderation_queue.moderate(self.question, choice_ids), {'open': 1})
+        self.assertEqual(self.status(), status)
+
+    def test_command(self):
+        self.suggest('Fine', 'lowercase')
+        out = io.StringIO()
+        call_command('moderation_worker', '--once', '--batch-size', '1', stdout=out)
+
+        self.assertIn('0 suggestion(s) waiting', out.getvalue())
+        self.assertEqual(self.status(), {'Blue Falcon': Choice.REJECTED, 'Fine': Choice.APPROVED,
+                                         'lowercase': Choice.REJECTED})
+        with mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_MODERATION_QUEUE', False):
+            with self.assertRaises(CommandError):
+                call_command('moderation_worker', '--once')
+
+
+class CloneQuestionTests(TestCase):
+
+    def setUp(self):
+        self.question = create_question(choices=0, votes_per_session=3, choice_validation_regex=r'^[A-Z]',
+                                        counting_method=Question.BORDA)
+        for text, status, votes in (('Blue Falcon', Choice.APPROVED, 7), ('Red Fox', Choice.APPROVED, 2),
+                                    ('Okay', Choice.OPEN, 0), ('spam', Choice.REJECTED, 0)):
+            self.question.choice_set.create(choice_text=text, review_status=status, votes=votes)
+        self.voters = [create_enrolled_voter(self.question).voter for _ in range(3)]
+        Participation.objects.filter(voter=self.voters[2]).update(is_allowed=False)
+        ModerationRule.objects.create(position=1, kind=ModerationRule.MIN_LENGTH, value='3', question=self.question)
+
+    def test_clone(self):
+        start = self.question.collection_start_date + datetime.timedelta(days=30)
+        result = clone_question(self.question, text='Next Round', collection_start_date=start)
+        clone = result.question
+
+        self.assertNotEqual(clone.pk, self.question.pk)
+        self.assertEqual(clone.number, self.question.number + 1)
+        self.assertEqual((clone.slug, clone.votes_per_session, clone.choice_validation_regex, clone.counting_method),
+                         ('next-round', 3, r'^[A-Z]', Question.BORDA))
+        self.assertEqual(clone.voting_end_date - self.question.voting_end_date, datetime.timedelta(days=30))
+        self.assertEqual(sorted(clone.choice_set.values_list('choice_text', 'votes')),
+                         [('Blue Falcon', 0), ('Red Fox', 0)])
+        self.assertEqual(list(clone.participation_set.values_list('voter', flat=True).order_by('voter')),
+                         sorted(voter.pk for voter in self.voters[:2]))
+        self.assertEqual(clone.moderationrule_set.get().value, '3')
+        self.assertEqual((clone.total_choices, clone.total_approved_choices, clone.total_votes, clone.allowed_voters),
+                         (2, 2, 0, 2))
+        self.assertEqual(str(result), '{} with 2 choice(s), 1 moderation rule(s), 2 voter(s)'.format(clone))
+        # the copied choices are in the search index
+        self.assertEqual(search_choices(Choice.objects.all(), 'falc', clone.pk).get().question, clone)
+
+    def test_same_text(self):
+        clone = clone_question(self.question, review_statuses=[Choice.OPEN, Choice.REJECTED],
+                               participations=False).question
+
+        self.assertEqual(sorted(clone.choice_set.values_list('review_status', flat=True)),
+                         [Choice.OPEN, Choice.REJECTED])
+        self.assertFalse(clone.participation_set.exists())
+        # the questions share the slug - the id tells them apart
+        self.client.cookies[PIN_PRIMARY_COOKIE] = '1'  # the test data is on the primary only
+        for question in (self.question, clone):
+            response = self.client.get(question.get_absolute_url())
+            self.assertEqual(response.context['question'], question)
+
+    def test_command_and_admin(self):
+        out = io.StringIO()
+        call_command('clone_question', str(self.question.pk), '--text', 'By Command', '--start', '2030-01-01T12:00',
+                     '--no-voters', stdout=out)
+        clone = Question.objects.get(text='By Command')
+        self.assertEqual(clone.collection_start_date.year, 2030)
+        self.assertEqual(clone.allowed_voters, 0)
+        self.assertIn('Cloned', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('clone_question', str(self.question.pk), '--start', 'tomorrow')
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'secret'))
+        url = reverse('admin:open_choice_polls_question_clone', args=(self.question.pk,))
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.post(url, {'text': 'By Admin', 'collection_start_date': '2030-02-01 12:00:00',
+                                          'review_statuses': [Choice.APPROVED], 'participations': 'on'})
+        clone = Question.objects.get(text='By Admin')
+        self.assertRedirects(response, reverse('admin:open_choice_polls_question_change', args=(clone.pk,)))
+        self.assertEqual((clone.total_approved_choices, clone.allowed_voters), (2, 2))
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_ARCHIVE_DIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        now = timezone.now()
+        self.question = create_question(choices=0, voting_start_date=now - datetime.timedelta(days=2),
+                                        voting_end_date=now - datetime.timedelta(days=1))
+        self.other = create_question(text='Other Question')
+        for text, status, votes in (('Blue Falcon', Choice.APPROVED, 3), ('Red Fox', Choice.APPROVED, 1),
+                                    ('spam', Choice.REJECTED, 0)):
+            self.question.choice_set.create(choice_text=text, review_status=status, votes=votes)
+        self.falcon = self.question.choice_set.get(choice_text='Blue Falcon')
+        VoteBucket.objects.add(self.question.pk, {self.falcon.pk: 3}, at=now - datetime.timedelta(days=2))
+
+        # only allowed on the question - archived with it
+        self.user = create_enrolled_voter(self.question)
+        participation = Participation.objects.get(voter=self.user.voter)
+        Participation.objects.filter(pk=participation.pk).update(votes_cast=4)
+        Ballot.objects.create(question=self.question, participation=participation,
+                              ranking=tally.encode_ballot([1, 0], 3))
+        # allowed on another question as well - kept
+        self.shared = create_enrolled_voter(self.question).voter
+        Participation.objects.create(voter=self.shared, question=self.other, is_allowed=True)
+
+        self.results = self.question.finalize_results().results
+        self.url = reverse('open_choice_polls:results', kwargs={'slug': self.question.slug, 'id': self.question.id})
+        self.client.cookies[PIN_PRIMARY_COOKIE] = '1'  # the test data is on the primary only
+        archive_file.read_results.cache_clear()
+
+    def test_archive(self):
+        stub = archive.archive_question(self.question)
+
+        self.assertEqual((stub.choices, stub.participations, stub.voters, stub.ballots), (3, 2, 1, 1))
+        self.assertTrue(os.path.exists(stub.path))
+        records = list(archive_file.read_records(stub.path))
+        self.assertEqual([record['type'] for record in records[:4]],
+                         ['archive', 'question', 'resultssnapshot', 'votebucket'])
+
+        self.assertFalse(Choice.objects.filter(question=self.question).exists())
+        self.assertFalse(Participation.objects.filter(question=self.question).exists())
+        self.assertFalse(Ballot.objects.exists())
+        self.assertFalse(VoteBucket.objects.exists())
+        self.assertFalse(ResultsSnapshot.objects.exists())
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertTrue(Voter.objects.filter(pk=self.shared.pk).exists())
+        self.assertFalse(search_choices(Choice.objects.all(), 'falcon').exists())
+
+        # the stub serves the final results from the archive file
+        question = Question.objects.get(pk=self.question.pk)
+        self.assertEqual((question.total_choices, question.total_votes), (3, 4))
+        snapshot = question.finalize_results()
+        self.assertEqual((snapshot.results, snapshot.total_votes, snapshot.participating_voters),
+                         (self.results, 4, 1))
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Total Votes: 4')
+        self.assertContains(response, 'Blue Falcon')
+        self.assertEqual(sum(bar['votes'] for bar in response.context['vote_chart']), 3)
+        votes = self.client.get(reverse('open_choice_polls:votes-over-time',
+                                        kwargs={'slug': self.question.slug, 'id': self.question.id})).json()
+        self.assertEqual([(choice['choice_text'], choice['buckets'][0]['votes']) for choice in votes['choices']],
+                         [('Blue Falcon', 3)])
+
+        # archiving again finishes an interrupted archival but does not write another file
+        self.assertEqual(archive.archive_question(question).pk, stub.pk)
+        self.assertEqual(os.listdir(self.directory), [stub.file_name])
+
+    def test_rows_added_while_archiving_are_kept(self):
+        write_archive = archive.write_archive
+
+        def write_then_add(question, path, batch_size):
+            counts = write_archive(question, path, batch_size)
+            self.question.choice_set.create(choice_text='Late Owl')
+            create_enrolled_voter(self.question)
+            return counts
+
+        with mock.patch.object(archive, 'write_archive', side_effect=write_then_add):
+            with self.assertLogs('open_choice_polls.archive', 'WARNING'):
+                stub = archive.archive_question(self.question)
+
+        self.assertEqual((stub.choices, stub.participations), (3, 2))
+        self.assertEqual(list(Choice.objects.filter(question=self.question).values_list('choice_text', flat=True)),
+                         ['Late Owl'])
+        self.assertEqual(Participation.objects.filter(question=self.question).count(), 1)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+
+    def test_restore(self):
+        created = self.falcon.created
+        archive.archive_question(self.question)
+        result = archive.restore_question(self.question)
+
+        self.assertEqual((result.choices, result.voters, result.participations, result.ballots, result.skipped),
+                         (3, 1, 2, 1, 0))
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertFalse(QuestionArchive.objects.exists())
+        self.assertEqual(Choice.objects.get(pk=self.falcon.pk).created, created)
+        self.assertEqual(self.question.finalize_results().results, self.results)
+        self.assertEqual(Ballot.objects.get().indexes, [1, 0])
+        self.assertEqual(VoteBucket.objects.get().votes, 3)
+        self.assertEqual(Participation.objects.get(voter=self.user.voter).votes_cast, 4)
+        self.assertTrue(self.client.login(username=self.user.username, password='secret'))
+        question = Question.objects.get(pk=self.question.pk)
+        self.assertEqual((question.total_choices, question.total_votes, question.allowed_voters), (3, 4, 2))
+        self.assertEqual(search_choices(Choice.objects.all(), 'falcon').get(), self.falcon)
+
+    def test_commands(self):
+        out = io.StringIO()
+        call_command('archive_questions', '--closed-for', '0', stdout=out)
+        self.assertIn('Archived {}'.format(self.question), out.getvalue())
+        self.assertFalse(QuestionArchive.objects.filter(question=self.other).exists())
+
+        call_command('restore_question', str(self.question.pk), '--keep-file', stdout=out)
+        self.assertIn('Restored', out.getvalue())
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        with self.assertRaises(CommandError):
+            call_command('restore_question', str(self.question.pk))
+        with self.assertRaises(CommandError):
+            call_command('archive_questions', str(self.other.pk))
+        with mock.patch.object(app_settings, 'OPEN_CHOICE_POLLS_ARCHIVE_DIR', None):
+            with self.assertRaises(CommandError):
+                call_command('archive_questions', '--closed-for', '0')
@@ -6,6 +6,7 @@ from . import views
 app_name = 'open_choice_polls'
 urlpatterns = [
     path('', views.QuestionListView.as_view(), name='question-list'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 
     path('voter/password_change/', auth_views.PasswordChangeView.as_view(), name='password-change'),
     path('voter/password_change/done/', auth_views.PasswordChangeDoneView.as_view(), name='password-change-done'),
@@ -24,5 +25,8 @@ urlpatterns = [
     path('<slug:slug>,<uuid:id>/', views.QuestionDetailView.as_view(), name='question-detail'),
     path('<slug:slug>,<uuid:id>/vote/', views.QuestionEnterVoteView.as_view(), name='vote'),
     path('<slug:slug>,<uuid:id>/choices/', views.QuestionAddChoiceView.as_view(), name='choices'),
+    path('<slug:slug>,<uuid:id>/choices/delta.json', views.QuestionChoicesDeltaView.as_view(), name='choices-delta'),
+    path('<slug:slug>,<uuid:id>/choices/search.json', views.QuestionChoicesSearchView.as_view(), name='choices-search'),
     path('<slug:slug>,<uuid:id>/results/', views.QuestionResultsView.as_view(), name='results'),
+    path('<slug:slug>,<uuid:id>/results/votes.json', views.QuestionVotesOverTimeView.as_view(), name='votes-over-time'),
 ]
@@ -1,27 +1,137 @@
+import datetime
+import ipaddress
 import logging
+import math
+import uuid
 
+from django.conf import settings as django_settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import F, Q, Sum
 from django.db.models.functions import Lower
-from django.http import Http404
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.http import urlencode
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, urlencode
 from django.views import generic
 
-from .exceptions import ParticipationNotAllowed, ParticipationAllVotesUsed, QuestionVoteNotActive
-from .forms import ChoiceForm, SignInForm, EnrollForm, VoteForm
-from .models import Choice, Participation, Question, Voter
+from . import metrics, moderation_queue, settings, tally
+from .exceptions import ParticipationNotAllowed, ParticipationAllVotesUsed, QuestionVoteNotActive, RateLimited
+from .forms import ChoiceForm, SignInForm, EnrollForm, RankedVoteForm, VoteForm
+from .models import Ballot, Choice, Participation, Question, Voter, VoteBucket, VOTER_ID_SESSION_KEY
+from .ratelimit import RateLimiter
+from .routers import PIN_PRIMARY_COOKIE, use_replica
+from .search import search_choices
+from .vote_buffer import VoteBuffer
 
 logger = logging.getLogger(__name__)
 
+rate_limiter = RateLimiter(settings.OPEN_CHOICE_POLLS_RATE_LIMIT_CACHE)
 
-class EnrollFormView(generic.FormView):
+
+class ReadReplicaMixin:
+    """Read from the replica database - unless this client has just written something"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.COOKIES.get(PIN_PRIMARY_COOKIE):
+            return super().dispatch(request, *args, **kwargs)
+
+        with use_replica():
+            response = super().dispatch(request, *args, **kwargs)
+            # querysets in the context are evaluated while rendering
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        return response
+
+
+class PinPrimaryMixin:
+    """Make the client read from the primary database for a while after a POST"""
+
+    def dispatch(self, request, *args, **kwargs):
+        response = super().dispatch(request, *args, **kwargs)
+        if request.method == 'POST' and settings.OPEN_CHOICE_POLLS_DB_REPLICA:
+            response.set_cookie(PIN_PRIMARY_COOKIE, '1', httponly=True,
+                                max_age=settings.OPEN_CHOICE_POLLS_DB_REPLICA_PIN_SECONDS)
+        return response
+
+
+def get_vote_buffer():
+    return VoteBuffer(settings.OPEN_CHOICE_POLLS_VOTE_BUFFER, fsync=settings.OPEN_CHOICE_POLLS_VOTE_BUFFER_FSYNC)
+
+
+class RateLimitMixin:
+    """Limit the POST requests per client IP, user and question (see OPEN_CHOICE_POLLS_RATE_LIMITS)
+
+    `rate_limit_action` is "suggestion" or "vote". The check runs when the
+    question is looked up, so it needs no extra query.
+    """
+    rate_limit_action = None
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except RateLimited as err:
+            logger.info("Rate limit (%s) hit by %s: %s", self.rate_limit_action,
+                        request.META.get('REMOTE_ADDR'), err)
+            response = render(request, 'open_choice_polls/429.html', {'retry_after': math.ceil(err.retry_after)},
+                              status=429)
+            response['Retry-After'] = str(math.ceil(err.retry_after))
+            return response
+
+    def get_object(self, queryset=None):
+        obj = super().get_object(queryset)
+        if self.request.method == 'POST':
+            self.check_rate_limit(obj)
+        return obj
+
+    def check_rate_limit(self, question):
+        rates = settings.OPEN_CHOICE_POLLS_RATE_LIMITS.get(self.rate_limit_action, {})
+        action = self.rate_limit_action
+        buckets = {
+            '{}:ip:{}'.format(action, self.request.META.get('REMOTE_ADDR')): rates.get('ip'),
+            '{}:question:{}'.format(action, question.pk):
+                getattr(question, '{}_rate_limit'.format(action)) or rates.get('question'),
+        }
+        if self.request.user.is_authenticated:
+            buckets['{}:user:{}'.format(action, self.request.user.pk)] = rates.get('user')
+        rate_limiter.check(buckets)
+
+
+def get_voter_id(request):
+    """Voter id of the signed-in user - stored in the session at sign in"""
+    if VOTER_ID_SESSION_KEY not in request.session:
+        # signed in before the id was stored
+        metrics.CACHE_REQUESTS.inc(cache='voter_id', result='miss')
+        request.session[VOTER_ID_SESSION_KEY] = Voter.objects.filter(user_id=request.user.id). \
+            values_list('pk', flat=True).first()
+    else:
+        metrics.CACHE_REQUESTS.inc(cache='voter_id', result='hit')
+    return request.session[VOTER_ID_SESSION_KEY]
+
+
+class ParticipationMixin:
+    """Look up the Participation of the signed-in voter for the question once per request"""
+
+    def get_participation(self):
+        """the Participation allowing the signed-in voter to vote on self.object (or None)"""
+        if not self.request.user.is_authenticated:
+            return None
+
+        participations = self.request.__dict__.setdefault('_ocp_participations', {})
+        if self.object.pk not in participations:
+            participations[self.object.pk] = Participation.objects.get_allowed(get_voter_id(self.request),
+                                                                               self.object.pk)
+        return participations[self.object.pk]
+
+
+class EnrollFormView(PinPrimaryMixin, generic.FormView):
     template_name = "open_choice_polls/voter_enroll.html"
     form_class = EnrollForm
 
@@ -44,18 +154,27 @@ class EnrollFormView(generic.FormView):
 
         voter_obj = Voter.objects.filter(is_voter=True). \
             filter(enrollment_code=enrollment_code). \
+            select_related('user'). \
             first()
 
         if not voter_obj:
+            metrics.ENROLLMENTS.inc(result='not_found')
             messages.error(self.request, "Enrollment Code not found: {}".format(enrollment_code))
             messages.info(self.request, "Please check spelling and try again below.")
             return redirect('open_choice_polls:voter-enroll')
 
         if voter_obj.is_enrolled:
+            metrics.ENROLLMENTS.inc(result='already_enrolled')
             messages.error(self.request, "Enrollment Code already enrolled: {}".format(enrollment_code))
             messages.info(self.request, "Please sign in below.")
             return redirect('open_choice_polls:voter-sign-in')
 
+        # before authenticate() - no password hashing for expired codes
+        if voter_obj.enrollment_code_is_expired:
+            metrics.ENROLLMENTS.inc(result='expired')
+            messages.error(self.request, "Enrollment Code expired: {}".format(enrollment_code))
+            return redirect('open_choice_polls:voter-enroll')
+
         username = voter_obj.user.username
 
         # try to authenticate
@@ -68,6 +187,7 @@ class EnrollFormView(generic.FormView):
                 logout(self.request)
 
             new_pw = Voter.create_new_password()
+            user.voter = voter_obj  # already loaded
             user.voter.is_enrolled = True
             user.set_password(new_pw)
             user.save()
@@ -79,6 +199,7 @@ class EnrollFormView(generic.FormView):
             messages.info(self.request, 'The new password is: {}'.format(new_pw))
 
             login(self.request, user)
+            metrics.ENROLLMENTS.inc(result='success')
 
             if next_:
                 return redirect(next_)
@@ -117,12 +238,14 @@ class SignInFormView(generic.FormView):
 
             if user.voter.is_enrolled:
                 login(self.request, user)
+                metrics.SIGN_INS.inc(result='success')
 
                 if next_:
                     return redirect(next_)
                 else:
                     return redirect('open_choice_polls:voter-detail', username=username)
             else:
+                metrics.SIGN_INS.inc(result='not_enrolled')
                 messages.error(self.request, "Account is not yet enrolled. Please first enroll below.")
 
                 get_args_str = urlencode({'enrollment_code': password})
@@ -131,12 +254,13 @@ class SignInFormView(generic.FormView):
                 return response
 
         else:
+            metrics.SIGN_INS.inc(result='failed')
             messages.error(self.request, "Sign in failed. Invalid username or password!")
             messages.info(self.request, "Try another password again.")
             return redirect('open_choice_polls:voter-sign-in')
 
 
-class QuestionListView(generic.ListView):
+class QuestionListView(ReadReplicaMixin, generic.ListView):
     # template_name = 'open_choice_polls/question_list.html'
     model = Question
     context_object_name = 'questions'
@@ -153,10 +277,11 @@ class QuestionListView(generic.ListView):
         return context
 
 
-class QuestionDetailView(generic.DetailView):
+class QuestionDetailView(ReadReplicaMixin, generic.DetailView):
     # template_name = 'open_choice_polls/question_detail.html'
     model = Question
     query_pk_and_slug = True
+    pk_url_kwarg = 'id'
     context_object_name = 'question'
 
     def get_context_data(self, **kwargs):
@@ -165,10 +290,58 @@ class QuestionDetailView(generic.DetailView):
         return context
 
 
-class QuestionAddChoiceView(generic.UpdateView):
+# choices modified this long before a delta request may still be committed after it - they are sent again
+CHOICES_DELTA_OVERLAP = datetime.timedelta(seconds=5)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(value):
+    """cursor of the choices delta feed (microseconds since the epoch) of a datetime"""
+    return str((value - EPOCH) // datetime.timedelta(microseconds=1))
+
+
+def decode_cursor(cursor):
+    """datetime of a cursor - raises ValueError if it is invalid"""
+    try:
+        return EPOCH + datetime.timedelta(microseconds=int(cursor))
+    except OverflowError:
+        raise ValueError("invalid cursor: {}".format(cursor))
+
+
+def shown_statuses(question):
+    """{review status: whether the choices page of `question` lists the choices in it}"""
+    return {Choice.APPROVED: question.show_choices_approved, Choice.OPEN: question.show_choices_open,
+            Choice.REJECTED: question.show_choices_rejected}
+
+
+def choices_delta(question, since=None, now=None):
+    """choices of `question` created or reviewed after `since` (all without it) and the cursor for the next request
+
+    Choices in a status the question does not show are only sent (without
+    their text) when they changed since a cursor, so a client can drop them.
+    Deleted choices are not reported.
+    """
+    now = now or timezone.now()
+    shown = shown_statuses(question)
+
+    choices = question.choice_set.order_by('modified')  # (question, modified) index
+    if since:
+        choices = choices.filter(modified__gt=since)
+    else:
+        choices = choices.filter(review_status__in=[status for status, show in shown.items() if show])
+
+    data = [{'id': str(pk), 'status': status, 'text': text if shown.get(status) else None}
+            for pk, status, text in choices.values_list('pk', 'review_status', 'choice_text')]
+    cursor = now - CHOICES_DELTA_OVERLAP
+    return {'cursor': encode_cursor(max(since, cursor) if since else cursor), 'choices': data}
+
+
+class QuestionAddChoiceView(PinPrimaryMixin, RateLimitMixin, generic.UpdateView):
     model = Question
     template_name = 'open_choice_polls/question_update_form_add_choice.html'
     query_pk_and_slug = True
+    pk_url_kwarg = 'id'
+    rate_limit_action = 'suggestion'
 
     form_class = ChoiceForm
 
@@ -177,11 +350,16 @@ class QuestionAddChoiceView(generic.UpdateView):
         context['choices_approved'] = Choice.approved.filter(question=self.object.id).order_by(Lower('choice_text'))
         context['choices_open'] = Choice.open.filter(question=self.object.id).order_by(Lower('choice_text'))
         context['choices_rejected'] = Choice.rejected.filter(question=self.object.id).order_by(Lower('choice_text'))
+        context['choices_cursor'] = encode_cursor(timezone.now() - CHOICES_DELTA_OVERLAP)
 
         return context
 
     def form_valid(self, form):
-        self.object.choice_set.create(choice_text=form.cleaned_data.get('choice_text'), votes=0)
+        with transaction.atomic():
+            choice = self.object.choice_set.create(choice_text=form.cleaned_data.get('choice_text'), votes=0)
+            if settings.OPEN_CHOICE_POLLS_MODERATION_QUEUE:
+                moderation_queue.enqueue(choice)
+        metrics.SUGGESTIONS.inc()
         messages.success(self.request, 'Suggestion was added successfully!')
 
         return redirect('open_choice_polls:choices', slug=self.object.slug, id=self.object.id)
@@ -191,51 +369,199 @@ class QuestionAddChoiceView(generic.UpdateView):
         return super().form_invalid(form)
 
 
-class QuestionResultsView(generic.DetailView):
+class QuestionChoicesDeltaView(generic.DetailView):
+    """choices created or reviewed since the cursor "since" as JSON (see choices_delta())
+
+    Read from the primary database: a replica lagging behind by more than
+    CHOICES_DELTA_OVERLAP would make clients skip choices.
+    """
+    model = Question
+    query_pk_and_slug = True
+    pk_url_kwarg = 'id'
+
+    def render_to_response(self, context, **response_kwargs):
+        since = self.request.GET.get('since')
+        if since:
+            try:
+                since = decode_cursor(since)
+            except ValueError:
+                return HttpResponseBadRequest("invalid cursor")
+        return JsonResponse(choices_delta(self.object, since))
+
+
+class QuestionChoicesSearchView(ReadReplicaMixin, generic.DetailView):
+    """choices (in the statuses the question shows) matching the words of "q" as JSON - for a typeahead"""
+    model = Question
+    query_pk_and_slug = True
+    pk_url_kwarg = 'id'
+
+    limit = 10
+    min_length = 2
+
+    def render_to_response(self, context, **response_kwargs):
+        text = self.request.GET.get('q', '')[:Choice._meta.get_field('choice_text').max_length]
+        if len(text.strip()) < self.min_length:
+            return JsonResponse({'choices': []})
+
+        statuses = [status for status, show in shown_statuses(self.object).items() if show]
+        if not statuses:
+            return JsonResponse({'choices': []})
+        choices = search_choices(Choice.objects.all(), text, self.object.pk, statuses, self.limit)
+        return JsonResponse({'choices': [{'id': str(pk), 'status': status, 'text': choice_text}
+                                         for pk, status, choice_text in
+                                         choices.values_list('pk', 'review_status', 'choice_text')]})
+
+
+class QuestionResultsView(ReadReplicaMixin, ParticipationMixin, generic.DetailView):
     model = Question
     template_name = 'open_choice_polls/question_results.html'
     query_pk_and_slug = True
+    pk_url_kwarg = 'id'
+
+    snapshot = None
 
     def get_context_data(self, **kwargs):
         # Call the base implementation first to get a context
         context = super().get_context_data(**kwargs)
 
+        # voting has ended - results can not change anymore
+        self.snapshot = self.object.finalize_results()
+        if self.snapshot:
+            context['snapshot'] = self.snapshot
+            context['results'] = self.snapshot.results
+            context['results_total_votes'] = self.snapshot.total_votes
+            context['rounds'] = self.snapshot.rounds
+            context['vote_chart'] = vote_chart(vote_totals(self.object))
+            return context
+
         # get sorted results
-        choices_by_votes = self.object.choice_set.filter(review_status=Choice.APPROVED).order_by('-votes')
-        context['choices_by_votes'] = choices_by_votes
+        context['results'], context['results_total_votes'] = self.object.compute_results()
+        if self.object.show_voting_results or not self.object.voting_is_active():
+            context['rounds'] = ranked_rounds(self.object)
+            context['vote_chart'] = vote_chart(vote_totals(self.object))
 
         if self.request.user.is_authenticated:
             # try to get data for follow-up vote
-            try:
-                qs = Participation.objects.filter(Q(voter__user__id=self.request.user.id) &
-                                                  Q(question__id=self.object.id) &
-                                                  Q(is_allowed=True))
-                participation = qs.get()
+            participation = self.get_participation()
+            if participation:
                 context['participation'] = participation
 
                 choices_approved = self.object.choice_set.filter(review_status=Choice.APPROVED)
                 context['choices_approved'] = choices_approved
-            except Participation.DoesNotExist:
-                print("User ({}) not allowed to vote. Displaying results only.".format(self.request.user))
-                logger.info("User ({}) not allowed to vote. Displaying results only.".format(self.request.user))
+            else:
+                logger.debug("User (%s) not allowed to vote. Displaying results only.", self.request.user)
         else:
-            print("Not signed-in. Displaying results only.".format(self.request.user))
-            logger.info("Not signed-in. Displaying results only.".format(self.request.user))
+            logger.debug("Not signed-in. Displaying results only.")
 
         return context
 
+    def render_to_response(self, context, **response_kwargs):
+        response = super().render_to_response(context, **response_kwargs)
+        if self.snapshot:
+            # the page only depends on the user for the navigation bar
+            cache = 'private' if self.request.user.is_authenticated else 'public'
+            patch_cache_control(response, max_age=settings.OPEN_CHOICE_POLLS_RESULTS_MAX_AGE, **{cache: True})
+            response['Last-Modified'] = http_date(self.snapshot.created.timestamp())
+        return response
+
+
+def ranked_rounds(question):
+    """rounds of the ranked tally of `question` - cached until a ballot is cast or a choice approved/rejected"""
+    if not question.is_ranked:
+        return []
+    key = 'open_choice_polls:rounds:{}:{}:{}'.format(question.pk, question.total_votes,
+                                                     question.total_approved_choices)
+    cache = caches[settings.OPEN_CHOICE_POLLS_RESULTS_CACHE]
+    rounds = cache.get(key)
+    if rounds is None:
+        metrics.CACHE_REQUESTS.inc(cache='rounds', result='miss')
+        rounds = question.compute_rounds()
+        cache.set(key, rounds, settings.OPEN_CHOICE_POLLS_RESULTS_CACHE_TIMEOUT)
+    else:
+        metrics.CACHE_REQUESTS.inc(cache='rounds', result='hit')
+    return rounds
+
+
+def vote_totals(question):
+    """(start, seconds, votes) of the vote buckets of `question` - summed up over the choices"""
+    if question.is_archived:
+        return question.archive.vote_totals()
+    return list(VoteBucket.objects.filter(question=question).order_by('start', 'seconds').
+                values_list('start', 'seconds').annotate(total=Sum('votes')))
+
+
+def vote_timeseries(question):
+    """votes of `question` over time (from the vote buckets) - total and per choice"""
+    if question.is_archived:
+        # votes only go to approved choices - all of them are in the results
+        buckets = question.archive.vote_buckets()
+        texts = {uuid.UUID(result['choice_id']): result['choice_text']
+                 for result in question.finalize_results().results}
+    else:
+        buckets = VoteBucket.objects.filter(question=question).order_by('start', 'seconds'). \
+            values_list('choice', 'start', 'seconds', 'votes')
+        texts = dict(question.choice_set.order_by().values_list('pk', 'choice_text'))
+
+    choices = {}
+    for choice_id, start, seconds, votes in buckets:
+        choices.setdefault(choice_id, []).append({'start': start.isoformat(), 'seconds': seconds, 'votes': votes})
+    return {
+        'question_id': str(question.pk),
+        'totals': [{'start': start.isoformat(), 'seconds': seconds, 'votes': votes}
+                   for start, seconds, votes in vote_totals(question)],
+        'choices': [{'choice_id': str(choice_id), 'choice_text': texts.get(choice_id, ''), 'buckets': rows}
+                    for choice_id, rows in sorted(choices.items(), key=lambda item: texts.get(item[0], '').lower())],
+    }
+
+
+def vote_chart(totals, bars=48):
+    """bars (x, y, width and height in percent of an SVG) of the total votes over time - at most `bars`"""
+    if not totals:
+        return []
+    first = totals[0][0]
+    span = max((start - first).total_seconds() + seconds for start, seconds, _ in totals)
+    width = max(60, math.ceil(span / bars / 60) * 60)  # seconds per bar - whole minutes
+
+    votes = [0] * math.ceil(span / width)
+    for start, seconds, count in totals:
+        votes[int((start - first).total_seconds() // width)] += count
+    highest = max(votes) or 1
+    return [{'start': first + datetime.timedelta(seconds=idx * width), 'votes': count,
+             'x': 100.0 * idx / len(votes), 'width': 100.0 / len(votes),
+             'y': 100.0 - 100.0 * count / highest, 'height': 100.0 * count / highest}
+            for idx, count in enumerate(votes)]
+
+
+class QuestionVotesOverTimeView(ReadReplicaMixin, generic.DetailView):
+    """votes over time as JSON - while voting only if the question shows its results"""
+    model = Question
+    query_pk_and_slug = True
+    pk_url_kwarg = 'id'
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.object.voting_is_active() and not self.object.show_voting_results:
+            raise PermissionDenied
+        return JsonResponse(vote_timeseries(self.object))
+
 
-class QuestionEnterVoteView(LoginRequiredMixin, generic.UpdateView):
+class QuestionEnterVoteView(PinPrimaryMixin, LoginRequiredMixin, RateLimitMixin, ParticipationMixin,
+                            generic.UpdateView):
     model = Question
     template_name = 'open_choice_polls/question_enter_vote.html'
     query_pk_and_slug = True
+    pk_url_kwarg = 'id'
+    rate_limit_action = 'vote'
 
     form_class = VoteForm
 
+    def get_form_class(self):
+        return RankedVoteForm if self.object.is_ranked else VoteForm
+
     def dispatch(self, request, *args, **kwargs):
         try:
             return super().dispatch(request, *args, **kwargs)
-        except (ParticipationAllVotesUsed, ParticipationNotAllowed, QuestionVoteNotActive):
+        except (ParticipationAllVotesUsed, ParticipationNotAllowed, QuestionVoteNotActive) as err:
+            metrics.VOTES_REJECTED.inc(reason=err.__class__.__name__)
             return redirect(reverse('open_choice_polls:results',
                                     kwargs={'slug': self.object.slug, 'id': self.object.id}))
 
@@ -247,57 +573,89 @@ class QuestionEnterVoteView(LoginRequiredMixin, generic.UpdateView):
             raise QuestionVoteNotActive("Sorry - vote is not active.")
 
         # get data for vote
-        try:
-            qs = Participation.objects.filter(Q(voter__user__id=self.request.user.id) &
-                                              Q(question__id=self.object.id) &
-                                              Q(is_allowed=True))
-            participation = qs.get()
-            context['participation'] = participation
-
-            choices_approved = self.object.choice_set.filter(review_status=Choice.APPROVED)
-            context['choices_approved'] = choices_approved
+        participation = self.get_participation()
+        if not participation:
+            logger.info("User (%s) not allowed to vote. Displaying results only.", self.request.user)
+            raise ParticipationNotAllowed("Not allowed to participate in this question.")
+        context['participation'] = participation
 
-            if participation.votes_cast >= self.object.votes_per_session:
-                raise ParticipationAllVotesUsed("All votes used up.")
+        choices_approved = self.object.choice_set.filter(review_status=Choice.APPROVED)
+        context['choices_approved'] = choices_approved
 
-        except Participation.DoesNotExist:
-            logger.info("User ({}) not allowed to vote. Displaying results only.".format(self.request.user))
-            raise ParticipationNotAllowed("Not allowed to participate in this question.")
+        votes_cast = participation.votes_cast
+        if settings.OPEN_CHOICE_POLLS_VOTE_BUFFER:
+            votes_cast += get_vote_buffer().pending(participation.pk)
+        if votes_cast >= self.object.votes_allowed:
+            raise ParticipationAllVotesUsed("All votes used up.")
 
         return context
 
     def form_valid(self, form):
-        clean_choice = form.cleaned_data.get('choice')
-
         # get data for vote
-        try:
-            qs = Participation.objects.filter(Q(voter__user__id=self.request.user.id) &
-                                              Q(question__id=self.object.id) &
-                                              Q(is_allowed=True))
-            participation = qs.get()
-
-        except Participation.DoesNotExist:
-            logger.info("User ({}) not allowed to vote. Displaying results only.".format(self.request.user))
+        participation = self.get_participation()
+        if not participation:
+            logger.info("User (%s) not allowed to vote. Displaying results only.", self.request.user)
             raise ParticipationNotAllowed("Not allowed to participate in this question.")
 
-        selected_choice = get_object_or_404(Choice, id=clean_choice)
+        if not self.object.voting_is_active():
+            raise QuestionVoteNotActive("Sorry - vote is not active.")
+
+        if self.object.is_ranked:
+            self.cast_ballot(participation, form.ranking)
+            metrics.VOTES.inc(buffered='false')
+            messages.success(self.request, 'Vote successful!')
+            return redirect('open_choice_polls:results', slug=self.object.slug, id=self.object.id)
+
+        # looked up (for this question) by the form already
+        selected_choice = form.selected_choice
 
         # only allow votes for approved choices
-        if selected_choice.review_status == Choice.APPROVED:
+        if selected_choice.review_status == Choice.APPROVED and settings.OPEN_CHOICE_POLLS_VOTE_BUFFER:
+            # the buffer checks the vote limit; the vote is counted by "manage.py flush_votes"
+            get_vote_buffer().append(participation, selected_choice, self.object.votes_per_session)
+            metrics.VOTES.inc(buffered='true')
+        elif selected_choice.review_status == Choice.APPROVED:
+            # one short write transaction; the vote limit is checked by the UPDATE itself
             with transaction.atomic():
-                selected_choice.votes += 1
-                selected_choice.save()
-                selected_choice.refresh_from_db()
+                updated = Participation.objects. \
+                    filter(pk=participation.pk, votes_cast__lt=self.object.votes_per_session). \
+                    update(votes_cast=F('votes_cast') + 1)
+                if not updated:
+                    raise ParticipationAllVotesUsed("All votes used up.")
 
-            with transaction.atomic():
-                participation.votes_cast += 1
-                participation.save()
-                participation.refresh_from_db()
+                Choice.objects.filter(pk=selected_choice.pk).update(votes=F('votes') + 1)
+                Question.objects.filter(pk=self.object.pk).add_to_counters(total_votes=1)
+                VoteBucket.objects.add(self.object.pk, {selected_choice.pk: 1})
+            metrics.VOTES.inc(buffered='false')
 
         messages.success(self.request, 'Vote successful!')
 
         return redirect('open_choice_polls:results', slug=self.object.slug, id=self.object.id)
 
+    def cast_ballot(self, participation, ranking):
+        """store a ranked ballot (never buffered) - `ranking` are the approved choices in order of preference"""
+        if any(choice.ballot_index is None for choice in ranking):
+            self.object.assign_ballot_indexes()
+            indexes = dict(Choice.objects.filter(pk__in=[choice.pk for choice in ranking]).
+                           values_list('pk', 'ballot_index'))
+            for choice in ranking:
+                choice.ballot_index = indexes[choice.pk]
+        ballot = tally.encode_ballot([choice.ballot_index for choice in ranking], self.object.ranked_choices)
+
+        with transaction.atomic():
+            # one ballot per participation
+            updated = Participation.objects. \
+                filter(pk=participation.pk, votes_cast__lt=self.object.votes_allowed). \
+                update(votes_cast=F('votes_cast') + 1)
+            if not updated:
+                raise ParticipationAllVotesUsed("All votes used up.")
+
+            Ballot.objects.create(question=self.object, participation=participation, ranking=ballot)
+            # the first preferences are the (plurality) results while voting
+            Choice.objects.filter(pk=ranking[0].pk).update(votes=F('votes') + 1)
+            Question.objects.filter(pk=self.object.pk).add_to_counters(total_votes=1)
+            VoteBucket.objects.add(self.object.pk, {ranking[0].pk: 1})
+
     def form_invalid(self, form):
         messages.error(self.request, 'Input validation failed. See below for details.')
         return super().form_invalid(form)
@@ -332,3 +690,23 @@ class VoterDetailView(generic.DetailView):
 
         context['participation_list'] = qs
         return context
+
+
+class MetricsView(generic.View):
+    """Prometheus metrics - for staff users and the networks in BASIC_AUTH_WHITELISTED_IP_NETWORKS"""
+
+    def get(self, request, *args, **kwargs):
+        if not (request.user.is_staff or self.is_whitelisted(request.META.get('REMOTE_ADDR'))):
+            raise PermissionDenied
+        return HttpResponse(metrics.exposition(), content_type=metrics.CONTENT_TYPE)
+
+    @staticmethod
+    def is_whitelisted(address):
+        try:
+            address = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        networks = getattr(django_settings, 'BASIC_AUTH_WHITELISTED_IP_NETWORKS', [])
+        if isinstance(networks, str):
+            networks = networks.split(',')
+        return any(address in ipaddress.ip_network(network.strip()) for network in networks if network.strip())
@@ -0,0 +1,260 @@
+"""Write-behind buffer for votes
+
+With ``OPEN_CHOICE_POLLS_VOTE_BUFFER`` set to a directory, the vote view does
+not update ``Choice.votes`` and ``Participation.votes_cast`` itself but
+appends the vote to the log (``votes-<id>.log``) in that directory and fsyncs
+it before the voter gets the answer. The ``flush_votes`` command periodically
+moves the log aside as a segment (``segment-<id>.log``) and applies the votes
+of a segment, summed up per choice and per participation, in one transaction.
+
+All appends of the worker processes on the host take an exclusive ``flock()``
+on ``votes.lock``. While holding it, a vote is checked against the votes cast
+in the database plus the votes of the same voter in the log and in the
+segments not applied yet, so ``votes_per_session`` is enforced exactly. These
+pending votes are kept in memory by every process, which only reads the lines
+appended since it last looked (see ``PendingVotes``).
+
+A flush only holds the lock to move the log aside and, once the votes of a
+segment are written, to commit its transaction and delete the segment - so
+appends never see a segment whose votes are in the database as well. The
+flushes themselves are serialized by ``flush.lock``.
+
+Applied segments are recorded (``FlushedSegment``) in the same transaction as
+the votes. A segment left behind by a crash is applied on the next flush -
+or, if its transaction was committed, only deleted - so every vote is counted
+exactly once.
+"""
+import collections
+import fcntl
+import logging
+import os
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+from django.db import transaction
+from django.db.models import F
+
+from .exceptions import ParticipationAllVotesUsed
+from .models import Choice, FlushedSegment, Participation, Question, ResultsSnapshot, VoteBucket
+
+logger = logging.getLogger(__name__)
+
+LOG_PREFIX = 'votes-'
+SEGMENT_PREFIX = 'segment-'
+SUFFIX = '.log'
+LOCK_NAME = 'votes.lock'
+FLUSH_LOCK_NAME = 'flush.lock'
+
+# pending votes per buffer directory, shared by the VoteBuffer instances of the process
+_pending_votes = {}
+
+
+def parse_vote(line):
+    """(participation id, choice id) of a line - raises ValueError for a line torn by a crash while writing"""
+    participation_id, choice_id = line.split()
+    return int(participation_id), uuid.UUID(choice_id.decode() if isinstance(choice_id, bytes) else choice_id)
+
+
+class BufferFile:
+    """the votes per participation read from a log or segment file so far"""
+
+    def __init__(self, name):
+        self.name = name
+        self.offset = 0
+        self.votes = collections.Counter()
+
+    @property
+    def is_segment(self):
+        return self.name.startswith(SEGMENT_PREFIX)
+
+    def read(self, directory):
+        """read the complete lines appended since the last call"""
+        with open(os.path.join(directory, self.name), 'rb') as f:
+            f.seek(self.offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                self.votes[parse_vote(line)[0]] += 1
+            except ValueError:
+                # torn line - skipped like in read_votes() (which logs it when the segment is applied)
+                pass
+        self.offset += end
+
+
+class PendingVotes:
+    """Votes per participation in the log and in the segments not applied yet
+
+    Only used while holding the lock. A file is known by the id in its name,
+    which stays the same when the log is moved aside as a segment, so its
+    lines are read once. Segments are never appended to, so a segment is not
+    read again once it was read as such.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def update(self, directory, names):
+        """read the new lines of the files `names` - and forget the files that were deleted"""
+        files = {}
+        for name in names:
+            file_id = name.split('-', 1)[1]
+            buffer_file = self.files.get(file_id)
+            if buffer_file is not None and buffer_file.is_segment:
+                files[file_id] = buffer_file
+                continue
+            if buffer_file is None:
+                buffer_file = BufferFile(name)
+            buffer_file.name = name
+            buffer_file.read(directory)
+            files[file_id] = buffer_file
+        self.files = files
+
+    def count(self, participation_id, exclude=()):
+        return sum(buffer_file.votes[participation_id] for buffer_file in self.files.values()
+                   if buffer_file.name not in exclude)
+
+    def segments(self, participation_id):
+        """names of the segments with votes of the participation"""
+        return [buffer_file.name for buffer_file in self.files.values()
+                if buffer_file.is_segment and buffer_file.votes[participation_id]]
+
+
+class VoteBuffer:
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        self.pending_votes = _pending_votes.setdefault(directory, PendingVotes())
+
+    @contextmanager
+    def locked(self, name=LOCK_NAME):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def read_votes(path):
+        """(participation id, choice id) of the votes in a log or segment file"""
+        try:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        yield parse_vote(line)
+                    except ValueError:
+                        # line torn by a crash while writing - the vote was not acknowledged
+                        logger.warning("Skipping invalid line in %s: %r", path, line)
+        except FileNotFoundError:
+            return
+
+    def files(self, prefix):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.startswith(prefix) and name.endswith(SUFFIX))
+
+    def segments(self):
+        return self.files(SEGMENT_PREFIX)
+
+    def log_path(self):
+        """path of the log - of a new one if there is none"""
+        logs = self.files(LOG_PREFIX)
+        name = logs[-1] if logs else '{}{:020d}-{}{}'.format(LOG_PREFIX, time.time_ns(), uuid.uuid4().hex, SUFFIX)
+        return os.path.join(self.directory, name)
+
+    def _pending(self, participation_id):
+        self.pending_votes.update(self.directory, self.segments() + self.files(LOG_PREFIX))
+        return self.pending_votes.count(participation_id)
+
+    def pending(self, participation_id):
+        """votes of a participation that are not flushed yet"""
+        with self.locked():
+            return self._pending(participation_id)
+
+    def append(self, participation, choice, votes_per_session):
+        """buffer a vote - raises ParticipationAllVotesUsed if the voter has no vote left"""
+        with ExitStack() as stack:
+            with self.locked():
+                pending = self._pending(participation.pk)
+                votes_cast = Participation.objects.filter(pk=participation.pk). \
+                    values_list('votes_cast', flat=True)[0]
+                if votes_cast + pending >= votes_per_session:
+                    # a segment left behind by a crash after its transaction is in votes_cast already
+                    flushed = FlushedSegment.objects.filter(name__in=self.pending_votes.segments(participation.pk)). \
+                        values_list('name', flat=True)
+                    if votes_cast + self.pending_votes.count(participation.pk, exclude=set(flushed)) \
+                            >= votes_per_session:
+                        raise ParticipationAllVotesUsed("All votes used up.")
+
+                f = stack.enter_context(open(self.log_path(), 'ab+'))
+                # end a line torn by a crash while writing
+                if f.seek(0, os.SEEK_END):
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                f.write('{} {}\n'.format(participation.pk, choice.pk.hex).encode())
+                f.flush()
+            if self.fsync:
+                # outside the lock: appends are not held up by the disk, concurrent fsyncs share one write
+                os.fsync(f.fileno())
+
+    def flush(self):
+        """apply all buffered votes to the database - returns the number of votes applied"""
+        with self.locked():
+            for name in self.files(LOG_PREFIX):
+                os.replace(os.path.join(self.directory, name),
+                           os.path.join(self.directory, SEGMENT_PREFIX + name[len(LOG_PREFIX):]))
+
+        applied = 0
+        with self.locked(FLUSH_LOCK_NAME):
+            for segment in self.segments():
+                applied += self.apply_segment(segment, os.path.join(self.directory, segment))
+        return applied
+
+    def apply_segment(self, name, path):
+        """apply the votes of a segment and delete it - returns the number of votes applied"""
+        participations = collections.Counter()
+        choices = collections.Counter()
+        for participation_id, choice_id in self.read_votes(path):
+            participations[participation_id] += 1
+            choices[choice_id] += 1
+
+        with ExitStack() as stack:
+            with transaction.atomic():
+                if FlushedSegment.objects.filter(name=name).exists():
+                    logger.info("Vote buffer segment %s was flushed already", name)
+                    choices.clear()
+                else:
+                    self.update_counts(name, participations, choices)
+                # appends count the votes of the segment until it is deleted
+                stack.enter_context(self.locked())
+            os.remove(path)
+
+        if choices:
+            logger.debug("Flushed %s vote(s) of %s choice(s) from %s", sum(choices.values()), len(choices), name)
+        return sum(choices.values())
+
+    @staticmethod
+    def update_counts(name, participations, choices):
+        for participation_id, votes in participations.items():
+            Participation.objects.filter(pk=participation_id).update(votes_cast=F('votes_cast') + votes)
+        questions = collections.Counter()
+        buckets = collections.defaultdict(dict)
+        for choice_id, question_id in Choice.objects.filter(pk__in=list(choices)).values_list('pk', 'question'):
+            Choice.objects.filter(pk=choice_id).update(votes=F('votes') + choices[choice_id])
+            questions[question_id] += choices[choice_id]
+            buckets[question_id][choice_id] = choices[choice_id]
+        for question_id, votes in questions.items():
+            Question.objects.filter(pk=question_id).add_to_counters(total_votes=votes)
+            # counted in the minute of the flush
+            VoteBucket.objects.add(question_id, buckets[question_id])
+        FlushedSegment.objects.create(name=name, votes=sum(choices.values()))
+
+        # votes flushed after the results were finalized
+        ResultsSnapshot.objects.filter(question__in=list(questions)).delete()
@@ -0,0 +1,51 @@
+"""Keyed permutation of the voter id range
+
+Voter usernames must not reveal how many voters exist or in which order they
+were created, but the ids must never repeat. ``VoterIdPool`` hands out
+consecutive indices from a counter; ``Permutation`` maps index ``i`` of
+``range(size)`` to a unique, random looking position in the same range.
+
+It is a Feistel network over the smallest ``4 ** k >= size`` with cycle
+walking: values that fall outside ``range(size)`` are permuted again until
+they fall inside (less than four rounds on average).
+"""
+import hashlib
+
+ROUNDS = 4
+
+
+class Permutation:
+
+    def __init__(self, size, key):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.key = key.encode() if isinstance(key, str) else key
+
+        half_bits = 1
+        while 4 ** half_bits < size:
+            half_bits += 1
+        self.half_bits = half_bits
+        self.half_mask = (1 << half_bits) - 1
+
+    def _round(self, round_no, value):
+        digest = hashlib.blake2b(value.to_bytes(8, 'big'), digest_size=8, key=self.key,
+                                 person=round_no.to_bytes(1, 'big')).digest()
+        return int.from_bytes(digest, 'big') & self.half_mask
+
+    def _encrypt(self, value):
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_no in range(ROUNDS):
+            left, right = right, left ^ self._round(round_no, right)
+        return (left << self.half_bits) | right
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError("index out of range")
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def __len__(self):
+        return self.size